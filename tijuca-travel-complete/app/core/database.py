@@ -1,9 +1,15 @@
 """
 Configuración de la base de datos con SQLAlchemy async
 """
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from fastapi import Request
+from starlette.types import ASGIApp, Receive, Scope, Send
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import text
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy import event, text
 from config import settings
 
 # Motor de base de datos
@@ -26,22 +32,176 @@ async_session_maker = sessionmaker(
 Base = declarative_base()
 
 
-async def get_db() -> AsyncSession:
+# =====================================================================
+# SESIÓN POR REQUEST (LAZY)
+# =====================================================================
+
+class RequestSession:
     """
-    Dependency para obtener sesión de base de datos
+    Sesión única de la request, compartida por middlewares y Depends(get_db)
+
+    La AsyncSession se crea en el primer get() y la conexión sale del pool
+    recién con la primera query: /health y las requests sin autenticar no
+    tocan el pool.
     """
-    async with async_session_maker() as session:
+
+    __slots__ = ("_factory", "_session")
+
+    def __init__(self, factory: Callable[[], AsyncSession]):
+        self._factory = factory
+        self._session: Optional[AsyncSession] = None
+
+    def get(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._factory()
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class RequestSessionMiddleware:
+    """
+    Deja un RequestSession en request.state.db y lo cierra al terminar
+
+    Middleware ASGI puro: debe ser el más externo, así la sesión que usa
+    TenantIsolationMiddleware es la misma que recibe el endpoint.
+    """
+
+    def __init__(self, app: ASGIApp, session_factory: Callable[[], AsyncSession] = async_session_maker):
+        self.app = app
+        self.session_factory = session_factory
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_session = RequestSession(self.session_factory)
+        scope.setdefault("state", {})["db"] = request_session
         try:
-            yield session
+            await self.app(scope, receive, send)
         finally:
-            await session.close()
+            await request_session.close()
+
+
+async def get_db(request: Request) -> AsyncIterator[AsyncSession]:
+    """
+    Dependency para obtener sesión de base de datos
+
+    Devuelve la sesión de la request (la cierra RequestSessionMiddleware).
+    Sin el middleware, abre una propia y la cierra al terminar.
+    """
+    request_session: Optional[RequestSession] = request.scope.get("state", {}).get("db")
+    if request_session is not None:
+        yield request_session.get()
+        return
+
+    async with async_session_maker() as session:
+        yield session
+
+
+# =====================================================================
+# CONTEXTO DE TENANT (RLS)
+# =====================================================================
+
+# Tenant de la sesión y tenant ya aplicado en la transacción en curso
+TENANT_INFO_KEY = "tenant_id"
+_TENANT_APPLIED_KEY = "tenant_id_applied"
+
+# Con bind parameter: mismo texto para todos los tenants (statement
+# preparado y cacheado por conexión). is_local=true: dura lo que la
+# transacción, como SET LOCAL
+_SET_TENANT_SQL = text("SELECT set_config('app.current_tenant_id', :tenant_id, true)")
 
 
 async def set_tenant_context(session: AsyncSession, tenant_id: str):
     """
     Setea el tenant_id en PostgreSQL para Row Level Security
     ⚠️ CRÍTICO: Debe ejecutarse antes de CUALQUIER query
+
+    El tenant queda en session.info:
+    - Sin transacción abierta no hay round trip: se aplica al empezar la
+      transacción, justo antes de su primera query (_apply_tenant_context)
+    - Si ya está aplicado en la transacción en curso (ej: middleware +
+      endpoint), no se repite
+    - Después de un commit, la transacción siguiente lo vuelve a aplicar
     """
-    await session.execute(
-        text(f"SET LOCAL app.current_tenant_id = '{tenant_id}'")
-    )
+    session.info[TENANT_INFO_KEY] = tenant_id
+    if not session.in_transaction():
+        return
+
+    await session.connection()  # Si la conexión recién arranca, after_begin ya lo aplicó
+    if session.info.get(_TENANT_APPLIED_KEY) != tenant_id:
+        await session.execute(_SET_TENANT_SQL, {"tenant_id": tenant_id})
+        session.info[_TENANT_APPLIED_KEY] = tenant_id
+
+
+@event.listens_for(Session, "after_begin")
+def _apply_tenant_context(session, transaction, connection):
+    """Cada transacción arranca con el tenant de la sesión (si tiene)"""
+    tenant_id = session.info.get(TENANT_INFO_KEY)
+    if tenant_id is not None:
+        connection.execute(_SET_TENANT_SQL, {"tenant_id": tenant_id})
+        session.info[_TENANT_APPLIED_KEY] = tenant_id
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_applied_tenant(session, transaction):
+    """set_config(..., true) se pierde al terminar la transacción (o un savepoint con rollback)"""
+    session.info.pop(_TENANT_APPLIED_KEY, None)
+
+
+# =====================================================================
+# SESIONES CORTAS (HunterBot y otros flujos con esperas largas)
+# =====================================================================
+
+class PoolWaitStats:
+    """Tiempo esperando una conexión libre del pool (checkout)"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record(self, wait_seconds: float) -> None:
+        self.checkouts += 1
+        self.total_wait_seconds += wait_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas para /health (incluye el estado actual del pool)"""
+        pool = engine.pool
+        return {
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts_measured": self.checkouts,
+            "avg_wait_ms": round(
+                self.total_wait_seconds / self.checkouts * 1000, 2
+            ) if self.checkouts else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+        }
+
+
+pool_wait_stats = PoolWaitStats()
+
+
+@asynccontextmanager
+async def tenant_session(tenant_id: str) -> AsyncIterator[AsyncSession]:
+    """
+    Sesión con RLS seteado que devuelve la conexión al pool al salir
+
+    Para flujos que alternan DB con esperas largas (ej: HunterBot llamando
+    a Claude): abrir una por cada fase de DB en lugar de retener la
+    conexión durante toda la request.
+    """
+    async with async_session_maker() as session:
+        start = time.perf_counter()
+        await session.connection()  # Checkout explícito: se mide la espera
+        pool_wait_stats.record(time.perf_counter() - start)
+
+        await set_tenant_context(session, tenant_id)
+        yield session
@@ -0,0 +1,96 @@
+"""
+Pool acotado de workers para trabajo CPU-bound (bcrypt)
+
+Evita que verificaciones costosas corran en el event loop de asyncio:
+cada job se ejecuta en un ThreadPoolExecutor de tamaño fijo (bcrypt libera
+el GIL) y la cantidad de jobs pendientes está limitada. Si la cola está
+llena se rechaza de inmediato (backpressure) en vez de encolar sin límite.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from config import settings
+
+
+class WorkerPoolSaturated(Exception):
+    """La cola del pool está llena: el caller debe responder 503"""
+
+
+class BoundedWorkerPool:
+    """ThreadPoolExecutor con límite de jobs pendientes y métricas"""
+
+    def __init__(self, name: str, max_workers: int, max_pending: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, max_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=name
+        )
+
+        # Métricas (solo se modifican desde el event loop)
+        self._pending = 0
+        self.max_pending_seen = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Ejecuta func(*args) en el pool
+        ⚠️ Lanza WorkerPoolSaturated si ya hay max_pending jobs en curso
+        """
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise WorkerPoolSaturated(f"{self.name}: {self._pending} jobs pendientes")
+
+        loop = asyncio.get_running_loop()
+        submitted_at = time.perf_counter()
+
+        def job():
+            wait_seconds = time.perf_counter() - submitted_at
+            return wait_seconds, func(*args)
+
+        self._pending += 1
+        self.max_pending_seen = max(self.max_pending_seen, self._pending)
+
+        # El contador se libera cuando el thread termina (no cuando el caller
+        # se cancela), así la cola refleja el trabajo real en curso
+        future = self._executor.submit(job)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+
+        wait_seconds, result = await asyncio.wrap_future(future)
+        self.total_wait_seconds += wait_seconds
+        return result
+
+    def _release(self) -> None:
+        self._pending -= 1
+        self.completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas para /health"""
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "running": min(self._pending, self.max_workers),
+            "queued": max(self._pending - self.max_workers, 0),
+            "max_pending_seen": self.max_pending_seen,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_queue_wait_ms": round(
+                self.total_wait_seconds / self.completed * 1000, 2
+            ) if self.completed else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Pool global para verificación de API keys / passwords (bcrypt)
+bcrypt_pool = BoundedWorkerPool(
+    name="bcrypt",
+    max_workers=settings.BCRYPT_POOL_WORKERS,
+    max_pending=settings.BCRYPT_POOL_MAX_PENDING
+)
@@ -11,7 +11,9 @@ Versión: 1.0
 """
 
 import re
+import hmac
 import time
+import asyncio
 import hashlib
 import secrets
 from typing import Optional, Dict, Any
@@ -19,15 +21,20 @@ from datetime import datetime, timedelta
 from functools import wraps
 
 import jwt
+import bcrypt
 from fastapi import FastAPI, Request, HTTPException, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import QueryParams
+from starlette.types import ASGIApp, Receive, Scope, Send
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 import redis.asyncio as redis
 from pydantic import BaseModel, validator, UUID4
 
+from config import settings
+
 
 # =====================================================================
 # CONFIGURACIÓN DE SEGURIDAD
@@ -42,11 +49,39 @@ class SecurityConfig:
     JWT_EXPIRATION_MINUTES = 60
     JWT_REFRESH_EXPIRATION_DAYS = 7
 
+    # API Keys (lookup indexado + verificación bcrypt). El secret del HMAC y
+    # el fallback de migración se configuran en config.py (variables de entorno)
+    API_KEY_PREFIX = "tjc_"
+
     # Rate Limiting (Token Bucket)
     RATE_LIMIT_REQUESTS = 100  # requests
     RATE_LIMIT_WINDOW = 60  # seconds
     RATE_LIMIT_BURST = 20  # burst allowance
 
+    # Rate Limiting local (leases de tokens por worker)
+    RATE_LIMIT_LEASE_SIZE = 10  # tokens máximos por lease
+    RATE_LIMIT_LEASE_TTL = 1.0  # seconds
+    RATE_LIMIT_LEASE_FRACTION = 0.1  # máximo 10% del bucket por lease
+
+    # Rate Limiting por plan SaaS (ver CHECK de agencias.plan)
+    # requests/window = refill, burst = extra sobre requests,
+    # max_concurrent = requests simultáneas por tenant y worker
+    PLAN_RATE_LIMITS = {
+        "free": {"requests": 60, "window": 60, "burst": 10, "max_concurrent": 2},
+        "basic": {"requests": 100, "window": 60, "burst": 20, "max_concurrent": 5},
+        "premium": {"requests": 300, "window": 60, "burst": 60, "max_concurrent": 10},
+        "enterprise": {"requests": 1000, "window": 60, "burst": 200, "max_concurrent": 25},
+    }
+    # Requests sin tenant (por IP) o con plan desconocido
+    RATE_LIMIT_DEFAULT_MAX_CONCURRENT = 5
+
+    # Costo en tokens por tipo de endpoint
+    RATE_LIMIT_ENDPOINT_COSTS = {
+        "read": 1,  # GET /api/ventas
+        "write": 2,  # POST /api/ventas
+        "hunterbot": 10,  # Llamada a Claude + DB
+    }
+
     # SQL Injection Patterns (Blacklist)
     SQL_INJECTION_PATTERNS = [
         r"(\b(SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE)\b)",
@@ -96,6 +131,43 @@ class TenantContext(BaseModel):
         frozen = True  # Inmutable después de creación
 
 
+class PlanRateLimit(BaseModel):
+    """Límites de rate limiting de un plan SaaS"""
+    requests: int
+    window: int
+    burst: int
+    max_concurrent: int
+
+    class Config:
+        frozen = True
+
+    @property
+    def capacity(self) -> int:
+        return self.requests + self.burst
+
+    @property
+    def refill_rate(self) -> float:
+        """Tokens por segundo"""
+        return self.requests / self.window
+
+    @classmethod
+    def for_plan(cls, plan: Optional[str]) -> "PlanRateLimit":
+        """Límites del plan (o los globales si el plan es desconocido)"""
+        return _PLAN_RATE_LIMITS.get(plan, _DEFAULT_RATE_LIMIT)
+
+
+_PLAN_RATE_LIMITS = {
+    plan: PlanRateLimit(**limits)
+    for plan, limits in SecurityConfig.PLAN_RATE_LIMITS.items()
+}
+_DEFAULT_RATE_LIMIT = PlanRateLimit(
+    requests=SecurityConfig.RATE_LIMIT_REQUESTS,
+    window=SecurityConfig.RATE_LIMIT_WINDOW,
+    burst=SecurityConfig.RATE_LIMIT_BURST,
+    max_concurrent=SecurityConfig.RATE_LIMIT_DEFAULT_MAX_CONCURRENT
+)
+
+
 class SecureRequest(BaseModel):
     """Wrapper para requests sanitizados"""
     query: Optional[str] = None
@@ -119,6 +191,27 @@ class SecureRequest(BaseModel):
 class SecurityValidator:
     """Validadores centralizados para inputs maliciosos"""
 
+    # Scanner compilado UNA vez: una sola pasada lineal sobre el input.
+    # Equivale a buscar cada patrón de SQL_INJECTION_PATTERNS por separado:
+    # - UNION...SELECT y ;...DROP|DELETE ya están cubiertos por el keyword
+    #   solo; '...-- por el comentario "--"
+    # - OR...= y ;...TRUNCATE se evalúan desde la PRIMERA aparición de OR/;
+    #   de cada línea (grupo atómico emulado con lookahead + backreference):
+    #   si alguna aparición posterior matchea, la primera también. Evita el
+    #   backtracking O(n²) con inputs como "OR OR OR ..." o ";;;;..."
+    #   (ver benchmarks/bench_sanitize_sql.py)
+    _SQL_INJECTION_SCANNER = re.compile(
+        r"\b(?:SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE)\b"
+        r"|--|#|/\*|\*/"
+        r"|\bxp_cmdshell\b"
+        r"|^(?=(?P<first_or>[^\n]*?\bOR\b))(?P=first_or)[^\n]*="
+        r"|^(?=(?P<first_semicolon>[^\n;]*;))(?P=first_semicolon)[^\n]*\bTRUNCATE\b",
+        re.IGNORECASE | re.MULTILINE
+    )
+
+    # Caracteres peligrosos de un solo char: se eliminan con str.translate
+    _DANGEROUS_CHARS = str.maketrans("", "", "'\"\\;")
+
     @staticmethod
     def sanitize_sql(input_string: str) -> str:
         """
@@ -128,18 +221,21 @@ class SecurityValidator:
         if not input_string:
             return input_string
 
-        # Detectar patrones maliciosos
-        for pattern in SecurityConfig.SQL_INJECTION_PATTERNS:
-            if re.search(pattern, input_string, re.IGNORECASE):
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Input bloqueado: patrón SQL sospechoso detectado"
-                )
+        # Detectar patrones maliciosos (una sola pasada)
+        if SecurityValidator._SQL_INJECTION_SCANNER.search(input_string):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Input bloqueado: patrón SQL sospechoso detectado"
+            )
 
         # Escapar caracteres peligrosos (doble capa de defensa)
-        dangerous_chars = ["'", '"', "\\", ";", "--", "/*", "*/"]
-        for char in dangerous_chars:
-            input_string = input_string.replace(char, "")
+        input_string = input_string.translate(SecurityValidator._DANGEROUS_CHARS)
+
+        # "--", "/*" y "*/" ya fueron bloqueados arriba; solo pueden aparecer
+        # al quitar caracteres (ej: "-'-"), caso raro que se limpia igual
+        if "--" in input_string or "/*" in input_string or "*/" in input_string:
+            for sequence in ("--", "/*", "*/"):
+                input_string = input_string.replace(sequence, "")
 
         return input_string.strip()
 
@@ -190,108 +286,312 @@ class SecurityValidator:
 # MIDDLEWARE DE RATE LIMITING (Token Bucket Algorithm)
 # =====================================================================
 
+class _TokenLease:
+    """Tokens ya descontados en Redis y reservados para este worker"""
+    __slots__ = ("tokens", "expires_at")
+
+    def __init__(self, tokens: int, expires_at: float):
+        self.tokens = tokens
+        self.expires_at = expires_at
+
+
 class RateLimiter:
-    """Rate Limiter usando Redis y Token Bucket Algorithm"""
+    """
+    Rate Limiter usando Redis y Token Bucket Algorithm (dos niveles)
+
+    Nivel 1 (Redis): el bucket se lee, recalcula y descuenta con un script
+    Lua (EVALSHA): una sola ida y vuelta y sin race conditions entre
+    requests concurrentes del mismo tenant.
+
+    Nivel 2 (local): cada worker pide los tokens en lotes (lease) y los
+    consume en memoria. Solo vuelve a Redis cuando el lease se agota o
+    vence. Tolerancia entre workers: cada uno retiene como máximo
+    RATE_LIMIT_LEASE_SIZE tokens durante RATE_LIMIT_LEASE_TTL segundos, y
+    nunca más de RATE_LIMIT_LEASE_FRACTION del bucket disponible.
+    """
+
+    # KEYS[1] = bucket
+    # ARGV = capacidad, tokens/segundo, tokens iniciales, costo mínimo,
+    #        tokens pedidos (lease), fracción máxima del bucket, ttl
+    # Retorna: {tokens otorgados (0 = rechazado), tokens restantes}
+    TOKEN_BUCKET_SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local refill_rate = tonumber(ARGV[2])
+        local initial_tokens = tonumber(ARGV[3])
+        local cost = tonumber(ARGV[4])
+        local requested = tonumber(ARGV[5])
+        local max_fraction = tonumber(ARGV[6])
+        local ttl = tonumber(ARGV[7])
+
+        -- Reloj de Redis: todos los workers comparten la misma referencia
+        local clock = redis.call('TIME')
+        local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(bucket[1])
+        local last_update = tonumber(bucket[2])
+        if tokens == nil or last_update == nil then
+            tokens = initial_tokens
+            last_update = now
+        end
+
+        -- Tokens regenerados desde la última actualización
+        local elapsed = math.max(now - last_update, 0)
+        tokens = math.min(tokens + elapsed * refill_rate, capacity)
+
+        -- Lease: nunca más que lo pedido ni que una fracción del bucket
+        -- (cerca del límite el lease se reduce al costo del request)
+        local granted = 0
+        if tokens >= cost then
+            granted = math.min(requested, math.floor(tokens))
+            granted = math.min(granted, math.max(cost, math.floor(tokens * max_fraction)))
+            tokens = tokens - granted
+        end
+
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+        redis.call('EXPIRE', KEYS[1], ttl)
+
+        return {granted, tostring(tokens)}
+    """
+
+    # Cada cuántos leases nuevos se purgan las entradas vencidas
+    _PRUNE_EVERY = 1024
 
     def __init__(self, redis_client: redis.Redis):
         self.redis = redis_client
-
-    async def check_rate_limit(self, identifier: str) -> bool:
+        # register_script calcula el SHA localmente; la primera llamada hace
+        # SCRIPT LOAD automáticamente si Redis no lo tiene cacheado
+        self._token_bucket = redis_client.register_script(self.TOKEN_BUCKET_SCRIPT)
+
+        self._leases: Dict[str, _TokenLease] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._leases_since_prune = 0
+        self._in_flight: Dict[str, int] = {}
+
+        # Métricas
+        self.local_hits = 0
+        self.redis_calls = 0
+        self.rejected = 0
+        self.rejected_concurrency = 0
+
+    async def check_rate_limit(
+        self,
+        identifier: str,
+        limits: Optional[PlanRateLimit] = None,
+        cost: int = 1
+    ) -> bool:
         """
         Verifica si el cliente excedió el rate limit
         identifier: tenant_id o IP address
+        limits: límites del plan (default: globales de SecurityConfig)
+        cost: tokens que consume el endpoint
         """
-        key = f"rate_limit:{identifier}"
-        now = time.time()
+        limits = limits or _DEFAULT_RATE_LIMIT
 
-        # Obtener estado actual del bucket
-        bucket_data = await self.redis.get(key)
+        if self._consume_local(identifier, cost):
+            return True
 
-        if bucket_data:
-            tokens, last_update = map(float, bucket_data.decode().split(":"))
-        else:
-            tokens = SecurityConfig.RATE_LIMIT_REQUESTS
-            last_update = now
+        # Single-flight: un solo pedido a Redis por identifier y worker
+        lock = self._locks.setdefault(identifier, asyncio.Lock())
+        async with lock:
+            # Otro request pudo haber renovado el lease mientras esperábamos
+            if self._consume_local(identifier, cost):
+                return True
 
-        # Calcular tokens regenerados desde última actualización
-        time_passed = now - last_update
-        tokens_to_add = time_passed * (SecurityConfig.RATE_LIMIT_REQUESTS / SecurityConfig.RATE_LIMIT_WINDOW)
-        tokens = min(tokens + tokens_to_add, SecurityConfig.RATE_LIMIT_REQUESTS + SecurityConfig.RATE_LIMIT_BURST)
-
-        # Verificar si hay tokens disponibles
-        if tokens >= 1:
-            tokens -= 1
-            # Guardar estado actualizado
-            await self.redis.set(
-                key,
-                f"{tokens}:{now}",
-                ex=SecurityConfig.RATE_LIMIT_WINDOW * 2
-            )
+            granted = await self._lease_from_redis(identifier, limits, cost)
+            if granted < cost:
+                self.rejected += 1
+                return False
+
+            # Sumar al lease nuevo lo que sobraba del anterior (ya descontado)
+            leftover = self._leases.get(identifier)
+            leftover_tokens = leftover.tokens if leftover else 0
+            self._store_lease(identifier, granted - cost + leftover_tokens)
             return True
+
+    def acquire_concurrency(self, identifier: str, limits: Optional[PlanRateLimit] = None) -> bool:
+        """
+        Reserva un slot de request simultánea (por worker)
+        ⚠️ Llamar release_concurrency() al terminar el request
+        """
+        limits = limits or _DEFAULT_RATE_LIMIT
+        in_flight = self._in_flight.get(identifier, 0)
+        if in_flight >= limits.max_concurrent:
+            self.rejected_concurrency += 1
+            return False
+        self._in_flight[identifier] = in_flight + 1
+        return True
+
+    def release_concurrency(self, identifier: str) -> None:
+        in_flight = self._in_flight.get(identifier, 0) - 1
+        if in_flight > 0:
+            self._in_flight[identifier] = in_flight
         else:
+            self._in_flight.pop(identifier, None)
+
+    def _consume_local(self, identifier: str, cost: int) -> bool:
+        lease = self._leases.get(identifier)
+        if lease is None:
+            return False
+        if lease.expires_at <= time.monotonic():
+            # Lease vencido: los tokens sobrantes se descartan (conservador)
+            del self._leases[identifier]
             return False
+        if lease.tokens < cost:
+            return False
+        lease.tokens -= cost
+        self.local_hits += 1
+        return True
+
+    async def _lease_from_redis(self, identifier: str, limits: PlanRateLimit, cost: int) -> int:
+        self.redis_calls += 1
+        granted, _remaining = await self._token_bucket(
+            keys=[f"rate_limit:bucket:{identifier}"],
+            args=[
+                limits.capacity,
+                limits.refill_rate,
+                limits.requests,
+                cost,
+                max(SecurityConfig.RATE_LIMIT_LEASE_SIZE, cost),
+                SecurityConfig.RATE_LIMIT_LEASE_FRACTION,
+                limits.window * 2,
+            ]
+        )
+        return int(granted)
+
+    def _store_lease(self, identifier: str, tokens: int) -> None:
+        if tokens <= 0:
+            self._leases.pop(identifier, None)
+            return
+
+        self._leases[identifier] = _TokenLease(
+            tokens,
+            time.monotonic() + SecurityConfig.RATE_LIMIT_LEASE_TTL
+        )
+
+        self._leases_since_prune += 1
+        if self._leases_since_prune >= self._PRUNE_EVERY:
+            self._prune()
+
+    def _prune(self) -> None:
+        """Elimina leases vencidos y locks ociosos (memoria acotada)"""
+        now = time.monotonic()
+        for identifier in [k for k, v in self._leases.items() if v.expires_at <= now]:
+            del self._leases[identifier]
+        for identifier in [k for k, v in self._locks.items()
+                           if not v.locked() and k not in self._leases]:
+            del self._locks[identifier]
+        self._leases_since_prune = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas para /health"""
+        checks = self.local_hits + self.redis_calls
+        return {
+            "local_hits": self.local_hits,
+            "redis_calls": self.redis_calls,
+            "rejected": self.rejected,
+            "rejected_concurrency": self.rejected_concurrency,
+            "active_leases": len(self._leases),
+            "in_flight": sum(self._in_flight.values()),
+            "local_hit_ratio": round(self.local_hits / checks, 3) if checks else 0.0,
+        }
+
+
+# Limiters compartidos por cliente Redis: todos los endpoints del worker
+# usan los mismos leases
+_rate_limiters: Dict[int, RateLimiter] = {}
+
+
+def get_rate_limiter(redis_client: redis.Redis) -> RateLimiter:
+    """Retorna el RateLimiter del worker para este cliente Redis"""
+    limiter = _rate_limiters.get(id(redis_client))
+    if limiter is None:
+        limiter = _rate_limiters[id(redis_client)] = RateLimiter(redis_client)
+    return limiter
 
 
 # =====================================================================
 # MIDDLEWARE DE TENANT ISOLATION
 # =====================================================================
 
-class TenantIsolationMiddleware(BaseHTTPMiddleware):
+class TenantIsolationMiddleware:
     """
     Middleware que setea el tenant_id en PostgreSQL para RLS
     ⚠️ CRÍTICO: Este middleware DEBE ejecutarse antes de cualquier query
+
+    Middleware ASGI puro: no envuelve la respuesta en tasks/streams extra
+    como BaseHTTPMiddleware.
     """
 
-    async def dispatch(self, request: Request, call_next):
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # request.state es una vista sobre scope["state"]
+        state = scope.setdefault("state", {})
+
         # Extraer tenant_id del JWT (explicado en JWTHandler)
-        tenant_context: Optional[TenantContext] = getattr(request.state, "tenant", None)
+        tenant_context: Optional[TenantContext] = state.get("tenant")
 
         if tenant_context:
-            # Obtener la sesión de base de datos
-            db: AsyncSession = request.state.db
+            # Sesión de la request (RequestSessionMiddleware): se crea acá
+            # solo si hay tenant, la misma que recibe Depends(get_db)
+            db: AsyncSession = state["db"].get()
 
-            # ⚠️ CRÍTICO: Setear el tenant_id para RLS
-            await db.execute(
-                text(f"SET LOCAL app.current_tenant_id = '{tenant_context.tenant_id}'")
-            )
+            # ⚠️ CRÍTICO: Setear el tenant_id para RLS (set_config con bind
+            # parameter; se aplica con la primera query y el endpoint no lo
+            # repite)
+            from app.core.database import set_tenant_context
+
+            await set_tenant_context(db, str(tenant_context.tenant_id))
 
             # También setear a nivel de aplicación (doble validación)
-            request.state.validated_tenant_id = tenant_context.tenant_id
+            state["validated_tenant_id"] = tenant_context.tenant_id
 
-        response = await call_next(request)
-        return response
+        await self.app(scope, receive, send)
 
 
 # =====================================================================
 # MIDDLEWARE DE SANITIZACIÓN
 # =====================================================================
 
-class InputSanitizationMiddleware(BaseHTTPMiddleware):
-    """Sanitiza todos los inputs antes de procesarlos"""
+class InputSanitizationMiddleware:
+    """
+    Sanitiza todos los inputs antes de procesarlos
 
-    async def dispatch(self, request: Request, call_next):
-        # Sanitizar query parameters
-        if request.query_params:
-            sanitized_params = {}
-            for key, value in request.query_params.items():
+    Middleware ASGI puro. El body NO se lee acá: `receive` pasa intacto al
+    endpoint, así FastAPI lo bufferea y parsea una sola vez y Pydantic lo
+    valida. Solo se inspeccionan los query parameters (ya en el scope).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Sanitizar query parameters (todos los valores, incluso repetidos)
+        query_string = scope.get("query_string", b"")
+        if query_string:
+            for key, value in QueryParams(query_string).multi_items():
                 try:
-                    sanitized_params[key] = SecurityValidator.sanitize_sql(value)
+                    SecurityValidator.sanitize_sql(value)
                 except HTTPException:
-                    return JSONResponse(
+                    response = JSONResponse(
                         status_code=status.HTTP_400_BAD_REQUEST,
                         content={"detail": f"Query parameter '{key}' contiene caracteres prohibidos"}
                     )
+                    await response(scope, receive, send)
+                    return
 
-        # Sanitizar body (solo para JSON)
-        if request.method in ["POST", "PUT", "PATCH"]:
-            try:
-                body = await request.json()
-                # La validación se hará en los endpoints con Pydantic
-            except Exception:
-                pass
-
-        response = await call_next(request)
-        return response
+        # Body: la validación se hace en los endpoints con Pydantic
+        await self.app(scope, receive, send)
 
 
 # =====================================================================
@@ -342,6 +642,61 @@ class JWTHandler:
             )
 
 
+# =====================================================================
+# API KEY HANDLER (Login de agencias)
+# =====================================================================
+
+class APIKeyHandler:
+    """
+    Manejo de API keys con lookup indexado
+
+    Cada key tiene dos representaciones en `agencias`:
+    - api_key_lookup: HMAC-SHA256 determinístico (columna indexada, UNIQUE)
+    - api_key_hash: bcrypt (verificación lenta, una sola vez por login)
+    """
+
+    @staticmethod
+    def generate_api_key() -> tuple[str, str, str]:
+        """
+        Genera una API key nueva
+        Retorna: (api_key_plaintext, api_key_lookup, api_key_hash)
+        ⚠️ El plaintext se muestra UNA sola vez a la agencia
+        """
+        api_key = SecurityConfig.API_KEY_PREFIX + secrets.token_urlsafe(32)
+        api_key_hash = bcrypt.hashpw(api_key.encode(), bcrypt.gensalt()).decode()
+        return api_key, APIKeyHandler.lookup_digest(api_key), api_key_hash
+
+    @staticmethod
+    def lookup_digest(api_key: str) -> str:
+        """
+        Digest keyed para buscar la agencia por índice
+        Sin el secret no se puede recalcular (no sirve para fuerza bruta offline)
+        """
+        return hmac.new(
+            settings.API_KEY_LOOKUP_SECRET.encode(),
+            api_key.encode(),
+            hashlib.sha256
+        ).hexdigest()
+
+    @staticmethod
+    def is_legacy_key(api_key: str) -> bool:
+        """
+        Keys sin el prefijo actual: pueden ser previas a api_key_lookup
+        Las keys con prefijo siempre se emiten con lookup: si el índice no
+        las encuentra, son inválidas (no hay nada que migrar)
+        """
+        return not api_key.startswith(SecurityConfig.API_KEY_PREFIX)
+
+    @staticmethod
+    def verify_api_key(api_key: str, api_key_hash: str) -> bool:
+        """Verificación bcrypt (costosa: llamar como máximo una vez por login)"""
+        try:
+            return bcrypt.checkpw(api_key.encode(), api_key_hash.encode())
+        except ValueError:
+            # Hash corrupto o con formato inválido
+            return False
+
+
 # =====================================================================
 # DEPENDENCIAS DE FASTAPI
 # =====================================================================
@@ -377,19 +732,26 @@ async def verify_tenant_ownership(
 # DECORADOR PARA RATE LIMITING
 # =====================================================================
 
-def rate_limit(redis_client: redis.Redis):
-    """Decorador para aplicar rate limiting a endpoints"""
+def rate_limit(redis_client: redis.Redis, cost: int = 1):
+    """
+    Decorador para aplicar rate limiting a endpoints
+    cost: tokens que consume cada llamada (ver RATE_LIMIT_ENDPOINT_COSTS)
+    """
+    # Un limiter por cliente Redis (script y leases compartidos)
+    limiter = get_rate_limiter(redis_client)
+
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
             request: Request = kwargs.get("request") or args[0]
-            tenant: TenantContext = getattr(request.state, "tenant", None)
+            # El tenant llega resuelto por Depends(get_current_tenant)
+            tenant: TenantContext = kwargs.get("tenant") or getattr(request.state, "tenant", None)
 
             # Usar tenant_id como identificador (o IP si no está autenticado)
             identifier = str(tenant.tenant_id) if tenant else request.client.host
+            limits = PlanRateLimit.for_plan(tenant.plan if tenant else None)
 
-            limiter = RateLimiter(redis_client)
-            allowed = await limiter.check_rate_limit(identifier)
+            allowed = await limiter.check_rate_limit(identifier, limits, cost)
 
             if not allowed:
                 raise HTTPException(
@@ -397,11 +759,73 @@ def rate_limit(redis_client: redis.Redis):
                     detail="Rate limit excedido. Intenta nuevamente en unos segundos."
                 )
 
-            return await func(*args, **kwargs)
+            if not limiter.acquire_concurrency(identifier, limits):
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Demasiadas requests simultáneas para tu plan. Intenta nuevamente en unos segundos."
+                )
+
+            release = _release_once(limiter, identifier)
+            try:
+                response = await func(*args, **kwargs)
+            except BaseException:
+                release()
+                raise
+
+            if isinstance(response, StreamingResponse):
+                # SSE: el handler retorna antes del primer token; el slot se
+                # libera cuando termina (o se corta) la transmisión
+                _release_after_stream(response, release)
+            else:
+                release()
+            return response
         return wrapper
     return decorator
 
 
+def _release_once(limiter: RateLimiter, identifier: str):
+    """release_concurrency() idempotente (puede llamarse desde dos caminos)"""
+    released = False
+
+    def release() -> None:
+        nonlocal released
+        if not released:
+            released = True
+            limiter.release_concurrency(identifier)
+    return release
+
+
+def _release_after_stream(response: StreamingResponse, release) -> None:
+    """
+    Libera el slot al terminar el body de una StreamingResponse
+
+    El finally del iterador cubre fin normal, error y desconexión a mitad
+    del stream; el background task cubre la desconexión antes del primer
+    chunk (el iterador nunca arranca y su finally no corre).
+    """
+    body_iterator = response.body_iterator
+
+    async def iterate():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            release()
+
+    response.body_iterator = iterate()
+
+    background = response.background
+
+    async def after_response() -> None:
+        try:
+            if background is not None:
+                await background()
+        finally:
+            release()
+
+    response.background = BackgroundTask(after_response)
+
+
 # =====================================================================
 # EJEMPLO DE USO EN FASTAPI
 # =====================================================================
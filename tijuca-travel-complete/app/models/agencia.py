@@ -34,6 +34,9 @@ class Agencia(Base):
     # API Key (hash)
     api_key_hash = Column(Text, nullable=False)
 
+    # API Key (digest HMAC indexado para login, ver 04_api_key_lookup.sql)
+    api_key_lookup = Column(String(64), unique=True, index=True)
+
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
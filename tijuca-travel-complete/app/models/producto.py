@@ -0,0 +1,59 @@
+"""
+Modelo de Producto (catálogo con precios reales para HunterBot)
+"""
+import uuid
+from sqlalchemy import Column, String, Boolean, DateTime, Numeric, Text, ForeignKey, Computed
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from app.core.database import Base
+
+
+class Producto(Base):
+    """
+    Modelo de Producto (con Row Level Security)
+
+    Las columnas de búsqueda las genera PostgreSQL (ver
+    05_productos_search.sql); buscar con la función buscar_productos().
+    """
+    __tablename__ = "productos"
+
+    # UUID como Primary Key
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+
+    # Foreign Key al tenant (NUNCA NULL)
+    agencia_id = Column(UUID(as_uuid=True), ForeignKey('agencias.id', ondelete='CASCADE'), nullable=False)
+
+    # Producto
+    descripcion = Column(Text, nullable=False)
+    destino = Column(String(255))
+
+    # Datos financieros
+    moneda = Column(String(3), nullable=False)
+    precio_base = Column(Numeric(12, 2), nullable=False)
+    impuesto_pais = Column(Numeric(12, 2), default=0)
+    percepcion_ganancias = Column(Numeric(12, 2), default=0)
+    precio_total = Column(Numeric(12, 2), nullable=False)
+
+    disponible = Column(Boolean, default=True)
+
+    # Búsqueda (columnas generadas, solo lectura)
+    search_vector = Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('es_unaccent', COALESCE(destino, '')), 'A') || "
+        "setweight(to_tsvector('es_unaccent', descripcion), 'B')",
+        persisted=True
+    ))
+    destino_vector = Column(TSVECTOR, Computed(
+        "to_tsvector('es_unaccent', COALESCE(destino, ''))",
+        persisted=True
+    ))
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    # Relación con Agencia
+    agencia = relationship("Agencia", backref="productos")
+
+    def __repr__(self):
+        return f"<Producto {self.destino} - {self.precio_total} {self.moneda}>"
@@ -12,18 +12,31 @@ Versión: 1.0
 =====================================================================
 """
 
+import os
 import re
-import json
+import asyncio
 import logging
-from typing import Optional, Tuple, Dict, Any, List
-from datetime import datetime
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple, Dict, Any, List, Sequence, AsyncIterator, AsyncContextManager, Callable
+from datetime import datetime, timezone
 from enum import Enum
 
 from pydantic import BaseModel, validator, Field
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.services.pattern_engine import MultiPatternScanner, RuleMatch
+from app.services.pii import PIIType, redaction_placeholder
+from app.services.text_matching import KeywordMatcher
+from app.services.response_cache import response_cache
+from app.services.audit_writer import audit_writer
+from app.services.catalog_index import catalog_index, CatalogNotIndexed
+from app.services.llm_client import llm_guard, LLMUnavailable, is_upstream_failure
+from config import settings
+
 
 # =====================================================================
 # CONFIGURACIÓN DE LOGGING
@@ -49,17 +62,6 @@ class ThreatLevel(str, Enum):
     CRITICAL = "critical"
 
 
-class PIIType(str, Enum):
-    """Tipos de PII detectados"""
-    CREDIT_CARD = "tarjeta_credito"
-    CBU = "cbu"
-    CUIT = "cuit"
-    DNI = "dni"
-    PASSPORT = "pasaporte"
-    EMAIL = "email"
-    PHONE = "telefono"
-
-
 # =====================================================================
 # MODELOS DE DATOS
 # =====================================================================
@@ -90,6 +92,10 @@ class FinancialData(BaseModel):
         frozen = True  # Inmutable (no puede ser modificado por IA)
 
 
+# Productos mencionados en un mensaje (lista vacía: sin datos de DB)
+FinancialContext = List[FinancialData]
+
+
 # =====================================================================
 # CLASE PRINCIPAL: AI GUARDRAILS
 # =====================================================================
@@ -105,65 +111,167 @@ class AIGuardrails:
     4. Rate Limiting (Cost Control)
     """
 
-    # Patrones de Prompt Injection (actualizados 2026)
-    PROMPT_INJECTION_PATTERNS = [
+    # Reglas de Prompt Injection (actualizadas 2026): rule_id -> patrón
+    PROMPT_INJECTION_RULES = {
         # Instrucciones directas
-        r"ignore\s+(previous|all|prior)\s+(instructions?|prompts?|rules?)",
-        r"disregard\s+(previous|all|prior)\s+(instructions?|prompts?)",
-        r"forget\s+(everything|all|what)\s+(you|i)\s+(told|said|know)",
+        "ignore_instructions": r"ignore\s+(previous|all|prior)\s+(instructions?|prompts?|rules?)",
+        "disregard_instructions": r"disregard\s+(previous|all|prior)\s+(instructions?|prompts?)",
+        "forget_context": r"forget\s+(everything|all|what)\s+(you|i)\s+(told|said|know)",
 
         # Cambio de rol
-        r"(you are now|act as|pretend to be|simulate)\s+(?:a|an)?\s*(admin|developer|system|god mode)",
-        r"system:\s*(you are|new role|override)",
+        "role_change": r"(you are now|act as|pretend to be|simulate)\s+(?:a|an)?\s*(admin|developer|system|god mode)",
+        "system_override": r"system:\s*(you are|new role|override)",
 
         # Manipulación de contexto
-        r"(new|updated|different)\s+instructions?:",
-        r"\\n\\n\\n.*?(admin|system|developer)",  # Triple newline injection
+        "new_instructions": r"(new|updated|different)\s+instructions?:",
+        "newline_escape": r"\\n\\n\\n.*?(admin|system|developer)",  # Triple newline injection
 
         # Revelación de prompts
-        r"(show|reveal|display|print)\s+(your|the)\s+(system\s+)?(prompt|instructions?|rules?)",
-        r"what (is|are) your (original\s+)?(instructions?|prompt|rules?)",
+        "reveal_prompt": r"(show|reveal|display|print)\s+(your|the)\s+(system\s+)?(prompt|instructions?|rules?)",
+        "ask_instructions": r"what (is|are) your (original\s+)?(instructions?|prompt|rules?)",
 
         # Encoding/Obfuscation
-        r"base64|rot13|hex|decode|unescape",
+        "encoding_keywords": r"base64|rot13|hex|decode|unescape",
 
         # Jailbreak attempts
-        r"(DAN|developer mode|jailbreak|unrestricted mode)",
-        r"ignore (safety|ethical|content) (guidelines|policies|filters)",
+        "jailbreak": r"(DAN|developer mode|jailbreak|unrestricted mode)",
+        "ignore_safety": r"ignore (safety|ethical|content) (guidelines|policies|filters)",
 
         # SQL Injection en prompts
-        r"(SELECT|INSERT|UPDATE|DELETE|DROP)\s+.*\s+FROM",
+        "sql_in_prompt": r"(SELECT|INSERT|UPDATE|DELETE|DROP)\s+.*\s+FROM",
 
         # Command Injection
-        r"(curl|wget|nc|netcat|bash|sh|cmd\.exe|powershell)",
-    ]
+        "command_injection": r"(curl|wget|nc|netcat|bash|sh|cmd\.exe|powershell)",
+    }
+    PROMPT_INJECTION_PATTERNS = list(PROMPT_INJECTION_RULES.values())
+
+    # Literales sin los cuales cada regla NO puede matchear (prefiltro)
+    PROMPT_INJECTION_TRIGGERS = {
+        "ignore_instructions": ["ignore"],
+        "disregard_instructions": ["disregard"],
+        "forget_context": ["forget"],
+        "role_change": ["you are now", "act as", "pretend to be", "simulate"],
+        "system_override": ["system:"],
+        "new_instructions": ["instruction"],
+        "newline_escape": ["\\n\\n\\n"],
+        "reveal_prompt": ["show", "reveal", "display", "print"],
+        "ask_instructions": ["what "],
+        "encoding_keywords": ["base64", "rot13", "hex", "decode", "unescape"],
+        "jailbreak": ["dan", "developer mode", "jailbreak", "unrestricted mode"],
+        "ignore_safety": ["ignore "],
+        "sql_in_prompt": ["from"],
+        "command_injection": ["curl", "wget", "nc", "netcat", "bash", "sh", "cmd.exe", "powershell"],
+    }
+
+    # Heurísticas que se evalúan en la MISMA pasada que las reglas:
+    # caracteres de control / homoglifos y strings que parecen base64.
+    # (?-i:...) porque con IGNORECASE [A-Za-z] también acepta "ſ" y "K"
+    ENCODING_TRICK_RULES = {
+        "encoding_obfuscation": r"(?-i:[\u0000-\u001F\u007F-\u009F]|\b[A-Za-z0-9+/]{20,}={0,2}\b)",
+    }
+
+    # Motor compilado una sola vez (reglas de injection + heurísticas)
+    _INJECTION_SCANNER = MultiPatternScanner(
+        {**PROMPT_INJECTION_RULES, **ENCODING_TRICK_RULES},
+        re.IGNORECASE | re.MULTILINE,
+        triggers=PROMPT_INJECTION_TRIGGERS
+    )
+
+    # Caracteres "normales"; el resto cuenta como especial
+    _NORMAL_CHARS_RE = re.compile(r'[A-Za-z0-9\s\.,\?!áéíóúñÁÉÍÓÚÑ]+')
 
-    # Patrones de PII (Data Loss Prevention)
+    # Patrones de PII (Data Loss Prevention), en orden de PRIORIDAD:
+    # si dos tipos matchean en la misma posición gana el primero
+    # (EMAIL antes que DNI para "12345678@mail.com", CBU antes que DNI, etc.)
     PII_PATTERNS = {
+        PIIType.EMAIL: r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b",
         PIIType.CREDIT_CARD: r"\b\d{4}[\s\-]?\d{4}[\s\-]?\d{4}[\s\-]?\d{4}\b",
         PIIType.CBU: r"\b\d{22}\b",
         PIIType.CUIT: r"\b\d{2}[\s\-]?\d{8}[\s\-]?\d{1}\b",
         PIIType.DNI: r"\b\d{7,8}\b",
         PIIType.PASSPORT: r"\b[A-Z]{2,3}\d{6,9}\b",
-        PIIType.EMAIL: r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b",
         PIIType.PHONE: r"\b(\+54\s?)?(\d{2,4}[\s\-]?)?\d{6,8}\b",
     }
 
-    # Palabras clave financieras que requieren validación DB
-    FINANCIAL_KEYWORDS = [
-        "precio", "costo", "vale", "cuesta", "tarifa", "cotización",
-        "cuánto sale", "cuánto cuesta", "cuánto vale",
-        "presupuesto", "monto", "total"
+    # Redactor de una sola pasada: tokeniza todos los spans de PII.
+    # Todo patrón empieza en \b con una corrida de [A-Za-z0-9._%+-] que llega
+    # a un dígito o "@" (el guard), y sin dígitos ni "@" no hay nada que buscar
+    _PII_SCANNER = MultiPatternScanner(
+        {pii_type.value: pattern for pii_type, pattern in PII_PATTERNS.items()},
+        re.IGNORECASE,
+        triggers={
+            pii_type.value: ["@"] if pii_type == PIIType.EMAIL else list("0123456789")
+            for pii_type in PII_PATTERNS
+        },
+        guard=r"\b(?=[A-Za-z0-9._%+\-]*[\d@])"
+    )
+
+    # Precios en respuestas del bot (solo válidos si vienen de la DB)
+    PRICE_PATTERNS = [
+        r'\$\s*\d+(?:[.,]\d+)?',  # $1000 o $1,000.50
+        r'ARS\s*\d+(?:[.,]\d+)?',
+        r'USD\s*\d+(?:[.,]\d+)?',
+        r'\d+\s*pesos',
+        r'\d+\s*dólares',
+    ]
+
+    # Frases que indican que el bot está revelando su configuración
+    SYSTEM_LEAK_PATTERNS = [
+        r"my (system )?prompt",
+        r"instructions? (are|were)",
+        r"i am (programmed|designed) to",
     ]
 
-    def __init__(self, db_session: AsyncSession, anthropic_client: Anthropic):
+    # Máximo de productos por mensaje ("¿Bariloche o Mendoza?")
+    MAX_PRODUCTS_PER_MESSAGE = 3
+
+    # Palabras clave financieras que requieren validación DB, por intención.
+    # Se comparan por palabra completa y sin acentos ("cuanto" = "cuánto"):
+    # van las formas en plural / 3ra persona del plural explícitamente
+    FINANCIAL_INTENTS = {
+        "precio": [
+            "precio", "precios", "costo", "costos", "tarifa", "tarifas",
+            "monto", "montos", "total",
+        ],
+        "consulta_precio": [
+            "cuesta", "cuestan", "vale", "valen",
+            "cuánto sale", "cuánto salen", "cuánto cuesta", "cuánto vale",
+        ],
+        "cotizacion": [
+            "cotización", "cotizaciones", "presupuesto", "presupuestos",
+        ],
+    }
+    FINANCIAL_KEYWORDS = [keyword for keywords in FINANCIAL_INTENTS.values() for keyword in keywords]
+
+    # Autómata compilado una sola vez: una pasada por mensaje
+    _FINANCIAL_MATCHER = KeywordMatcher(FINANCIAL_INTENTS)
+
+    def __init__(self, db_session: AsyncSession, anthropic_client: AsyncAnthropic):
         self.db = db_session
         self.anthropic = anthropic_client
 
+    def detect_financial_intents(self, text: str) -> List[str]:
+        """
+        Intenciones financieras del mensaje (claves de FINANCIAL_INTENTS)
+
+        Returns:
+            Lista ordenada; vacía si no hay que consultar la DB
+        """
+        return sorted(self._FINANCIAL_MATCHER.intents(text))
+
     # =================================================================
     # CAPA 1: INPUT SANITIZATION (PROMPT INJECTION DETECTION)
     # =================================================================
 
+    def scan_prompt_injection(self, user_input: str) -> List[RuleMatch]:
+        """
+        Escanea el input UNA vez con el motor compilado
+
+        Returns:
+            Primer match (rule_id, start, end) de cada regla disparada
+        """
+        return self._INJECTION_SCANNER.scan(user_input)
+
     def detect_prompt_injection(self, user_input: str) -> Tuple[bool, ThreatLevel, List[str]]:
         """
         Detecta intentos de Prompt Injection
@@ -171,12 +279,13 @@ class AIGuardrails:
         Returns:
             (is_malicious, threat_level, matched_patterns)
         """
+        rule_matches = {match.rule_id for match in self.scan_prompt_injection(user_input)}
+
         matched_patterns = []
         max_threat_level = ThreatLevel.SAFE
 
-        for pattern in self.PROMPT_INJECTION_PATTERNS:
-            matches = re.findall(pattern, user_input, re.IGNORECASE | re.MULTILINE)
-            if matches:
+        for rule_id, pattern in self.PROMPT_INJECTION_RULES.items():
+            if rule_id in rule_matches:
                 matched_patterns.append(pattern)
                 # Elevar nivel de amenaza
                 if max_threat_level == ThreatLevel.SAFE:
@@ -188,8 +297,8 @@ class AIGuardrails:
         if len(matched_patterns) >= 3:
             max_threat_level = ThreatLevel.CRITICAL
 
-        # Heurísticas adicionales
-        if self._check_encoding_tricks(user_input):
+        # Heurísticas adicionales (ya evaluadas en el mismo escaneo)
+        if "encoding_obfuscation" in rule_matches:
             matched_patterns.append("encoding_obfuscation")
             max_threat_level = ThreatLevel.HIGH
 
@@ -204,18 +313,16 @@ class AIGuardrails:
 
     def _check_encoding_tricks(self, text: str) -> bool:
         """Detecta intentos de ofuscación con encoding"""
-        # Detectar caracteres Unicode sospechosos (homoglifos)
-        suspicious_unicode = re.findall(r'[\u0000-\u001F\u007F-\u009F]', text)
-
-        # Detectar strings que parecen base64
-        base64_like = re.findall(r'\b[A-Za-z0-9+/]{20,}={0,2}\b', text)
-
-        return len(suspicious_unicode) > 0 or len(base64_like) > 0
+        return any(
+            match.rule_id == "encoding_obfuscation"
+            for match in self.scan_prompt_injection(text)
+        )
 
     def _check_excessive_special_chars(self, text: str) -> bool:
         """Detecta uso excesivo de caracteres especiales"""
-        special_chars = re.findall(r'[^A-Za-z0-9\s\.,\?!áéíóúñÁÉÍÓÚÑ]', text)
-        return len(special_chars) > len(text) * 0.3  # >30% caracteres especiales
+        # Lo que queda al quitar los caracteres normales son los especiales
+        special_chars = len(self._NORMAL_CHARS_RE.sub("", text))
+        return special_chars > len(text) * 0.3  # >30% caracteres especiales
 
     # =================================================================
     # CAPA 2: PII REDACTION (DATA LOSS PREVENTION)
@@ -225,57 +332,106 @@ class AIGuardrails:
         """
         Redacta información personal identificable (PII)
 
+        Una sola pasada sobre el texto: los spans se resuelven por posición
+        y prioridad (ver PII_PATTERNS) y la salida se arma con un único join.
+
         Returns:
             (redacted_text, pii_types_found, raw_matches)
         """
-        redacted_text = text
-        pii_found = []
-        raw_matches = {}
-
-        for pii_type, pattern in self.PII_PATTERNS.items():
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            if matches:
-                pii_found.append(pii_type)
-                raw_matches[pii_type.value] = matches
-
-                # Redactar según tipo
-                if pii_type == PIIType.CREDIT_CARD:
-                    # Mantener últimos 4 dígitos
-                    redacted_text = re.sub(
-                        pattern,
-                        lambda m: "****-****-****-" + re.sub(r'\D', '', m.group(0))[-4:],
-                        redacted_text
-                    )
-                elif pii_type == PIIType.EMAIL:
-                    # Redactar parcialmente: j***@example.com
-                    redacted_text = re.sub(
-                        pattern,
-                        lambda m: f"{m.group(0)[0]}***@{m.group(0).split('@')[1]}",
-                        redacted_text
-                    )
-                elif pii_type == PIIType.PHONE:
-                    # Mantener código de área
-                    redacted_text = re.sub(pattern, "[TELÉFONO REDACTADO]", redacted_text)
-                else:
-                    # Redactar completamente
-                    redacted_text = re.sub(pattern, f"[{pii_type.value.upper()} REDACTADO]", redacted_text)
-
-        return redacted_text, pii_found, raw_matches
+        parts = []
+        raw_matches: Dict[str, List[str]] = {}
+        last_end = 0
+
+        for match in self._PII_SCANNER.finditer(text):
+            value = text[match.start:match.end]
+            raw_matches.setdefault(match.rule_id, []).append(value)
+            parts.append(text[last_end:match.start])
+            parts.append(self._redact_value(PIIType(match.rule_id), value))
+            last_end = match.end
+
+        if not raw_matches:
+            return text, [], {}
+
+        parts.append(text[last_end:])
+        pii_found = [pii_type for pii_type in self.PII_PATTERNS if pii_type.value in raw_matches]
+
+        return "".join(parts), pii_found, raw_matches
+
+    @staticmethod
+    def _redact_value(pii_type: PIIType, value: str) -> str:
+        """Reemplazo para un valor de PII según su tipo"""
+        if pii_type == PIIType.CREDIT_CARD:
+            # Mantener últimos 4 dígitos
+            return "****-****-****-" + re.sub(r'\D', '', value)[-4:]
+        if pii_type == PIIType.EMAIL:
+            # Redactar parcialmente: j***@example.com
+            return f"{value[0]}***@{value.split('@')[1]}"
+        # Redactar completamente
+        return redaction_placeholder(pii_type)
 
     # =================================================================
     # CAPA 3: HALLUCINATION PREVENTION (FINANCIAL DATA)
     # =================================================================
 
-    async def fetch_financial_data(self, producto_query: str, tenant_id: str) -> Optional[FinancialData]:
+    async def fetch_financial_context(
+        self,
+        user_message: str,
+        tenant_id: str,
+        session_factory: Callable[[], AsyncContextManager[AsyncSession]]
+    ) -> FinancialContext:
+        """
+        Productos (con precios REALES) que menciona el mensaje del usuario
+
+        El índice de catálogo extrae destinos y nombres de producto del
+        mensaje y resuelve cada uno (hasta MAX_PRODUCTS_PER_MESSAGE, para
+        preguntas como "¿Bariloche o Mendoza?"). Si el índice no puede
+        responder, un solo producto vía fetch_financial_data.
+        """
+        if settings.CATALOG_INDEX_ENABLED:
+            try:
+                rows = await catalog_index.search(
+                    tenant_id, user_message, session_factory, limit=self.MAX_PRODUCTS_PER_MESSAGE
+                )
+                return [self._financial_data_from_row(row) for row in rows]
+            except CatalogNotIndexed:
+                pass
+            except Exception as e:
+                logger.error(f"Error searching catalog index: {e}")
+
+        financial_data = await self.fetch_financial_data(
+            user_message, tenant_id, session_factory=session_factory
+        )
+        return [financial_data] if financial_data else []
+
+    async def fetch_financial_data(
+        self,
+        producto_query: str,
+        tenant_id: str,
+        db: Optional[AsyncSession] = None,
+        session_factory: Optional[Callable[[], AsyncContextManager[AsyncSession]]] = None
+    ) -> Optional[FinancialData]:
         """
         Obtiene datos financieros REALES desde la base de datos
         ⚠️ CRÍTICO: El bot NUNCA debe inventar precios
+
+        db: sesión a usar (por defecto la del constructor)
+        session_factory: alternativa a db; la sesión se abre solo para la query
         """
+        if db is None and session_factory is not None:
+            try:
+                async with session_factory() as db:
+                    return await self.fetch_financial_data(producto_query, tenant_id, db=db)
+            except Exception as e:
+                logger.error(f"Error fetching financial data: {e}")
+                return None
+
         try:
-            # Query seguro con RLS (tenant_id ya está seteado en middleware)
+            # Búsqueda indexada y rankeada (database/05_productos_search.sql):
+            # destino → texto completo → trigramas. RLS sigue aplicando y
+            # agencia_id es el prefijo de los índices.
             query = text("""
                 SELECT
-                    id,
+                    producto_id,
                     descripcion,
                     destino,
                     precio_base,
@@ -284,32 +440,17 @@ class AIGuardrails:
                     percepcion_ganancias,
                     precio_total,
                     disponible
-                FROM productos
-                WHERE
-                    (LOWER(descripcion) LIKE LOWER(:search) OR LOWER(destino) LIKE LOWER(:search))
-                    AND disponible = true
-                    AND agencia_id = :tenant_id
-                LIMIT 1
+                FROM buscar_productos(CAST(:tenant_id AS UUID), :search, 1)
             """)
 
-            result = await self.db.execute(
+            result = await (db or self.db).execute(
                 query,
-                {"search": f"%{producto_query}%", "tenant_id": tenant_id}
+                {"search": producto_query, "tenant_id": tenant_id}
             )
             row = result.fetchone()
 
             if row:
-                return FinancialData(
-                    producto_id=str(row[0]),
-                    descripcion=row[1],
-                    destino=row[2],
-                    precio_base=float(row[3]),
-                    moneda=row[4],
-                    impuesto_pais=float(row[5]) if row[5] else 0,
-                    percepcion_ganancias=float(row[6]) if row[6] else 0,
-                    precio_total=float(row[7]),
-                    disponible=bool(row[8])
-                )
+                return self._financial_data_from_row(row)
             else:
                 return None
 
@@ -317,22 +458,29 @@ class AIGuardrails:
             logger.error(f"Error fetching financial data: {e}")
             return None
 
+    @staticmethod
+    def _financial_data_from_row(row: Sequence[Any]) -> FinancialData:
+        """Fila de buscar_productos() (o del índice de catálogo) → FinancialData"""
+        return FinancialData(
+            producto_id=str(row[0]),
+            descripcion=row[1],
+            destino=row[2] or "",
+            precio_base=float(row[3]),
+            moneda=row[4],
+            impuesto_pais=float(row[5]) if row[5] else 0,
+            percepcion_ganancias=float(row[6]) if row[6] else 0,
+            precio_total=float(row[7]),
+            disponible=bool(row[8])
+        )
+
     def validate_ai_response_has_no_hallucinated_prices(self, ai_response: str) -> Tuple[bool, List[str]]:
         """
         Valida que la respuesta del bot NO contenga precios inventados
         Solo puede mencionar precios que se obtuvieron de la DB
         """
         # Detectar patrones de precios en la respuesta
-        price_patterns = [
-            r'\$\s*\d+(?:[.,]\d+)?',  # $1000 o $1,000.50
-            r'ARS\s*\d+(?:[.,]\d+)?',
-            r'USD\s*\d+(?:[.,]\d+)?',
-            r'\d+\s*pesos',
-            r'\d+\s*dólares',
-        ]
-
         found_prices = []
-        for pattern in price_patterns:
+        for pattern in self.PRICE_PATTERNS:
             matches = re.findall(pattern, ai_response, re.IGNORECASE)
             found_prices.extend(matches)
 
@@ -353,6 +501,10 @@ class AIGuardrails:
         2. Redactar PII
         3. Retornar resultado consolidado
         """
+        return self.scan_input(user_input, tenant_id)
+
+    def scan_input(self, user_input: str, tenant_id: Optional[str] = None) -> GuardrailResult:
+        """Versión síncrona de validate_input (CPU puro, sin DB ni red)"""
         threats = []
         sanitized = user_input
 
@@ -368,6 +520,9 @@ class AIGuardrails:
             threats.append("pii_detected")
             logger.warning(f"⚠️ PII detected and redacted: {pii_found}")
 
+        # Intenciones financieras (sobre el texto ya sin PII)
+        financial_intents = self.detect_financial_intents(sanitized)
+
         # Determinar si es seguro procesar
         is_safe = threat_level not in [ThreatLevel.HIGH, ThreatLevel.CRITICAL]
 
@@ -381,14 +536,16 @@ class AIGuardrails:
                 "original_length": len(user_input),
                 "sanitized_length": len(sanitized),
                 "injection_patterns": injection_patterns if is_injection else [],
-                "raw_pii_matches": raw_pii_matches if pii_found else {}
+                "raw_pii_matches": raw_pii_matches if pii_found else {},
+                "financial_intents": financial_intents,
+                **({"tenant_id": tenant_id} if tenant_id else {})
             }
         )
 
     async def validate_output(
         self,
         ai_response: str,
-        financial_context: Optional[FinancialData]
+        financial_context: Optional[FinancialContext]
     ) -> Tuple[bool, str, List[str]]:
         """
         Valida la respuesta del bot antes de enviarla al usuario
@@ -396,6 +553,14 @@ class AIGuardrails:
         Returns:
             (is_valid, sanitized_response, warnings)
         """
+        return self.check_output(ai_response, financial_context)
+
+    def check_output(
+        self,
+        ai_response: str,
+        financial_context: Optional[FinancialContext]
+    ) -> Tuple[bool, str, List[str]]:
+        """Versión síncrona de validate_output (CPU puro, sin DB ni red)"""
         warnings = []
         sanitized_response = ai_response
 
@@ -421,12 +586,7 @@ class AIGuardrails:
             logger.warning(f"⚠️ PII leaked in output (redacted): {pii_output}")
 
         # VALIDACIÓN 3: Detectar información sensible del sistema
-        system_leak_patterns = [
-            r"my (system )?prompt",
-            r"instructions? (are|were)",
-            r"i am (programmed|designed) to",
-        ]
-        for pattern in system_leak_patterns:
+        for pattern in self.SYSTEM_LEAK_PATTERNS:
             if re.search(pattern, sanitized_response, re.IGNORECASE):
                 warnings.append("system_prompt_leak")
                 logger.error(f"🚨 SYSTEM PROMPT LEAK DETECTED: {pattern}")
@@ -437,6 +597,280 @@ class AIGuardrails:
 
         return is_valid, sanitized_response, warnings
 
+    # =================================================================
+    # CAPA 5: VALIDACIÓN POR LOTES (GATEWAY WHATSAPP / RE-SCAN HISTÓRICO)
+    # =================================================================
+
+    async def iter_validate_input_batch(
+        self,
+        messages: Sequence[str],
+        tenant_ids: Optional[Sequence[Optional[str]]] = None
+    ) -> AsyncIterator[GuardrailResult]:
+        """
+        Valida muchos mensajes y emite los resultados a medida que están listos
+
+        Los resultados salen en el mismo orden que los mensajes. Lotes de
+        GUARDRAILS_BATCH_PROCESS_THRESHOLD mensajes o más se reparten en
+        chunks sobre un process pool (si hay más de un core); los más
+        chicos se procesan acá, cediendo el event loop entre chunks.
+        """
+        if tenant_ids is None:
+            tenant_ids = [None] * len(messages)
+        elif len(tenant_ids) != len(messages):
+            raise ValueError("tenant_ids debe tener el mismo largo que messages")
+
+        items = list(zip(messages, tenant_ids))
+        async for result in _stream_batch(items, self.scan_input, _scan_input_chunk):
+            yield result
+
+    async def validate_input_batch(
+        self,
+        messages: Sequence[str],
+        tenant_ids: Optional[Sequence[Optional[str]]] = None
+    ) -> List[GuardrailResult]:
+        """Valida muchos mensajes: un GuardrailResult por mensaje, en orden"""
+        return [result async for result in self.iter_validate_input_batch(messages, tenant_ids)]
+
+    async def iter_validate_output_batch(
+        self,
+        ai_responses: Sequence[str],
+        financial_contexts: Optional[Sequence[Optional[FinancialContext]]] = None
+    ) -> AsyncIterator[Tuple[bool, str, List[str]]]:
+        """Igual que iter_validate_input_batch, para respuestas del bot"""
+        if financial_contexts is None:
+            financial_contexts = [None] * len(ai_responses)
+        elif len(financial_contexts) != len(ai_responses):
+            raise ValueError("financial_contexts debe tener el mismo largo que ai_responses")
+
+        items = list(zip(ai_responses, financial_contexts))
+        async for result in _stream_batch(items, self.check_output, _check_output_chunk):
+            yield result
+
+    async def validate_output_batch(
+        self,
+        ai_responses: Sequence[str],
+        financial_contexts: Optional[Sequence[Optional[FinancialContext]]] = None
+    ) -> List[Tuple[bool, str, List[str]]]:
+        """Valida muchas respuestas: (is_valid, sanitized_response, warnings) por cada una"""
+        return [
+            result
+            async for result in self.iter_validate_output_batch(ai_responses, financial_contexts)
+        ]
+
+
+# =====================================================================
+# GUARDRAILS DE SALIDA EN STREAMING
+# =====================================================================
+
+class SystemPromptLeak(Exception):
+    """El bot empezó a revelar su configuración: cortar el stream"""
+
+
+def _merge_spans(spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Une spans superpuestos (PII y precios pueden pisarse)"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(spans):
+        if merged and start < merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class StreamingOutputGuard:
+    """
+    Aplica los guardrails de salida a una respuesta que llega por tokens
+
+    Retiene sin emitir los últimos WINDOW caracteres (ventana deslizante):
+    un precio o dato personal partido entre dos tokens se redacta completo
+    antes de salir, y una frase de SYSTEM_LEAK_PATTERNS se detecta antes de
+    llegar al usuario. Nunca se corta el texto dentro de un match.
+    """
+
+    WINDOW = 80
+    # Sin espacios en HARD_CAP caracteres (URL, base64, CJK) se corta igual
+    HARD_CAP = 2 * WINDOW
+
+    _PRICE_RE = re.compile("|".join(AIGuardrails.PRICE_PATTERNS), re.IGNORECASE)
+    _LEAK_RE = re.compile("|".join(AIGuardrails.SYSTEM_LEAK_PATTERNS), re.IGNORECASE)
+
+    def __init__(self, guardrails: AIGuardrails, financial_context: Optional[FinancialContext]):
+        self.guardrails = guardrails
+        self.financial_context = financial_context
+        self.warnings: List[str] = []
+        self._pending = ""
+        # Cola del texto ya emitido: detecta leaks que cruzan el corte
+        self._emitted_tail = ""
+
+    def feed(self, delta: str) -> str:
+        """
+        Agrega un token y retorna el texto (sanitizado) listo para enviar
+        ⚠️ Lanza SystemPromptLeak si la respuesta revela el system prompt
+        """
+        self._pending += delta
+        self._check_leak()
+
+        if len(self._pending) <= self.WINDOW:
+            return ""
+        return self._emit(self._safe_cutoff(len(self._pending) - self.WINDOW))
+
+    def flush(self) -> str:
+        """Emite lo que queda al terminar la respuesta"""
+        self._check_leak()
+        return self._emit(len(self._pending))
+
+    def _check_leak(self) -> None:
+        match = self._LEAK_RE.search(self._emitted_tail + self._pending)
+        if match:
+            self.warnings.append("system_prompt_leak")
+            logger.error(f"🚨 SYSTEM PROMPT LEAK DETECTED (stream): {match.group(0)!r}")
+            raise SystemPromptLeak(match.group(0))
+
+    def _safe_cutoff(self, cutoff: int) -> int:
+        """
+        Retrocede el corte hasta un espacio que no quede dentro de un match
+
+        Si no hay espacio y el buffer pasó HARD_CAP, corta en `cutoff` (o en
+        el borde más cercano del match que lo contiene): el buffer queda
+        acotado y cada token no re-escanea un texto cada vez más largo.
+        """
+        text = self._pending
+        spans = [(m.start, m.end) for m in self.guardrails._PII_SCANNER.finditer(text)]
+        spans += [m.span() for m in self._PRICE_RE.finditer(text)]
+        spans = _merge_spans(spans)
+
+        target = cutoff
+        moved = True
+        while moved and cutoff > 0:
+            moved = False
+            while cutoff > 0 and not text[cutoff].isspace():
+                cutoff -= 1
+            for start, end in spans:
+                if start < cutoff < end:
+                    cutoff = start
+                    moved = True
+
+        if cutoff == 0 and len(text) > self.HARD_CAP:
+            cutoff = target
+            for start, end in spans:
+                if start < cutoff < end:
+                    # Un match que arranca al principio sale entero (redactado)
+                    cutoff = start if start > 0 else end
+                    break
+        return cutoff
+
+    def _emit(self, cutoff: int) -> str:
+        chunk, self._pending = self._pending[:cutoff], self._pending[cutoff:]
+        if not chunk:
+            return ""
+        self._emitted_tail = (self._emitted_tail + chunk)[-self.WINDOW:]
+
+        if not self.financial_context:
+            chunk, prices = self._PRICE_RE.subn("[PRECIO DISPONIBLE - CONSULTAR]", chunk)
+            if prices and "hallucinated_prices" not in self.warnings:
+                self.warnings.append("hallucinated_prices")
+                logger.error("🚨 HALLUCINATION DETECTED (stream): precio sin contexto de DB")
+
+        chunk, pii_found, _ = self.guardrails.redact_pii(chunk)
+        if pii_found and "pii_in_output" not in self.warnings:
+            self.warnings.append("pii_in_output")
+            logger.warning(f"⚠️ PII leaked in output (redacted): {pii_found}")
+
+        return chunk
+
+
+# =====================================================================
+# PROCESS POOL PARA LOTES
+# =====================================================================
+# Las funciones de chunk son de módulo para poder enviarse a otro proceso.
+# Cada proceso compila las regex una sola vez (al importar este módulo) y
+# reutiliza una instancia de AIGuardrails sin DB ni cliente de Anthropic.
+
+_batch_executor: Optional[ProcessPoolExecutor] = None
+_worker_guardrails: Optional[AIGuardrails] = None
+
+
+def _get_worker_guardrails() -> AIGuardrails:
+    global _worker_guardrails
+    if _worker_guardrails is None:
+        _worker_guardrails = AIGuardrails(db_session=None, anthropic_client=None)
+    return _worker_guardrails
+
+
+def _scan_input_chunk(chunk: List[Tuple[str, Optional[str]]]) -> List[GuardrailResult]:
+    guardrails = _get_worker_guardrails()
+    return [guardrails.scan_input(message, tenant_id) for message, tenant_id in chunk]
+
+
+def _check_output_chunk(
+    chunk: List[Tuple[str, Optional[FinancialContext]]]
+) -> List[Tuple[bool, str, List[str]]]:
+    guardrails = _get_worker_guardrails()
+    return [guardrails.check_output(response, context) for response, context in chunk]
+
+
+def _get_batch_executor() -> ProcessPoolExecutor:
+    """Crea el pool la primera vez que llega un lote grande"""
+    global _batch_executor
+    if _batch_executor is None:
+        # spawn: hacer fork de un proceso con event loop + threads no es seguro
+        _batch_executor = ProcessPoolExecutor(
+            max_workers=settings.GUARDRAILS_BATCH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _batch_executor
+
+
+def shutdown_batch_executor() -> None:
+    """Detiene el process pool (shutdown de la app)"""
+    global _batch_executor
+    if _batch_executor is not None:
+        _batch_executor.shutdown(wait=False, cancel_futures=True)
+        _batch_executor = None
+
+
+async def _stream_batch(
+    items: List[tuple],
+    inline: Callable[..., Any],
+    chunk_worker: Callable[[List[tuple]], List[Any]]
+) -> AsyncIterator[Any]:
+    chunk_size = max(settings.GUARDRAILS_BATCH_CHUNK_SIZE, 1)
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    # Con un solo core el pool no paraleliza nada: solo agrega serialización
+    use_pool = (
+        len(items) >= settings.GUARDRAILS_BATCH_PROCESS_THRESHOLD
+        and (os.cpu_count() or 1) > 1
+    )
+
+    if not use_pool:
+        for chunk in chunks:
+            for item in chunk:
+                yield inline(*item)
+            # Ceder el event loop entre chunks
+            await asyncio.sleep(0)
+        return
+
+    loop = asyncio.get_running_loop()
+    executor = _get_batch_executor()
+    # Como máximo 2 chunks en vuelo por proceso: el consumidor marca el ritmo
+    max_in_flight = settings.GUARDRAILS_BATCH_WORKERS * 2
+    pending: deque = deque()
+
+    try:
+        for chunk in chunks:
+            pending.append(loop.run_in_executor(executor, chunk_worker, chunk))
+            if len(pending) >= max_in_flight:
+                for result in await pending.popleft():
+                    yield result
+        while pending:
+            for result in await pending.popleft():
+                yield result
+    finally:
+        # El consumidor cortó el stream antes de terminar
+        for future in pending:
+            future.cancel()
+
 
 # =====================================================================
 # EJEMPLO DE INTEGRACIÓN CON CLAUDE API
@@ -445,15 +879,40 @@ class AIGuardrails:
 class SecureHunterBot:
     """HunterBot con guardrails de seguridad integrados"""
 
-    def __init__(self, db: AsyncSession, anthropic_client: Anthropic, tenant_id: str):
-        self.db = db
+    MODEL = "claude-sonnet-4-5-20250929"
+    MAX_TOKENS = 1024
+
+    # Respuesta cuando no hay datos de precios o Claude no está disponible
+    FALLBACK_RESPONSE = (
+        "Déjame consultar esa información actualizada con nuestro equipo. "
+        "¿Podrías compartirme tu email o teléfono para enviarte la cotización?"
+    )
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncContextManager[AsyncSession]],
+        anthropic_client: AsyncAnthropic,
+        tenant_id: str
+    ):
+        """
+        session_factory: abre una sesión con RLS del tenant (ej: tenant_session).
+        Se usa solo en las fases de DB, así la conexión vuelve al pool
+        mientras se espera a Claude.
+        """
+        self.session_factory = session_factory
         self.anthropic = anthropic_client
         self.tenant_id = tenant_id
-        self.guardrails = AIGuardrails(db, anthropic_client)
+        self.guardrails = AIGuardrails(None, anthropic_client)
 
-    async def process_message(self, user_message: str) -> Dict[str, Any]:
+    async def _prepare_message(
+        self,
+        user_message: str
+    ) -> Tuple[GuardrailResult, FinancialContext, Optional[Dict[str, Any]]]:
         """
-        Procesa un mensaje del usuario con todas las capas de seguridad
+        Pasos previos a llamar a Claude (validación de input + datos de DB)
+
+        Returns:
+            (validation, financial_context, blocked_response)
         """
         # PASO 1: Validar input
         validation = await self.guardrails.validate_input(user_message, self.tenant_id)
@@ -461,52 +920,76 @@ class SecureHunterBot:
         if not validation.is_safe:
             # Bloquear mensajes de alto riesgo
             logger.error(f"🚨 BLOCKED MESSAGE: {validation.threat_level} - {validation.threats_detected}")
-            return {
+            return validation, [], {
                 "success": False,
                 "error": "Tu mensaje contiene patrones sospechosos y fue bloqueado por seguridad.",
                 "threat_level": validation.threat_level.value
             }
 
         # PASO 2: Detectar si necesita datos financieros
-        needs_financial_data = any(
-            keyword in validation.sanitized_input.lower()
-            for keyword in self.guardrails.FINANCIAL_KEYWORDS
-        )
+        # (scan_input ya corrió el matcher sobre el texto sanitizado)
+        needs_financial_data = bool(validation.metadata.get("financial_intents"))
 
-        financial_context = None
+        financial_context: FinancialContext = []
         if needs_financial_data:
-            # Extraer query de producto (simplificado, mejorar con NLP)
-            producto_query = validation.sanitized_input  # TODO: mejorar extracción
-            financial_context = await self.guardrails.fetch_financial_data(
-                producto_query,
-                self.tenant_id
+            # Destinos / productos mencionados (gazetteer del catálogo)
+            financial_context = await self.guardrails.fetch_financial_context(
+                validation.sanitized_input,
+                self.tenant_id,
+                self.session_factory
             )
 
-        # PASO 3: Construir prompt seguro para Claude
-        system_prompt = self._build_secure_system_prompt(financial_context)
+        return validation, financial_context, None
 
-        # PASO 4: Llamar a Claude API
-        try:
-            response = self.anthropic.messages.create(
-                model="claude-sonnet-4-5-20250929",
-                max_tokens=1024,
-                system=system_prompt,
-                messages=[{
-                    "role": "user",
-                    "content": validation.sanitized_input
-                }]
-            )
+    async def process_message(self, user_message: str) -> Dict[str, Any]:
+        """
+        Procesa un mensaje del usuario con todas las capas de seguridad
+        """
+        # PASOS 1-2: Validar input y obtener datos financieros
+        validation, financial_context, blocked = await self._prepare_message(user_message)
+        if blocked:
+            return blocked
+
+        # PASO 3: Buscar respuesta en cache (misma pregunta + mismos precios)
+        cache_key = response_cache.make_key(validation.sanitized_input, financial_context)
+        ai_response = response_cache.get(self.tenant_id, cache_key)
+        cached = ai_response is not None
+
+        # PASO 4: Llamar a Claude API (await: no bloquea el event loop)
+        # con límite de concurrencia, timeout y circuit breaker
+        if not cached:
+            system_prompt = self._build_secure_system_prompt(financial_context)
+            try:
+                async with llm_guard.slot(self.tenant_id):
+                    response = await asyncio.wait_for(
+                        self.anthropic.messages.create(
+                            model=self.MODEL,
+                            max_tokens=self.MAX_TOKENS,
+                            system=system_prompt,
+                            messages=[{
+                                "role": "user",
+                                "content": validation.sanitized_input
+                            }]
+                        ),
+                        timeout=settings.HUNTERBOT_CALL_TIMEOUT_SECONDS
+                    )
 
-            ai_response = response.content[0].text
+                ai_response = response.content[0].text
 
-        except Exception as e:
-            logger.error(f"Error calling Claude API: {e}")
-            return {
-                "success": False,
-                "error": "Error procesando tu mensaje. Intenta nuevamente."
-            }
+            except LLMUnavailable as e:
+                logger.warning(f"⚠️ Claude no disponible ({e.reason}): respondiendo fallback")
+                return self._fallback_response(validation, financial_context, e.reason)
 
-        # PASO 5: Validar output
+            except Exception as e:
+                logger.error(f"Error calling Claude API: {e}")
+                if is_upstream_failure(e):
+                    return self._fallback_response(validation, financial_context, "upstream_error")
+                return {
+                    "success": False,
+                    "error": "Error procesando tu mensaje. Intenta nuevamente."
+                }
+
+        # PASO 5: Validar output (también las respuestas cacheadas)
         is_valid, sanitized_output, warnings = await self.guardrails.validate_output(
             ai_response,
             financial_context
@@ -519,25 +1002,147 @@ class SecureHunterBot:
                 "error": "No puedo procesar esa consulta en este momento."
             }
 
-        # PASO 6: Log de auditoría (si hubo warnings)
+        # PASO 6: Log de auditoría (si hubo warnings; se escribe en segundo plano)
         if warnings:
-            await self._log_security_event(
-                user_message=user_message,
+            self._log_security_event(
                 validation_result=validation,
                 output_warnings=warnings
             )
+        elif not cached:
+            # Solo se cachean respuestas que pasaron los guardrails sin warnings
+            response_cache.set(self.tenant_id, cache_key, ai_response)
 
         return {
             "success": True,
             "response": sanitized_output,
             "metadata": {
                 "pii_redacted": len(validation.pii_redacted) > 0,
-                "financial_data_used": financial_context is not None,
+                "financial_data_used": bool(financial_context),
+                "cached": cached,
                 "warnings": warnings
             }
         }
 
-    def _build_secure_system_prompt(self, financial_context: Optional[FinancialData]) -> str:
+    async def stream_message(self, user_message: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Igual que process_message, pero emite la respuesta a medida que se genera
+
+        Eventos: {"event": "token" | "done" | "error", "data": {...}}.
+        Los tokens pasan por StreamingOutputGuard; si se detecta un leak del
+        system prompt el stream se corta con un "error" (discard=True: el
+        cliente debe descartar lo recibido).
+        """
+        validation, financial_context, blocked = await self._prepare_message(user_message)
+        if blocked:
+            yield {"event": "error", "data": blocked}
+            return
+
+        guard = StreamingOutputGuard(self.guardrails, financial_context)
+        cache_key = response_cache.make_key(validation.sanitized_input, financial_context)
+        cached_response = response_cache.get(self.tenant_id, cache_key)
+        raw_parts: List[str] = []
+
+        try:
+            if cached_response is not None:
+                # La respuesta cacheada pasa por el mismo guard
+                chunk = guard.feed(cached_response)
+                if chunk:
+                    yield {"event": "token", "data": {"text": chunk}}
+            else:
+                # Salir del context manager cierra la conexión: Claude deja de
+                # generar. El timeout aplica a la espera de cada fragmento.
+                async with llm_guard.slot(self.tenant_id), self.anthropic.messages.stream(
+                    model=self.MODEL,
+                    max_tokens=self.MAX_TOKENS,
+                    system=self._build_secure_system_prompt(financial_context),
+                    messages=[{
+                        "role": "user",
+                        "content": validation.sanitized_input
+                    }],
+                    timeout=settings.HUNTERBOT_CALL_TIMEOUT_SECONDS
+                ) as stream:
+                    async for delta in stream.text_stream:
+                        raw_parts.append(delta)
+                        chunk = guard.feed(delta)
+                        if chunk:
+                            yield {"event": "token", "data": {"text": chunk}}
+
+            chunk = guard.flush()
+            if chunk:
+                yield {"event": "token", "data": {"text": chunk}}
+
+        except LLMUnavailable as e:
+            logger.warning(f"⚠️ Claude no disponible ({e.reason}): respondiendo fallback")
+            fallback = self._fallback_response(validation, financial_context, e.reason)
+            yield {"event": "token", "data": {"text": fallback["response"]}}
+            yield {"event": "done", "data": {"success": True, "metadata": fallback["metadata"]}}
+            return
+
+        except SystemPromptLeak:
+            self._log_security_event(
+                validation_result=validation,
+                output_warnings=guard.warnings
+            )
+            yield {"event": "error", "data": {
+                "success": False,
+                "error": "No puedo procesar esa consulta en este momento.",
+                "discard": True
+            }}
+            return
+
+        except Exception as e:
+            logger.error(f"Error calling Claude API (stream): {e}")
+            if is_upstream_failure(e) and not raw_parts:
+                # Todavía no se envió nada: se puede responder el fallback
+                fallback = self._fallback_response(validation, financial_context, "upstream_error")
+                yield {"event": "token", "data": {"text": fallback["response"]}}
+                yield {"event": "done", "data": {"success": True, "metadata": fallback["metadata"]}}
+                return
+            yield {"event": "error", "data": {
+                "success": False,
+                "error": "Error procesando tu mensaje. Intenta nuevamente.",
+                "discard": True
+            }}
+            return
+
+        if guard.warnings:
+            self._log_security_event(
+                validation_result=validation,
+                output_warnings=guard.warnings
+            )
+        elif cached_response is None:
+            response_cache.set(self.tenant_id, cache_key, "".join(raw_parts))
+
+        yield {"event": "done", "data": {
+            "success": True,
+            "metadata": {
+                "pii_redacted": len(validation.pii_redacted) > 0,
+                "financial_data_used": bool(financial_context),
+                "cached": cached_response is not None,
+                "warnings": guard.warnings
+            }
+        }}
+
+    def _fallback_response(
+        self,
+        validation: GuardrailResult,
+        financial_context: FinancialContext,
+        reason: str
+    ) -> Dict[str, Any]:
+        """Respuesta inmediata sin Claude (breaker abierto, saturación o timeout)"""
+        return {
+            "success": True,
+            "response": self.FALLBACK_RESPONSE,
+            "metadata": {
+                "pii_redacted": len(validation.pii_redacted) > 0,
+                "financial_data_used": bool(financial_context),
+                "cached": False,
+                "fallback": reason,
+                "warnings": []
+            }
+        }
+
+    def _build_secure_system_prompt(self, financial_context: FinancialContext) -> str:
         """Construye el system prompt con instrucciones de seguridad"""
         base_prompt = """Eres HunterBot, el asistente de ventas de Tijuca Travel por WhatsApp.
 
@@ -552,69 +1157,57 @@ TONO: Amigable, profesional, hispanohablante argentino.
 """
 
         if financial_context:
-            base_prompt += f"""
+            base_prompt += """
 DATOS FINANCIEROS VERIFICADOS (USAR ESTOS Y SOLO ESTOS):
-- Producto: {financial_context.descripcion}
-- Destino: {financial_context.destino}
-- Precio Base: {financial_context.moneda} {financial_context.precio_base}
-- Impuesto PAIS: {financial_context.moneda} {financial_context.impuesto_pais}
-- Percepción Ganancias: {financial_context.moneda} {financial_context.percepcion_ganancias}
-- PRECIO TOTAL: {financial_context.moneda} {financial_context.precio_total}
-
+"""
+            for producto in financial_context:
+                base_prompt += f"""
+- Producto: {producto.descripcion}
+- Destino: {producto.destino}
+- Precio Base: {producto.moneda} {producto.precio_base}
+- Impuesto PAIS: {producto.moneda} {producto.impuesto_pais}
+- Percepción Ganancias: {producto.moneda} {producto.percepcion_ganancias}
+- PRECIO TOTAL: {producto.moneda} {producto.precio_total}
+"""
+            base_prompt += """
 ⚠️ CRÍTICO: Estos son los ÚNICOS precios que puedes mencionar.
 """
         else:
-            base_prompt += """
+            base_prompt += f"""
 ⚠️ NO tienes datos financieros disponibles. Si te preguntan por precios, responde:
-"Déjame consultar esa información actualizada con nuestro equipo. ¿Podrías compartirme tu email o teléfono para enviarte la cotización?"
+"{self.FALLBACK_RESPONSE}"
 """
 
         return base_prompt
 
-    async def _log_security_event(
+    def _log_security_event(
         self,
-        user_message: str,
         validation_result: GuardrailResult,
         output_warnings: List[str]
     ) -> None:
-        """Registra evento de seguridad en audit log"""
-        try:
-            await self.db.execute(
-                text("""
-                    SELECT insert_security_log(
-                        :agencia_id,
-                        NULL,
-                        NULL,
-                        NULL,
-                        'HunterBot',
-                        'AI_GUARDRAIL_TRIGGERED',
-                        'hunterbot',
-                        NULL,
-                        :description,
-                        :old_value,
-                        :new_value,
-                        :severity,
-                        ARRAY['ai', 'security', 'guardrails']::TEXT[],
-                        :is_suspicious
-                    )
-                """),
-                {
-                    "agencia_id": self.tenant_id,
-                    "description": f"Guardrails triggered: {validation_result.threats_detected + output_warnings}",
-                    "old_value": json.dumps({"user_message": user_message}),
-                    "new_value": json.dumps({
-                        "threat_level": validation_result.threat_level.value,
-                        "threats": validation_result.threats_detected,
-                        "pii_redacted": [p.value for p in validation_result.pii_redacted],
-                        "output_warnings": output_warnings
-                    }),
-                    "severity": "warning" if validation_result.threat_level == ThreatLevel.MEDIUM else "critical",
-                    "is_suspicious": validation_result.threat_level in [ThreatLevel.HIGH, ThreatLevel.CRITICAL]
-                }
-            )
-            await self.db.commit()
-        except Exception as e:
-            logger.error(f"Error logging security event: {e}")
+        """
+        Encola el evento de seguridad para el audit log (no espera a la DB)
+        Se guarda el mensaje con la PII ya redactada: el evento puede
+        terminar en el archivo de respaldo del audit writer
+        """
+        audit_writer.submit({
+            "agencia_id": self.tenant_id,
+            "user_agent": "HunterBot",
+            "action_type": "AI_GUARDRAIL_TRIGGERED",
+            "resource_type": "hunterbot",
+            "action_description": f"Guardrails triggered: {validation_result.threats_detected + output_warnings}",
+            "old_value": {"user_message": validation_result.sanitized_input},
+            "new_value": {
+                "threat_level": validation_result.threat_level.value,
+                "threats": validation_result.threats_detected,
+                "pii_redacted": [p.value for p in validation_result.pii_redacted],
+                "output_warnings": output_warnings,
+                "occurred_at": datetime.now(timezone.utc).isoformat()
+            },
+            "severity": "warning" if validation_result.threat_level == ThreatLevel.MEDIUM else "critical",
+            "tags": ["ai", "security", "guardrails"],
+            "is_suspicious": validation_result.threat_level in [ThreatLevel.HIGH, ThreatLevel.CRITICAL]
+        })
 
 
 # =====================================================================
@@ -629,7 +1222,7 @@ async def test_guardrails():
     from unittest.mock import MagicMock
 
     db_mock = MagicMock(spec=AsyncSession)
-    anthropic_mock = MagicMock(spec=Anthropic)
+    anthropic_mock = MagicMock(spec=AsyncAnthropic)
 
     guardrails = AIGuardrails(db_mock, anthropic_mock)
 
@@ -0,0 +1,386 @@
+"""
+Escritura de auditoría en segundo plano (security_logs)
+
+Antes cada evento de los guardrails abría una sesión, ejecutaba
+insert_security_log() y hacía commit antes de responder. Ahora
+submit() solo encola el evento (no espera a la DB), y una tarea por
+worker lo escribe en lotes. Cada lote es UN INSERT multi-fila vía
+insert_security_logs_batch(), y se envía cada
+AUDIT_FLUSH_INTERVAL_SECONDS o al juntar AUDIT_BATCH_MAX_EVENTS.
+
+Durabilidad: si la DB falla (o la cola se llena) los eventos se agregan
+a un archivo JSONL append-only (AUDIT_SPILL_PATH, creado con permisos
+0600). Cuando la DB vuelve, el writer lo reinserta. Con AUDIT_SPILL_PATH
+vacío esos eventos se descartan y se cuentan en "dropped".
+
+created_at es el momento de la escritura; los eventos llevan su propio
+"occurred_at" en new_value.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, AsyncContextManager, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+SessionFactory = Callable[[], AsyncContextManager[AsyncSession]]
+
+# Evento con las columnas de insert_security_log() (ver 06_security_logs_batch.sql)
+AuditEvent = Dict[str, Any]
+
+_INSERT_BATCH = text("SELECT insert_security_logs_batch(CAST(:events AS JSONB))")
+
+
+def _append_lines(path: Path, events: List[AuditEvent], fsync: bool) -> None:
+    # Una sola escritura en modo append: las líneas de distintos workers
+    # no se intercalan
+    payload = "".join(json.dumps(event, default=str) + "\n" for event in events)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Solo el usuario del proceso puede leerlo (contenido de auditoría)
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+    with os.fdopen(fd, "a", encoding="utf-8") as spill:
+        spill.write(payload)
+        if fsync:
+            spill.flush()
+            os.fsync(spill.fileno())
+
+
+def _read_events(path: Path) -> Tuple[List[AuditEvent], int]:
+    """Eventos del archivo y cantidad de líneas ilegibles (escritura cortada)"""
+    events, corrupt = [], 0
+    with open(path, encoding="utf-8") as spill:
+        for line in spill:
+            if not line.strip():
+                continue
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                corrupt += 1
+    return events, corrupt
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AuditWriter:
+    """Cola acotada + tarea que escribe los eventos en lotes (una por worker)"""
+
+    def __init__(
+        self,
+        max_queue_events: int,
+        batch_max_events: int,
+        flush_interval_seconds: float,
+        write_timeout_seconds: float,
+        spill_path: Optional[str],
+        spill_retry_seconds: float
+    ):
+        self.max_queue_events = max_queue_events
+        self.batch_max_events = batch_max_events
+        self.flush_interval_seconds = flush_interval_seconds
+        self.write_timeout_seconds = write_timeout_seconds
+        self.spill_path = Path(spill_path) if spill_path else None
+        self.spill_retry_seconds = spill_retry_seconds
+
+        # (instante de encolado, evento)
+        self._queue: "asyncio.Queue[Tuple[float, AuditEvent]]" = asyncio.Queue(max_queue_events)
+        self._session_factory: Optional[SessionFactory] = None
+        self._task: Optional[asyncio.Task] = None
+        # Eventos que no entraron en la cola, esperando ir al archivo
+        self._overflow: List[AuditEvent] = []
+        self._overflow_task: Optional[asyncio.Task] = None
+        self._spill_pending = False
+        self._next_replay_at = 0.0
+
+        self.submitted = 0
+        self.written = 0
+        self.batches = 0
+        self.write_failures = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.spill_corrupt_lines = 0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self.last_error: Optional[str] = None
+
+    # =================================================================
+    # API
+    # =================================================================
+
+    def submit(self, event: AuditEvent) -> None:
+        """Encola el evento sin esperar a la DB (nunca lanza excepción)"""
+        self.submitted += 1
+        try:
+            self._queue.put_nowait((time.monotonic(), event))
+        except asyncio.QueueFull:
+            # La DB no da abasto: al archivo, pero no desde el event loop
+            self._overflow.append(event)
+            if self._overflow_task is None or self._overflow_task.done():
+                try:
+                    loop = asyncio.get_running_loop()
+                except RuntimeError:
+                    # Fuera de un event loop (scripts): escritura directa
+                    self._spill(self._take_overflow(), reason="queue_full", fsync=False)
+                    return
+                self._overflow_task = loop.create_task(self._spill_overflow(), name="audit-overflow")
+
+    def start(self, session_factory: SessionFactory) -> None:
+        """Arranca la tarea de escritura (startup de la app)"""
+        self._session_factory = session_factory
+        if self._task is None or self._task.done():
+            self._spill_pending = self._has_spill()
+            self._task = asyncio.create_task(self._run(), name="audit-writer")
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Escribe lo encolado (hasta `timeout`) y detiene la tarea (shutdown)"""
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Audit writer: timeout vaciando la cola en el shutdown")
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        if self._overflow_task is not None:
+            await asyncio.gather(self._overflow_task, return_exceptions=True)
+            self._overflow_task = None
+
+        # Lo que no llegó a escribirse va al archivo
+        leftovers = self._take_overflow()
+        while not self._queue.empty():
+            leftovers.append(self._queue.get_nowait()[1])
+            self._queue.task_done()
+        if leftovers:
+            self._spill(leftovers, reason="shutdown", fsync=True)
+
+    # =================================================================
+    # TAREA DE ESCRITURA
+    # =================================================================
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._spill_pending and loop.time() >= self._next_replay_at:
+                await self._replay_spill()
+
+            # Con eventos en el archivo se despierta para reintentar aunque
+            # no lleguen eventos nuevos
+            batch: List[Tuple[float, AuditEvent]] = []
+            try:
+                await self._next_batch(batch, self.spill_retry_seconds if self._spill_pending else None)
+                if batch:
+                    await self._flush(batch)
+            except asyncio.CancelledError:
+                # Shutdown con el lote en la mano: al archivo (puede quedar
+                # duplicado si el INSERT llegó a confirmarse)
+                if batch:
+                    self._spill([event for _, event in batch], reason="shutdown", fsync=True)
+                raise
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _next_batch(self, batch: List[Tuple[float, AuditEvent]], idle_timeout: Optional[float]) -> None:
+        """Espera un evento y junta en `batch` los que lleguen en la ventana de flush"""
+        try:
+            batch.append(await asyncio.wait_for(self._queue.get(), idle_timeout))
+        except asyncio.TimeoutError:
+            return
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval_seconds
+        while len(batch) < self.batch_max_events:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+    async def _flush(self, batch: List[Tuple[float, AuditEvent]]) -> None:
+        events = [event for _, event in batch]
+        try:
+            await self._insert(events)
+        except Exception as e:
+            self.write_failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.error(f"Audit writer: error escribiendo {len(events)} eventos: {e}")
+            await asyncio.to_thread(self._spill, events, "db_error", True)
+            self._next_replay_at = asyncio.get_running_loop().time() + self.spill_retry_seconds
+            return
+
+        lag = time.monotonic() - batch[0][0]
+        self.last_lag_seconds = lag
+        self.max_lag_seconds = max(self.max_lag_seconds, lag)
+        # La DB respondió: reintentar ya lo que haya en el archivo
+        self._next_replay_at = 0.0
+
+    async def _insert(self, events: List[AuditEvent]) -> None:
+        if self._session_factory is None:
+            raise RuntimeError("AuditWriter sin iniciar")
+        async with self._session_factory() as db:
+            await asyncio.wait_for(
+                db.execute(_INSERT_BATCH, {"events": json.dumps(events, default=str)}),
+                self.write_timeout_seconds
+            )
+            await db.commit()
+        self.written += len(events)
+        self.batches += 1
+
+    # =================================================================
+    # ARCHIVO DE RESPALDO (JSONL APPEND-ONLY)
+    # =================================================================
+
+    def _spill(self, events: List[AuditEvent], reason: str, fsync: bool) -> None:
+        if self.spill_path is None:
+            self.dropped += len(events)
+            logger.error(f"Audit writer: {len(events)} eventos descartados ({reason})")
+            return
+        try:
+            _append_lines(self.spill_path, events, fsync)
+        except OSError as e:
+            self.dropped += len(events)
+            logger.error(f"Audit writer: no se pudo escribir {self.spill_path} ({reason}): {e}")
+            return
+        self.spilled += len(events)
+        self._spill_pending = True
+
+    def _take_overflow(self) -> List[AuditEvent]:
+        events, self._overflow = self._overflow, []
+        return events
+
+    async def _spill_overflow(self) -> None:
+        """Lleva al archivo, en un thread, lo que submit() no pudo encolar"""
+        while self._overflow:
+            # Un append + fsync por tanda (lo que llegó mientras se escribía
+            # la anterior)
+            await asyncio.to_thread(self._spill, self._take_overflow(), "queue_full", True)
+
+    def _claimed_path(self, pid: int) -> Path:
+        return self.spill_path.with_name(f"{self.spill_path.name}.replay-{pid}")
+
+    def _has_spill(self) -> bool:
+        if self.spill_path is None:
+            return False
+        return self.spill_path.exists() or any(self.spill_path.parent.glob(f"{self.spill_path.name}.replay-*"))
+
+    def _claim_spill(self) -> List[Path]:
+        """
+        Archivos a reinsertar por ESTE worker
+
+        El archivo compartido se renombra (atómico): si varios workers lo
+        intentan, uno solo lo gana. También se adoptan los .replay-<pid>
+        de workers que ya no existen (reinicio a mitad de una reinserción).
+        """
+        own = self._claimed_path(os.getpid())
+        for path in self.spill_path.parent.glob(f"{self.spill_path.name}.replay-*"):
+            pid = path.name.rsplit("-", 1)[-1]
+            if path != own and pid.isdigit() and not _pid_alive(int(pid)):
+                adopted = own.with_name(f"{own.name}.{pid}")
+                try:
+                    os.replace(path, adopted)
+                except FileNotFoundError:
+                    pass  # Lo adoptó otro worker
+
+        if not own.exists():
+            try:
+                os.replace(self.spill_path, own)
+            except FileNotFoundError:
+                pass
+        return sorted(
+            path for path in self.spill_path.parent.glob(f"{own.name}*")
+            if not path.name.endswith(".tmp")
+        )
+
+    async def _replay_spill(self) -> None:
+        """Reinserta el archivo en lotes; si la DB vuelve a fallar, queda lo que falta"""
+        loop = asyncio.get_running_loop()
+        try:
+            paths = await asyncio.to_thread(self._claim_spill)
+            for path in paths:
+                events, corrupt = await asyncio.to_thread(_read_events, path)
+                self.spill_corrupt_lines += corrupt
+                for i in range(0, len(events), self.batch_max_events):
+                    try:
+                        await self._insert(events[i:i + self.batch_max_events])
+                    except Exception:
+                        # Reescribir solo lo pendiente (no duplicar lo ya insertado)
+                        remaining = events[i:]
+                        tmp = path.with_name(path.name + ".tmp")
+                        await asyncio.to_thread(tmp.unlink, True)
+                        await asyncio.to_thread(_append_lines, tmp, remaining, True)
+                        await asyncio.to_thread(os.replace, tmp, path)
+                        raise
+                    self.replayed += min(self.batch_max_events, len(events) - i)
+                await asyncio.to_thread(path.unlink)
+                logger.info(f"Audit writer: {len(events)} eventos reinsertados desde {path.name}")
+        except Exception as e:
+            self.write_failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            self._next_replay_at = loop.time() + self.spill_retry_seconds
+            return
+
+        # Pudo llegar algo nuevo al archivo mientras se reinsertaba
+        self._spill_pending = await asyncio.to_thread(self._has_spill)
+
+    # =================================================================
+    # MÉTRICAS
+    # =================================================================
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas para /health"""
+        oldest = None
+        if not self._queue.empty():
+            # Primer elemento del deque interno de la cola (solo lectura)
+            oldest = time.monotonic() - self._queue._queue[0][0]
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "queued": self._queue.qsize(),
+            "overflow_queued": len(self._overflow),
+            "max_queue_events": self.max_queue_events,
+            "oldest_queued_seconds": round(oldest, 3) if oldest is not None else 0.0,
+            "submitted": self.submitted,
+            "written": self.written,
+            "batches": self.batches,
+            "avg_batch_size": round(self.written / self.batches, 1) if self.batches else 0.0,
+            "last_lag_ms": round(self.last_lag_seconds * 1000, 1),
+            "max_lag_ms": round(self.max_lag_seconds * 1000, 1),
+            "write_failures": self.write_failures,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "spill_pending": self._spill_pending,
+            "dropped": self.dropped,
+            "spill_corrupt_lines": self.spill_corrupt_lines,
+            "last_error": self.last_error,
+        }
+
+
+# Writer global de auditoría (uno por worker)
+audit_writer = AuditWriter(
+    max_queue_events=settings.AUDIT_QUEUE_MAX_EVENTS,
+    batch_max_events=settings.AUDIT_BATCH_MAX_EVENTS,
+    flush_interval_seconds=settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+    write_timeout_seconds=settings.AUDIT_WRITE_TIMEOUT_SECONDS,
+    spill_path=settings.AUDIT_SPILL_PATH,
+    spill_retry_seconds=settings.AUDIT_SPILL_RETRY_SECONDS
+)
@@ -0,0 +1,475 @@
+"""
+Índice de catálogo en memoria por tenant (HunterBot)
+
+Los catálogos cambian poco, pero cada pregunta de precio iba a PostgreSQL.
+Cada worker mantiene, por tenant, las filas de productos disponibles como
+tuplas, un índice invertido palabra → productos (destino y texto
+completo) y un gazetteer (PhraseMatcher) para extraer de cada mensaje los
+destinos y productos que menciona, y responde fetch_financial_context sin
+ir a la DB.
+
+Frescura acotada: una consulta con el índice más viejo que
+CATALOG_INDEX_MAX_STALENESS_SECONDS primero lo refresca de forma
+incremental (productos con updated_at posterior a la última lectura +
+un conteo para detectar borrados). Si el refresco falla no se sirven
+precios viejos: se lanza CatalogNotIndexed y el caller consulta la DB.
+
+Como la cache de respuestas, el índice es por worker. Cuando un refresco
+trae cambios se invalida la cache de respuestas del tenant.
+"""
+import asyncio
+import difflib
+import logging
+import sys
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from functools import lru_cache
+from typing import Any, AsyncContextManager, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.response_cache import response_cache
+from app.services.text_matching import STOPWORDS, PhraseMatcher, TextOrWords, split_words, tokenize
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Fila compacta, mismo orden que buscar_productos():
+# (producto_id, descripcion, destino, precio_base, moneda, impuesto_pais,
+#  percepcion_ganancias, precio_total, disponible)
+ProductRow = Tuple[str, str, str, float, str, float, float, float, bool]
+
+SessionFactory = Callable[[], AsyncContextManager[AsyncSession]]
+
+
+class CatalogNotIndexed(Exception):
+    """El índice no puede responder: el caller debe consultar la DB"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+_PRODUCT_COLUMNS = """
+    id, descripcion, destino, precio_base, moneda,
+    impuesto_pais, percepcion_ganancias, precio_total, disponible
+"""
+
+
+def _to_row(record) -> ProductRow:
+    return (
+        sys.intern(str(record[0])),
+        record[1],
+        record[2] or "",
+        float(record[3]),
+        record[4],
+        float(record[5]) if record[5] else 0.0,
+        float(record[6]) if record[6] else 0.0,
+        float(record[7]),
+        True,
+    )
+
+
+# Los destinos se repiten entre miles de productos: normalizar una vez
+
+@lru_cache(maxsize=4096)
+def _destino_tokens(destino: str) -> FrozenSet[str]:
+    return frozenset(sys.intern(t) for t in tokenize(destino))
+
+
+@lru_cache(maxsize=4096)
+def _destino_key(destino: str) -> str:
+    return sys.intern(" ".join(split_words(destino)))
+
+
+class _TenantCatalog:
+    """Productos disponibles de un tenant + índice invertido + gazetteer"""
+
+    __slots__ = (
+        "rows", "tokens", "destino_index", "text_index", "destinos",
+        "_gazetteer", "results", "watermark", "refreshed_at",
+    )
+
+    # Resultados memorizados por mensaje normalizado (se vacía con cada cambio)
+    MAX_CACHED_RESULTS = 1024
+
+    # Los nombres de producto entran al gazetteer solo en catálogos chicos;
+    # en los grandes se extraen solo destinos (el resto lo resuelve search)
+    MAX_GAZETTEER_PRODUCT_NAMES = 2000
+
+    def __init__(self):
+        self.rows: Dict[str, ProductRow] = {}
+        # producto_id -> (palabras del destino, palabras de destino + descripción)
+        self.tokens: Dict[str, Tuple[FrozenSet[str], FrozenSet[str]]] = {}
+        self.destino_index: Dict[str, Set[str]] = {}
+        self.text_index: Dict[str, Set[str]] = {}
+        # destino normalizado -> productos
+        self.destinos: Dict[str, Set[str]] = {}
+        self._gazetteer: Optional[PhraseMatcher] = None
+        self.results: "OrderedDict[Tuple[str, int], List[ProductRow]]" = OrderedDict()
+        self.watermark = None  # Reloj de la DB de la última lectura
+        self.refreshed_at = 0.0  # time.monotonic() de la última lectura
+
+    def upsert(self, row: ProductRow) -> bool:
+        """Agrega o reemplaza un producto; False si no cambió nada"""
+        producto_id = row[0]
+        previous = self.rows.get(producto_id)
+        if previous == row:
+            return False
+        if previous is None or previous[1:3] != row[1:3]:
+            # Cambió el nombre o el destino (no solo el precio)
+            self._gazetteer = None
+        self.remove(producto_id)
+        self.results.clear()
+
+        destino_tokens = _destino_tokens(row[2])
+        text_tokens = destino_tokens | frozenset(sys.intern(t) for t in tokenize(row[1]))
+        self.rows[producto_id] = row
+        self.tokens[producto_id] = (destino_tokens, text_tokens)
+        for token in destino_tokens:
+            self.destino_index.setdefault(token, set()).add(producto_id)
+        for token in text_tokens:
+            self.text_index.setdefault(token, set()).add(producto_id)
+        destino_key = _destino_key(row[2])
+        if destino_key:
+            self.destinos.setdefault(destino_key, set()).add(producto_id)
+        return True
+
+    def remove(self, producto_id: str) -> bool:
+        row = self.rows.pop(producto_id, None)
+        if row is None:
+            return False
+        self.results.clear()
+        self._gazetteer = None
+        destino_tokens, text_tokens = self.tokens.pop(producto_id)
+        for index, tokens in ((self.destino_index, destino_tokens), (self.text_index, text_tokens)):
+            for token in tokens:
+                postings = index[token]
+                postings.discard(producto_id)
+                if not postings:
+                    del index[token]
+        destino_key = _destino_key(row[2])
+        if destino_key:
+            products = self.destinos[destino_key]
+            products.discard(producto_id)
+            if not products:
+                del self.destinos[destino_key]
+        return True
+
+    @property
+    def gazetteer(self) -> PhraseMatcher:
+        """
+        Frases que identifican productos: cada destino completo, las palabras
+        de un destino que no aparecen en ningún otro ("bariloche" sí,
+        "puerto" no) y, en catálogos chicos, los nombres de producto
+        """
+        if self._gazetteer is None:
+            matcher = PhraseMatcher()
+            owners: Dict[str, Set[str]] = {}
+            for destino_key in self.destinos:
+                matcher.add(destino_key, ("destino", destino_key))
+                for word in set(split_words(destino_key)):
+                    if len(word) >= 4 and word not in STOPWORDS:
+                        owners.setdefault(word, set()).add(destino_key)
+            for word, destino_keys in owners.items():
+                if len(destino_keys) == 1:
+                    matcher.add(word, ("destino", next(iter(destino_keys))))
+            if len(self.rows) <= self.MAX_GAZETTEER_PRODUCT_NAMES:
+                for producto_id, row in self.rows.items():
+                    matcher.add(row[1], ("producto", producto_id))
+            self._gazetteer = matcher.compile()
+        return self._gazetteer
+
+    def search(self, message: TextOrWords, limit: int) -> List[ProductRow]:
+        """
+        Productos que menciona el mensaje (hasta limit, en orden de aparición)
+
+        1. Entidades del gazetteer en una pasada: por cada destino el mejor
+           producto según el resto del mensaje ("hotel", "crucero"); un
+           nombre de producto se devuelve tal cual
+        2. Sin entidades: mismas etapas que buscar_productos() (destino →
+           texto completo con TODAS las palabras → parecido, para errores
+           de tipeo). "Paquete a Tokio" no devuelve un paquete a Bariloche:
+           sin destino conocido no hay resultado
+        """
+        words = split_words(message)  # Se normaliza una sola vez
+        key = (" ".join(words), limit)
+        if key in self.results:
+            self.results.move_to_end(key)
+            return self.results[key]
+
+        result = self._search(words, limit)
+        self.results[key] = result
+        if len(self.results) > self.MAX_CACHED_RESULTS:
+            self.results.popitem(last=False)
+        return result
+
+    def _search(self, words: Sequence[str], limit: int) -> List[ProductRow]:
+        tokens = frozenset(tokenize(words))
+        destino_hits, text_hits = self._hits(tokens)
+
+        found: List[ProductRow] = []
+        for kind, value in self.gazetteer.find(words):
+            if kind == "producto":
+                row = self.rows[value]
+            else:
+                row = self._best(self.destinos[value], {}, text_hits)
+            if row not in found:
+                found.append(row)
+                if len(found) == limit:
+                    break
+        if found or not tokens:
+            return found
+
+        if destino_hits:
+            return [self._best(destino_hits, destino_hits, text_hits)]
+        # Cada palabra suma 1 por producto: puntaje == palabras → están todas
+        complete = [producto_id for producto_id, hits in text_hits.items() if hits == len(tokens)]
+        if complete:
+            return [self._best(complete, destino_hits, text_hits)]
+
+        destino_hits = {}
+        for token in tokens:
+            if len(token) < 4:
+                continue
+            for match in difflib.get_close_matches(token, self.destino_index.keys(), n=3, cutoff=0.75):
+                for producto_id in self.destino_index[match]:
+                    destino_hits[producto_id] = destino_hits.get(producto_id, 0) + 1
+        return [self._best(destino_hits, destino_hits, text_hits)] if destino_hits else []
+
+    def _hits(self, tokens: FrozenSet[str]) -> Tuple[Dict[str, int], Dict[str, int]]:
+        # Puntaje por producto: palabras del mensaje en destino (pesan
+        # doble) y en destino + descripción, sumado desde los postings
+        destino_hits: Dict[str, int] = {}
+        text_hits: Dict[str, int] = {}
+        for token in tokens:
+            for producto_id in self.destino_index.get(token, ()):
+                destino_hits[producto_id] = destino_hits.get(producto_id, 0) + 1
+            for producto_id in self.text_index.get(token, ()):
+                text_hits[producto_id] = text_hits.get(producto_id, 0) + 1
+        return destino_hits, text_hits
+
+    def _best(
+        self,
+        candidates: Iterable[str],
+        destino_hits: Dict[str, int],
+        text_hits: Dict[str, int]
+    ) -> ProductRow:
+        # Más puntaje primero; empate: más barato (como buscar_productos)
+        rows = self.rows
+        best = min(
+            candidates,
+            key=lambda producto_id: (
+                -2 * destino_hits.get(producto_id, 0) - text_hits.get(producto_id, 0),
+                rows[producto_id][7],
+                producto_id,
+            )
+        )
+        return rows[best]
+
+
+def _compile_gazetteer(catalog: _TenantCatalog) -> None:
+    """Arma y compila el gazetteer (CPU pura: se ejecuta en un thread)"""
+    catalog.gazetteer
+
+
+def _build_catalog(records) -> _TenantCatalog:
+    """Carga completa (CPU pura: se ejecuta en un thread)"""
+    catalog = _TenantCatalog()
+    for record in records:
+        catalog.upsert(_to_row(record))
+    _compile_gazetteer(catalog)  # El autómata también fuera del event loop
+    return catalog
+
+
+class CatalogIndex:
+    """Índices de catálogo por tenant (LRU) con refresco incremental"""
+
+    # Se relee este margen hacia atrás en cada refresco: updated_at lo
+    # setea el trigger con NOW() (inicio de la transacción), así que un
+    # UPDATE que tarda en commitear queda con un timestamp "viejo"
+    WATERMARK_OVERLAP = timedelta(seconds=5)
+
+    def __init__(self, max_staleness_seconds: float, max_products_per_tenant: int, max_tenants: int):
+        self.max_staleness_seconds = max_staleness_seconds
+        self.max_products_per_tenant = max_products_per_tenant
+        self.max_tenants = max_tenants
+        self._tenants: "OrderedDict[str, _TenantCatalog]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Tenants con catálogo demasiado grande -> momento en que se verificó
+        self._oversized: Dict[str, float] = {}
+
+        # Métricas
+        self.lookups = 0
+        self.full_loads = 0
+        self.incremental_refreshes = 0
+        self.products_changed = 0
+        self.not_indexed: Dict[str, int] = {}
+
+    def _not_indexed(self, reason: str) -> CatalogNotIndexed:
+        self.not_indexed[reason] = self.not_indexed.get(reason, 0) + 1
+        return CatalogNotIndexed(reason)
+
+    def _is_fresh(self, catalog: Optional[_TenantCatalog]) -> bool:
+        return catalog is not None and time.monotonic() - catalog.refreshed_at < self.max_staleness_seconds
+
+    async def search(
+        self,
+        tenant_id: str,
+        message: TextOrWords,
+        session_factory: SessionFactory,
+        limit: int = 1
+    ) -> List[ProductRow]:
+        """
+        Productos que menciona el mensaje (lista vacía si ninguno)
+        ⚠️ Lanza CatalogNotIndexed si el índice no puede garantizar precios
+        frescos (refresco fallido, catálogo demasiado grande)
+        """
+        if not message or (isinstance(message, str) and message.isspace()):
+            return []
+
+        catalog = self._tenants.get(tenant_id)
+        if not self._is_fresh(catalog):
+            catalog = await self._refresh(tenant_id, session_factory)
+        self._tenants.move_to_end(tenant_id)
+
+        self.lookups += 1
+        return catalog.search(message, limit)
+
+    def invalidate_tenant(self, tenant_id: str) -> None:
+        """Descarta el índice de un tenant (se recarga en la próxima consulta)"""
+        self._tenants.pop(tenant_id, None)
+        self._oversized.pop(tenant_id, None)
+
+    async def _refresh(self, tenant_id: str, session_factory: SessionFactory) -> _TenantCatalog:
+        checked_at = self._oversized.get(tenant_id)
+        if checked_at is not None and time.monotonic() - checked_at < self.max_staleness_seconds:
+            raise self._not_indexed("too_large")
+
+        lock = self._locks.get(tenant_id)
+        if lock is None:
+            lock = self._locks[tenant_id] = asyncio.Lock()
+
+        async with lock:
+            # Otro request pudo haberlo refrescado mientras esperábamos
+            catalog = self._tenants.get(tenant_id)
+            if self._is_fresh(catalog):
+                return catalog
+
+            started_at = time.monotonic()
+            try:
+                async with session_factory() as db:
+                    catalog = await self._load(db, tenant_id, catalog)
+            except CatalogNotIndexed:
+                raise
+            except Exception as e:
+                # Sin refresco no hay garantía de frescura: que responda la DB
+                logger.error(f"Error refreshing catalog index: {e}")
+                raise self._not_indexed("refresh_error") from e
+
+            catalog.refreshed_at = started_at
+            self._tenants[tenant_id] = catalog
+            self._tenants.move_to_end(tenant_id)
+            while len(self._tenants) > self.max_tenants:
+                evicted, _ = self._tenants.popitem(last=False)
+                if not self._locks[evicted].locked():
+                    del self._locks[evicted]
+            return catalog
+
+    async def _load(
+        self,
+        db: AsyncSession,
+        tenant_id: str,
+        catalog: Optional[_TenantCatalog]
+    ) -> _TenantCatalog:
+        # Reloj de la DB ANTES de leer: lo que cambie después se verá en el
+        # próximo refresco
+        result = await db.execute(
+            text("""
+                SELECT clock_timestamp(), count(*)
+                FROM productos
+                WHERE agencia_id = CAST(:tenant_id AS UUID) AND disponible = true
+            """),
+            {"tenant_id": tenant_id}
+        )
+        polled_at, available = result.one()
+
+        if available > self.max_products_per_tenant:
+            self._tenants.pop(tenant_id, None)
+            self._oversized[tenant_id] = time.monotonic()
+            raise self._not_indexed("too_large")
+        self._oversized.pop(tenant_id, None)
+
+        if catalog is not None:
+            # Incremental: solo lo modificado desde la última lectura
+            result = await db.execute(
+                text(f"""
+                    SELECT {_PRODUCT_COLUMNS}
+                    FROM productos
+                    WHERE agencia_id = CAST(:tenant_id AS UUID) AND updated_at > :since
+                """),
+                {"tenant_id": tenant_id, "since": catalog.watermark}
+            )
+            changed = 0
+            for record in result:
+                if record[8]:
+                    changed += catalog.upsert(_to_row(record))
+                else:
+                    changed += catalog.remove(sys.intern(str(record[0])))
+
+            # Un DELETE no deja updated_at: si el conteo no cierra, recargar
+            if len(catalog.rows) == available:
+                self.incremental_refreshes += 1
+                if changed:
+                    self.products_changed += changed
+                    response_cache.invalidate_tenant(tenant_id)
+                if catalog._gazetteer is None:
+                    # Cambió un nombre o un destino: recompilar fuera del loop
+                    await asyncio.to_thread(_compile_gazetteer, catalog)
+                catalog.watermark = polled_at - self.WATERMARK_OVERLAP
+                return catalog
+
+            response_cache.invalidate_tenant(tenant_id)
+
+        # Carga completa
+        result = await db.execute(
+            text(f"""
+                SELECT {_PRODUCT_COLUMNS}
+                FROM productos
+                WHERE agencia_id = CAST(:tenant_id AS UUID) AND disponible = true
+            """),
+            {"tenant_id": tenant_id}
+        )
+        # Tokenizar miles de productos lleva cientos de ms: fuera del event loop
+        fresh = await asyncio.to_thread(_build_catalog, result.all())
+        fresh.watermark = polled_at - self.WATERMARK_OVERLAP
+        self.full_loads += 1
+        return fresh
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas para /health"""
+        now = time.monotonic()
+        return {
+            "tenants": len(self._tenants),
+            "products": sum(len(catalog.rows) for catalog in self._tenants.values()),
+            "oldest_refresh_seconds": round(max(
+                (now - catalog.refreshed_at for catalog in self._tenants.values()), default=0.0
+            ), 1),
+            "max_staleness_seconds": self.max_staleness_seconds,
+            "lookups": self.lookups,
+            "full_loads": self.full_loads,
+            "incremental_refreshes": self.incremental_refreshes,
+            "products_changed": self.products_changed,
+            "not_indexed": dict(self.not_indexed),
+        }
+
+
+# Índice global de catálogos (uno por worker)
+catalog_index = CatalogIndex(
+    max_staleness_seconds=settings.CATALOG_INDEX_MAX_STALENESS_SECONDS,
+    max_products_per_tenant=settings.CATALOG_INDEX_MAX_PRODUCTS_PER_TENANT,
+    max_tenants=settings.CATALOG_INDEX_MAX_TENANTS
+)
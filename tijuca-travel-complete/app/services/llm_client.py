@@ -0,0 +1,267 @@
+"""
+Cliente de Anthropic compartido (HunterBot)
+
+Un único AsyncAnthropic por worker, creado en el startup y cerrado en el
+shutdown. Las llamadas se hacen con await (no bloquean el event loop) y
+reutilizan conexiones HTTP keep-alive en lugar de abrir un cliente nuevo
+(handshake TLS incluido) por cada mensaje.
+
+Cada llamada pasa además por LLMCallGuard: límite de llamadas en vuelo
+por worker y por tenant, y un circuit breaker que, tras varios errores
+seguidos del upstream, responde al instante con el fallback en lugar de
+acumular requests esperando a un Claude lento o caído.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import anthropic
+import httpx
+from anthropic import AsyncAnthropic
+
+from config import settings
+
+
+_client: Optional[AsyncAnthropic] = None
+
+
+def init_anthropic_client() -> Optional[AsyncAnthropic]:
+    """Crea el cliente global (no hace nada si falta ANTHROPIC_API_KEY)"""
+    global _client
+    if _client is None and settings.ANTHROPIC_API_KEY:
+        timeout = httpx.Timeout(settings.ANTHROPIC_TIMEOUT_SECONDS, connect=5.0)
+        _client = AsyncAnthropic(
+            api_key=settings.ANTHROPIC_API_KEY,
+            base_url=settings.ANTHROPIC_BASE_URL or None,
+            timeout=timeout,
+            max_retries=settings.ANTHROPIC_MAX_RETRIES,
+            http_client=httpx.AsyncClient(
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=settings.ANTHROPIC_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=30.0
+                )
+            )
+        )
+    return _client
+
+
+def get_anthropic_client() -> Optional[AsyncAnthropic]:
+    """Cliente global, o None si HunterBot no está configurado"""
+    return _client or init_anthropic_client()
+
+
+async def close_anthropic_client() -> None:
+    """Cierra el pool de conexiones (shutdown de la app)"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+# =====================================================================
+# CIRCUIT BREAKER + LÍMITES DE CONCURRENCIA
+# =====================================================================
+
+class LLMUnavailable(Exception):
+    """No se llama a Claude: el caller debe responder con el fallback"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """Errores que indican que Claude está lento o caído (no errores del request)"""
+    if isinstance(exc, (asyncio.TimeoutError, anthropic.APIConnectionError)):
+        return True
+    if isinstance(exc, anthropic.APIStatusError):
+        return exc.status_code >= 500 or exc.status_code == 429
+    return False
+
+
+class CircuitBreaker:
+    """
+    closed → open tras failure_threshold errores seguidos del upstream
+    open → half_open pasados reset_seconds (se deja pasar UNA llamada)
+    half_open → closed si esa llamada sale bien, open si falla
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial_in_flight = False
+
+    def allow_request(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.state = self.HALF_OPEN
+        # half_open: una sola llamada de prueba a la vez
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self.state = self.CLOSED
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def record_cancelled(self) -> None:
+        """La llamada se canceló sin resultado (ej: el cliente cortó)"""
+        self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        retry_in = 0.0
+        if self.state == self.OPEN:
+            retry_in = max(self.reset_seconds - (time.monotonic() - self.opened_at), 0.0)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "retry_in_seconds": round(retry_in, 1),
+        }
+
+
+class _TenantSlots:
+    __slots__ = ("semaphore", "users")
+
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0
+
+
+class LLMCallGuard:
+    """Semáforo por worker + semáforo por tenant + circuit breaker"""
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_concurrent_per_tenant: int,
+        queue_timeout: float,
+        breaker: CircuitBreaker
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_concurrent_per_tenant = max_concurrent_per_tenant
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker
+        self._global = asyncio.Semaphore(max_concurrent)
+        self._tenants: Dict[str, _TenantSlots] = {}
+        self._in_flight = 0
+
+        # Métricas
+        self.calls = 0
+        self.failures = 0
+        self.fallbacks: Dict[str, int] = {}
+
+    def _reject(self, reason: str) -> LLMUnavailable:
+        self.fallbacks[reason] = self.fallbacks.get(reason, 0) + 1
+        return LLMUnavailable(reason)
+
+    async def _acquire(self, semaphore: asyncio.Semaphore, reason: str) -> None:
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._reject(reason) from None
+
+    @asynccontextmanager
+    async def slot(self, tenant_id: str) -> AsyncIterator[None]:
+        """
+        Reserva un lugar para llamar a Claude
+        ⚠️ Lanza LLMUnavailable si el breaker está abierto o no hay lugar
+        a tiempo (queue_timeout). Errores del upstream dentro del bloque
+        cuentan para el breaker.
+        """
+        if not self.breaker.allow_request():
+            raise self._reject("circuit_open")
+
+        tenant = self._tenants.get(tenant_id)
+        if tenant is None:
+            tenant = self._tenants[tenant_id] = _TenantSlots(self.max_concurrent_per_tenant)
+        tenant.users += 1
+
+        acquired = []
+        try:
+            try:
+                # Primero el cupo del tenant: un tenant no acapara la cola global
+                await self._acquire(tenant.semaphore, "tenant_saturated")
+                acquired.append(tenant.semaphore)
+                await self._acquire(self._global, "saturated")
+                acquired.append(self._global)
+            except BaseException:
+                # Sin lugar (o cancelado esperando): no cuenta para el breaker
+                self.breaker.record_cancelled()
+                raise
+
+            self.calls += 1
+            self._in_flight += 1
+            try:
+                yield
+            except Exception as exc:
+                if is_upstream_failure(exc):
+                    self.failures += 1
+                    self.breaker.record_failure()
+                else:
+                    # Claude respondió: el error es nuestro (ej: leak en el stream)
+                    self.breaker.record_success()
+                raise
+            except BaseException:
+                self.breaker.record_cancelled()
+                raise
+            else:
+                self.breaker.record_success()
+            finally:
+                self._in_flight -= 1
+        finally:
+            for semaphore in acquired:
+                semaphore.release()
+            tenant.users -= 1
+            if tenant.users == 0:
+                self._tenants.pop(tenant_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas para /health"""
+        return {
+            "circuit_breaker": self.breaker.stats(),
+            "in_flight": self._in_flight,
+            "max_concurrent": self.max_concurrent,
+            "max_concurrent_per_tenant": self.max_concurrent_per_tenant,
+            "tenants_active": len(self._tenants),
+            "calls": self.calls,
+            "upstream_failures": self.failures,
+            "fallbacks": dict(self.fallbacks),
+        }
+
+
+# Guard global de llamadas a Claude (uno por worker)
+llm_guard = LLMCallGuard(
+    max_concurrent=settings.HUNTERBOT_MAX_CONCURRENT_CALLS,
+    max_concurrent_per_tenant=settings.HUNTERBOT_MAX_CONCURRENT_CALLS_PER_TENANT,
+    queue_timeout=settings.HUNTERBOT_QUEUE_TIMEOUT_SECONDS,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.HUNTERBOT_BREAKER_FAILURE_THRESHOLD,
+        reset_seconds=settings.HUNTERBOT_BREAKER_RESET_SECONDS
+    )
+)
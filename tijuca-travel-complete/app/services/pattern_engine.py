@@ -0,0 +1,158 @@
+"""
+Motor de reglas regex compilado (multi-patrón)
+
+Compila un conjunto de reglas {rule_id: patrón} en UNA sola regex con un
+grupo nombrado por regla, y escanea el texto de izquierda a derecha una
+única vez para reportar qué reglas matchean y dónde.
+
+Opcionalmente cada regla declara literales "trigger" (al menos uno debe
+aparecer en el texto para que la regla pueda matchear). Los triggers se
+buscan sobre el texto normalizado una sola vez y la regex combinada se
+arma solo con las reglas candidatas: un mensaje benigno no paga el costo
+de probar todas las alternativas en cada posición.
+
+Además se puede indicar un "guard": un prefijo (típicamente un lookahead)
+que TODA regla exige en su posición inicial. La regex combinada lo evalúa
+una vez por posición y descarta rápido las que no pueden iniciar un match.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional
+
+
+# Caracteres no-ASCII que re.IGNORECASE considera iguales a una letra ASCII
+# (ej: "ſhow" matchea "show"). Se mapean antes de lower() para que el
+# prefiltro de triggers nunca descarte una regla que la regex matchearía.
+_IGNORECASE_ASCII_FOLD = {
+    "\u0130": "i",  # İ
+    "\u0131": "i",  # ı
+    "\u017f": "s",  # ſ
+    "\u212a": "k",  # K (Kelvin)
+}
+
+
+def fold_for_triggers(text: str) -> str:
+    """Normaliza el texto para buscar triggers (equivalente a re.IGNORECASE)"""
+    # str.translate es lento con texto no-ASCII: reemplazar solo si aparecen
+    if not text.isascii():
+        for char, ascii_char in _IGNORECASE_ASCII_FOLD.items():
+            if char in text:
+                text = text.replace(char, ascii_char)
+    return text.lower()
+
+
+class RuleMatch(NamedTuple):
+    """Primera aparición de una regla en el texto"""
+    rule_id: str
+    start: int
+    end: int
+
+
+class MultiPatternScanner:
+    """
+    Escáner de múltiples reglas con una sola regex compilada
+
+    scan() retorna, para cada regla que matchea, su match más a la
+    izquierda. Cuando una regla matchea se excluye y la búsqueda continúa
+    DESDE esa misma posición con las reglas restantes: ninguna regla puede
+    matchear antes (la regex combinada encontró el match más a la
+    izquierda), así que el texto se recorre una sola vez aunque varias
+    reglas se solapen en la misma zona.
+    """
+
+    def __init__(
+        self,
+        rules: Dict[str, str],
+        flags: int = 0,
+        triggers: Optional[Dict[str, Iterable[str]]] = None,
+        guard: str = ""
+    ):
+        for rule_id in rules:
+            if not rule_id.isidentifier():
+                raise ValueError(f"rule_id inválido (debe ser identificador): {rule_id!r}")
+
+        self.rules = dict(rules)
+        self.flags = flags
+        self.guard = guard
+        self._rule_ids: FrozenSet[str] = frozenset(rules)
+
+        # Reglas sin triggers son siempre candidatas
+        self._triggers: Dict[str, FrozenSet[str]] = {}
+        for rule_id, literals in (triggers or {}).items():
+            literals = frozenset(literals)
+            if rule_id not in self.rules:
+                raise ValueError(f"Trigger para regla inexistente: {rule_id!r}")
+            if not literals or any(literal != fold_for_triggers(literal) for literal in literals):
+                raise ValueError(f"Triggers de {rule_id!r} deben ser literales en minúscula")
+            self._triggers[rule_id] = literals
+        self._always_candidates = self._rule_ids - frozenset(self._triggers)
+        self._literals = frozenset().union(*self._triggers.values())
+
+        # Cache de regex combinadas por subconjunto de reglas pendientes
+        self._compile = lru_cache(maxsize=256)(self._compile_rules)
+        self._compile(self._rule_ids)  # Falla al importar si un patrón es inválido
+
+    def _compile_rules(self, rule_ids: FrozenSet[str]) -> "re.Pattern[str]":
+        # Se respeta el orden de declaración: en una misma posición gana la
+        # regla declarada primero (las demás se encuentran en la re-búsqueda)
+        alternatives = "|".join(
+            f"(?P<{rule_id}>{pattern})"
+            for rule_id, pattern in self.rules.items()
+            if rule_id in rule_ids
+        )
+        return re.compile(f"{self.guard}(?:{alternatives})", self.flags)
+
+    def _candidates(self, text: str) -> FrozenSet[str]:
+        """Reglas que pueden matchear (algún trigger aparece en el texto)"""
+        if not self._triggers:
+            return self._rule_ids
+
+        # Cada literal se busca una sola vez aunque lo compartan varias reglas
+        folded = fold_for_triggers(text)
+        present = {literal for literal in self._literals if literal in folded}
+        return self._always_candidates | frozenset(
+            rule_id
+            for rule_id, literals in self._triggers.items()
+            if not literals.isdisjoint(present)
+        )
+
+    def scan(self, text: str) -> List[RuleMatch]:
+        """Retorna el primer match de cada regla, ordenado por posición"""
+        matches: List[RuleMatch] = []
+        remaining = self._candidates(text)
+        pos = 0
+
+        while remaining:
+            match = self._compile(remaining).search(text, pos)
+            if match is None:
+                break
+
+            # El grupo nombrado externo es el último en cerrarse: lastgroup
+            # identifica la regla aunque el patrón tenga grupos internos
+            rule_id = match.lastgroup
+            matches.append(RuleMatch(rule_id, match.start(), match.end()))
+            remaining = remaining - {rule_id}
+            pos = match.start()
+
+        return matches
+
+    def finditer(self, text: str) -> Iterator[RuleMatch]:
+        """
+        Tokeniza el texto: matches sin solapamiento, de izquierda a derecha
+
+        Si dos reglas matchean en la misma posición gana la declarada
+        primero; el texto consumido por un match no se vuelve a evaluar.
+        Las reglas descartadas por el prefiltro no pueden matchear, así que
+        el resultado es el mismo que tokenizar con todas las reglas.
+        """
+        candidates = self._candidates(text)
+        if not candidates:
+            return
+
+        for match in self._compile(candidates).finditer(text):
+            yield RuleMatch(match.lastgroup, match.start(), match.end())
+
+    def matched_rule_ids(self, text: str) -> List[str]:
+        """IDs de las reglas que matchean, en orden de declaración"""
+        found = {m.rule_id for m in self.scan(text)}
+        return [rule_id for rule_id in self.rules if rule_id in found]
@@ -0,0 +1,26 @@
+"""
+Tipos de PII y placeholders de redacción (HunterBot)
+
+Módulo sin dependencias de la app: lo usan ai_guardrails (redacta el
+texto) y text_matching (las palabras de los placeholders, como
+"[PASAPORTE REDACTADO]", no identifican ningún producto).
+"""
+from enum import Enum
+
+
+class PIIType(str, Enum):
+    """Tipos de PII detectados"""
+    CREDIT_CARD = "tarjeta_credito"
+    CBU = "cbu"
+    CUIT = "cuit"
+    DNI = "dni"
+    PASSPORT = "pasaporte"
+    EMAIL = "email"
+    PHONE = "telefono"
+
+
+def redaction_placeholder(pii_type: PIIType) -> str:
+    """Reemplazo de un valor redactado por completo: "[DNI REDACTADO]" """
+    if pii_type == PIIType.PHONE:
+        return "[TELÉFONO REDACTADO]"
+    return f"[{pii_type.value.upper()} REDACTADO]"
@@ -0,0 +1,117 @@
+"""
+Cache de respuestas de HunterBot por tenant (LRU + TTL)
+
+Preguntas casi idénticas ("¿Cuánto cuesta Bariloche?") no vuelven a Claude.
+La clave combina el input ya sanitizado (PII redactada) y normalizado con
+un fingerprint del contexto financiero usado para armar el system prompt:
+si un precio cambia en la DB, el fingerprint cambia y la entrada vieja deja
+de matchear. invalidate_tenant() descarta todo lo de un tenant.
+
+La cache es por worker (como los leases del rate limiter): no comparte
+estado entre procesos. Guarda la respuesta CRUDA de Claude; quien la lee
+debe volver a pasarla por los guardrails de salida.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence
+
+from pydantic import BaseModel
+
+from app.services.text_matching import normalize_text
+from config import settings
+
+
+class _CacheEntry:
+    __slots__ = ("response", "expires_at")
+
+    def __init__(self, response: str, expires_at: float):
+        self.response = response
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """Cache LRU + TTL de respuestas, particionada por tenant"""
+
+    def __init__(self, max_entries_per_tenant: int, ttl_seconds: float, max_tenants: int = 1000):
+        self.max_entries_per_tenant = max_entries_per_tenant
+        self.ttl_seconds = ttl_seconds
+        self.max_tenants = max_tenants
+        # tenant_id -> (clave -> entrada); ambos niveles en orden LRU
+        self._tenants: "OrderedDict[str, OrderedDict[str, _CacheEntry]]" = OrderedDict()
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(sanitized_input: str, financial_context: Optional[Sequence[BaseModel]]) -> str:
+        """Clave = input normalizado + fingerprint del contexto financiero"""
+        fingerprint = "|".join(
+            producto.model_dump_json() for producto in financial_context
+        ) if financial_context else "-"
+        raw = f"{normalize_text(sanitized_input)}\x00{fingerprint}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, tenant_id: str, key: str) -> Optional[str]:
+        entries = self._tenants.get(tenant_id)
+        entry = entries.get(key) if entries else None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry.expires_at <= time.monotonic():
+            del entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        entries.move_to_end(key)
+        self._tenants.move_to_end(tenant_id)
+        self.hits += 1
+        return entry.response
+
+    def set(self, tenant_id: str, key: str, response: str) -> None:
+        entries = self._tenants.get(tenant_id)
+        if entries is None:
+            entries = self._tenants[tenant_id] = OrderedDict()
+            if len(self._tenants) > self.max_tenants:
+                _, evicted = self._tenants.popitem(last=False)
+                self.evictions += len(evicted)
+        self._tenants.move_to_end(tenant_id)
+
+        entries[key] = _CacheEntry(response, time.monotonic() + self.ttl_seconds)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries_per_tenant:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate_tenant(self, tenant_id: str) -> None:
+        """Descarta todas las respuestas de un tenant (ej: cambiaron productos)"""
+        if self._tenants.pop(tenant_id, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas para /health"""
+        lookups = self.hits + self.misses
+        return {
+            "tenants": len(self._tenants),
+            "entries": sum(len(entries) for entries in self._tenants.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+# Cache global de HunterBot (una por worker)
+response_cache = ResponseCache(
+    max_entries_per_tenant=settings.HUNTERBOT_CACHE_MAX_ENTRIES_PER_TENANT,
+    ttl_seconds=settings.HUNTERBOT_CACHE_TTL_SECONDS
+)
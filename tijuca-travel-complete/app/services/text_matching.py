@@ -0,0 +1,222 @@
+"""
+Utilidades de normalización de texto (HunterBot)
+
+Normaliza mensajes en español para compararlos sin importar mayúsculas,
+acentos, signos de puntuación ni espacios: "¿Cuánto cuesta Bariloche?" y
+"cuanto cuesta bariloche" producen el mismo texto.
+
+PhraseMatcher busca muchas frases a la vez (destinos, nombres de
+productos) sobre ese texto normalizado; KeywordMatcher lo usa para
+detectar intenciones ("precio", "cotización") en una pasada.
+"""
+import re
+import unicodedata
+from collections import deque
+from typing import Dict, Generic, Iterable, Iterator, List, Sequence, Set, Tuple, TypeVar, Union
+
+from app.services.pii import PIIType, redaction_placeholder
+
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s\[\]]")
+_WHITESPACE_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+T = TypeVar("T")
+
+# Texto crudo o palabras ya separadas con split_words (para normalizar
+# una sola vez y pasar el resultado a varios matchers)
+TextOrWords = Union[str, Sequence[str]]
+
+
+def strip_accents(text: str) -> str:
+    """Quita tildes y diéresis (á → a, ü → u); la ñ pasa a n"""
+    if text.isascii():
+        return text
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def normalize_text(text: str) -> str:
+    """
+    Minúsculas, sin acentos, sin puntuación y con espacios colapsados
+
+    Se conservan los corchetes para que los placeholders de redacción
+    ("[DNI REDACTADO]") no se confundan con texto del usuario.
+    """
+    text = strip_accents(text.casefold())
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def split_words(text: TextOrWords) -> Sequence[str]:
+    """Palabras normalizadas (letras y dígitos); una lista se devuelve tal cual"""
+    if isinstance(text, str):
+        # Mismas palabras que normalize_text(), sin pasar por las regex de
+        # puntuación y espacios (_WORD_RE ya corta en cualquier otro carácter)
+        return _WORD_RE.findall(strip_accents(text.casefold()))
+    return text
+
+
+# Palabras que no identifican un producto: artículos, preposiciones y
+# preguntas de precio (ya normalizadas), más las de los placeholders de
+# redacción ("[PASAPORTE REDACTADO]"), que salen de PIIType
+STOPWORDS = frozenset("""
+    a al ante con contra de del desde el en entre es hacia hasta la las le
+    lo los me mi para pero por que se sin sobre su sus te tu un una unos
+    unas y o u ya yo
+    hola buenas buen dia dias tardes noches gracias quiero queria quisiera
+    saber tenes tiene tienen hay como cual cuales cuando donde ir viajar
+    cuanto cuanta cuantos cuantas cuesta cuestan sale salen vale valen
+    precio precios costo costos tarifa tarifas cotizacion presupuesto
+    monto total
+""".split()) | frozenset(
+    word
+    for pii_type in PIIType
+    for word in split_words(redaction_placeholder(pii_type))
+)
+
+
+def _stem(word: str) -> str:
+    """Singular aproximado (ej: hoteles → hotel, vuelos → vuelo)"""
+    if len(word) > 4 and word.endswith("es"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: TextOrWords) -> List[str]:
+    """
+    Palabras normalizadas que identifican un producto (sin stopwords)
+
+    Aproxima en Python lo que hace la configuración es_unaccent de
+    PostgreSQL: "¿Cuánto cuestan los hoteles en Cancún?" → ["hotel", "cancun"]
+    """
+    return [
+        _stem(word)
+        for word in split_words(text)
+        if word not in STOPWORDS
+    ]
+
+
+# =====================================================================
+# AHO-CORASICK SOBRE PALABRAS (GAZETTEER)
+# =====================================================================
+
+class PhraseMatcher(Generic[T]):
+    """
+    Encuentra frases conocidas en un texto en UNA pasada (Aho-Corasick)
+
+    El autómata trabaja sobre palabras normalizadas, no caracteres: los
+    límites de palabra salen gratis ("roma" no matchea dentro de
+    "romance") y los nodos son muchos menos que con un trie de letras.
+
+        matcher = PhraseMatcher([("san carlos de bariloche", "BRC"), ("bariloche", "BRC")])
+        matcher.find("¿Cuánto sale San Carlos de Bariloche?")  # ["BRC"]
+    """
+
+    def __init__(self, phrases: Iterable[Tuple[str, T]] = ()):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Por nodo: (largo en palabras, valor) de las frases que terminan ahí
+        self._out: List[List[Tuple[int, T]]] = [[]]
+        self._built = False
+        self._size = 0
+        for phrase, value in phrases:
+            self.add(phrase, value)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, phrase: str, value: T) -> None:
+        if self._built:
+            raise RuntimeError("PhraseMatcher ya compilado: crear uno nuevo")
+        words = split_words(phrase)
+        if not words:
+            return
+        node = 0
+        for word in words:
+            next_node = self._goto[node].get(word)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][word] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = next_node
+        self._out[node].append((len(words), value))
+        self._size += 1
+
+    def compile(self) -> "PhraseMatcher[T]":
+        """
+        Arma el autómata ya (si no, lo arma el primer find): con muchas
+        frases conviene hacerlo fuera del event loop. Después no se pueden
+        agregar frases
+        """
+        if not self._built:
+            self._build()
+        return self
+
+    def _build(self) -> None:
+        # Links de falla por BFS; cada nodo hereda las salidas de su falla
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for word, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(word, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+        self._built = True
+
+    def finditer(self, text: TextOrWords) -> Iterator[Tuple[int, int, T]]:
+        """Todas las apariciones (también superpuestas): (inicio, fin, valor) en palabras"""
+        if not self._built:
+            self._build()
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for position, word in enumerate(split_words(text)):
+            while node and word not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(word, 0)
+            for length, value in out[node]:
+                yield position + 1 - length, position + 1, value
+
+    def find(self, text: TextOrWords) -> List[T]:
+        """
+        Valores de las frases encontradas en orden de aparición, sin
+        superposición: gana la que empieza antes y, entre ésas, la más
+        larga ("san carlos de bariloche" sobre "bariloche")
+        """
+        matches = sorted(self.finditer(text), key=lambda m: (m[0], m[0] - m[1]))
+        found = []
+        covered_until = 0
+        for start, end, value in matches:
+            if start >= covered_until:
+                found.append(value)
+                covered_until = end
+        return found
+
+
+class KeywordMatcher(PhraseMatcher[str]):
+    """
+    Palabras clave agrupadas por intención, sin acentos y por palabra
+    completa ("vale" no matchea en "equivale")
+
+        matcher = KeywordMatcher({"precio": ["precio", "cuánto sale"]})
+        matcher.intents("¿Cuanto sale Bariloche?")  # {"precio"}
+    """
+
+    def __init__(self, keywords_by_intent: Dict[str, Iterable[str]]):
+        super().__init__(
+            (keyword, intent)
+            for intent, keywords in keywords_by_intent.items()
+            for keyword in keywords
+        )
+
+    def intents(self, text: TextOrWords) -> Set[str]:
+        """Intenciones con al menos una palabra clave en el texto"""
+        return {intent for _, _, intent in self.finditer(text)}
@@ -0,0 +1,191 @@
+"""
+=====================================================================
+BENCHMARK - AUDIT LOG EN SEGUNDO PLANO (audit_writer.py)
+=====================================================================
+Compara, sin PostgreSQL, el costo que paga un request de HunterBot para
+registrar un evento de seguridad:
+
+1. Antes: sesión + insert_security_log() + commit por evento (inline)
+2. Ahora: audit_writer.submit() (encolar) + escritura en lotes
+3. DB caída: los eventos van al archivo JSONL y se reinsertan cuando
+   la DB vuelve (sin perder ni duplicar eventos)
+
+La "DB" es una sesión falsa con latencia fija por round trip
+(DB_ROUND_TRIP_MS), igual para ambos enfoques.
+
+Ejecutar desde la raíz del proyecto:
+    python benchmarks/bench_audit_writer.py
+=====================================================================
+"""
+
+import asyncio
+import json
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.audit_writer import AuditWriter
+
+
+DB_ROUND_TRIP_MS = 2.0
+EVENTOS = 5_000
+CONCURRENCIA = 50
+
+
+# =====================================================================
+# "DB" EN MEMORIA
+# =====================================================================
+
+class FakeDB:
+    def __init__(self):
+        self.rows = []
+        self.round_trips = 0
+        self.down = False
+
+    @asynccontextmanager
+    async def session(self):
+        yield FakeSession(self)
+
+
+class FakeSession:
+    def __init__(self, db: FakeDB):
+        self.db = db
+        self.pending = []
+
+    async def execute(self, statement, params):
+        self.db.round_trips += 1
+        await asyncio.sleep(DB_ROUND_TRIP_MS / 1000)
+        if self.db.down:
+            raise ConnectionError("connection refused")
+        if "events" in params:
+            self.pending.extend(json.loads(params["events"]))
+        else:
+            self.pending.append(params)
+
+    async def commit(self):
+        self.db.round_trips += 1
+        await asyncio.sleep(DB_ROUND_TRIP_MS / 1000)
+        self.db.rows.extend(self.pending)
+        self.pending = []
+
+
+def event(i: int) -> dict:
+    return {
+        "agencia_id": "550e8400-e29b-41d4-a716-446655440000",
+        "action_type": "AI_GUARDRAIL_TRIGGERED",
+        "resource_type": "hunterbot",
+        "action_description": f"Guardrails triggered: ['evento {i}']",
+        "old_value": {"user_message": f"mensaje {i}"},
+        "new_value": {"threat_level": "medium", "seq": i},
+        "severity": "warning",
+        "tags": ["ai", "security", "guardrails"],
+        "is_suspicious": False,
+    }
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+# =====================================================================
+# MEDICIONES
+# =====================================================================
+
+async def inline(db: FakeDB, count: int) -> list:
+    """Como antes: cada request espera su INSERT + commit"""
+    timings = []
+
+    async def request(i):
+        start = time.perf_counter()
+        async with db.session() as session:
+            await session.execute("SELECT insert_security_log(...)", event(i))
+            await session.commit()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    for offset in range(0, count, CONCURRENCIA):
+        await asyncio.gather(*(request(i) for i in range(offset, min(count, offset + CONCURRENCIA))))
+    return timings
+
+
+async def batched(writer: AuditWriter, count: int, first: int = 0) -> list:
+    timings = []
+
+    async def request(i):
+        start = time.perf_counter()
+        writer.submit(event(i))
+        timings.append((time.perf_counter() - start) * 1000)
+
+    for offset in range(first, first + count, CONCURRENCIA):
+        await asyncio.gather(*(request(i) for i in range(offset, min(first + count, offset + CONCURRENCIA))))
+        await asyncio.sleep(0)  # Otros requests / la tarea del writer
+    return timings
+
+
+async def wait_drained(writer: AuditWriter) -> None:
+    await writer._queue.join()
+
+
+async def main() -> None:
+    print(f"Round trip de la \"DB\": {DB_ROUND_TRIP_MS} ms, {EVENTOS:,} eventos, "
+          f"{CONCURRENCIA} requests concurrentes\n")
+
+    # 1. Inline (antes)
+    db = FakeDB()
+    start = time.perf_counter()
+    timings = await inline(db, EVENTOS)
+    elapsed = time.perf_counter() - start
+    print(f"{'enfoque':<10}{'p50 (ms)':>10}{'p99 (ms)':>10}{'round trips':>13}{'total (s)':>11}")
+    print(f"{'inline':<10}{statistics.median(timings):>10.3f}{percentile(timings, 99):>10.3f}"
+          f"{db.round_trips:>13,}{elapsed:>11.2f}")
+
+    # 2. En lotes (ahora)
+    with tempfile.TemporaryDirectory() as tmp:
+        spill = Path(tmp) / "audit_spill.jsonl"
+        db = FakeDB()
+        writer = AuditWriter(
+            max_queue_events=10_000, batch_max_events=500, flush_interval_seconds=0.05,
+            write_timeout_seconds=1.0, spill_path=str(spill), spill_retry_seconds=0.2
+        )
+        writer.start(db.session)
+        start = time.perf_counter()
+        timings = await batched(writer, EVENTOS)
+        await wait_drained(writer)
+        elapsed = time.perf_counter() - start
+        print(f"{'lotes':<10}{statistics.median(timings):>10.3f}{percentile(timings, 99):>10.3f}"
+              f"{db.round_trips:>13,}{elapsed:>11.2f}")
+        stats = writer.stats()
+        print(f"  escritos: {len(db.rows):,} en {stats['batches']} lotes "
+              f"(promedio {stats['avg_batch_size']}), lag máximo {stats['max_lag_ms']} ms")
+
+        # 3. DB caída y recuperación
+        db.down = True
+        await batched(writer, 1_000, first=EVENTOS)
+        await wait_drained(writer)
+        lines = sum(1 for _ in open(spill)) if spill.exists() else 0
+        print(f"\nDB caída: {writer.stats()['write_failures']} lotes fallidos, "
+              f"{lines:,} eventos en {spill.name}")
+
+        db.down = False
+        await batched(writer, 100, first=EVENTOS + 1_000)
+        await wait_drained(writer)
+        for _ in range(50):
+            if not writer.stats()["spill_pending"]:
+                break
+            await asyncio.sleep(0.1)
+        seqs = [row["new_value"]["seq"] for row in db.rows]
+        print(f"DB de vuelta: {writer.stats()['replayed']:,} reinsertados, "
+              f"{len(seqs):,} filas, {len(set(seqs)):,} eventos distintos "
+              f"(esperados {EVENTOS + 1_100:,})")
+
+        await writer.stop()
+        print(f"\n/health → audit: {writer.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
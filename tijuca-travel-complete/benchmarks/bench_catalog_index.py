@@ -0,0 +1,205 @@
+"""
+=====================================================================
+BENCHMARK - ÍNDICE DE CATÁLOGO EN MEMORIA (fetch_financial_data)
+=====================================================================
+Mide, sin PostgreSQL, el índice por tenant de catalog_index.py sobre un
+catálogo sintético de 20k productos (el máximo por defecto):
+
+1. Carga completa del índice (con el gazetteer de destinos)
+2. Latencia de búsqueda (µs) con mensajes reales de usuarios, incluida
+   la extracción de varios destinos en un mensaje
+3. Refresco incremental tras cambiar precios y borrar productos, y
+   que el precio nuevo se sirva dentro de la ventana de frescura
+
+La "DB" es una tabla en memoria que responde las tres queries del
+índice; para comparar contra buscar_productos() sobre Postgres real ver
+bench_productos_search.py.
+
+Ejecutar desde la raíz del proyecto:
+    python benchmarks/bench_catalog_index.py
+=====================================================================
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.catalog_index import CatalogIndex
+from app.services.response_cache import response_cache
+
+
+PRODUCTOS = 20_000
+TENANT_ID = str(uuid.uuid4())
+
+DESTINOS = [
+    "San Carlos de Bariloche", "Mendoza", "Salta", "Ushuaia", "El Calafate",
+    "Puerto Iguazú", "Mar del Plata", "Córdoba", "Jujuy", "Puerto Madryn",
+    "Miami", "Orlando", "Nueva York", "Cancún", "Punta Cana", "Río de Janeiro",
+    "Florianópolis", "Búzios", "Madrid", "Barcelona", "Roma", "París",
+    "Londres", "Lisboa", "Caribe", "Cusco", "Santiago de Chile", "Montevideo",
+    "Punta del Este", "Aruba",
+]
+
+PLANTILLAS = [
+    "Paquete a {d} {n} días con hotel",
+    "Vuelo + Hotel {d} {n} noches",
+    "Excursión de día completo en {d}",
+    "Crucero con escala en {d} {n} noches",
+    "Escapada de fin de semana a {d}",
+    "Tour gastronómico por {d}",
+]
+
+MENSAJES = {
+    "destino":      "¿Cuánto cuesta un paquete a Bariloche?",
+    "sin acentos":  "cuanto sale ir a cancun",
+    "typo":         "precio para bariloce en julio",
+    "descripción":  "¿Qué precio tiene el tour gastronómico?",
+    "sin match":    "hola, ¿cuál es el presupuesto?",
+    "2 destinos":   "¿Qué conviene más, Bariloche o Punta Cana en crucero?",
+    "otro destino": "¿Cuánto sale un paquete a Tokio?",
+}
+
+
+# =====================================================================
+# "DB" EN MEMORIA
+# =====================================================================
+
+class FakeTable:
+    def __init__(self):
+        self.clock = datetime.now(timezone.utc)
+        self.rows = {}
+        for g in range(1, PRODUCTOS + 1):
+            destino = DESTINOS[(g // 7) % len(DESTINOS)]
+            descripcion = PLANTILLAS[g % len(PLANTILLAS)].format(d=destino, n=3 + g % 12) + f" #{g}"
+            self.rows[uuid.uuid4()] = self._row(descripcion, destino, 500 + g % 5000)
+        self.queries = 0
+
+    def _row(self, descripcion, destino, precio):
+        return {
+            "descripcion": descripcion, "destino": destino, "moneda": "USD",
+            "precio_base": Decimal(precio), "precio_total": Decimal(precio) * Decimal("1.3"),
+            "disponible": True, "updated_at": self.clock,
+        }
+
+    def tick(self, seconds: float) -> None:
+        self.clock += timedelta(seconds=seconds)
+
+    def update_price(self, producto_id, precio) -> None:
+        row = self.rows[producto_id]
+        row.update(precio_base=Decimal(precio), precio_total=Decimal(precio), updated_at=self.clock)
+
+    def records(self, predicate):
+        return [
+            (pid, r["descripcion"], r["destino"], r["precio_base"], r["moneda"],
+             None, None, r["precio_total"], r["disponible"])
+            for pid, r in self.rows.items() if predicate(r)
+        ]
+
+
+class FakeResult(list):
+    def one(self):
+        return self[0]
+
+    def all(self):
+        return list(self)
+
+
+class FakeSession:
+    def __init__(self, table: FakeTable):
+        self.table = table
+
+    async def execute(self, statement, params):
+        self.table.queries += 1
+        sql = str(statement)
+        if "clock_timestamp()" in sql:
+            available = sum(1 for r in self.table.rows.values() if r["disponible"])
+            return FakeResult([(self.table.clock, available)])
+        if "updated_at >" in sql:
+            return FakeResult(self.table.records(lambda r: r["updated_at"] > params["since"]))
+        return FakeResult(self.table.records(lambda r: r["disponible"]))
+
+
+def session_factory_for(table: FakeTable):
+    @asynccontextmanager
+    async def factory():
+        yield FakeSession(table)
+    return factory
+
+
+# =====================================================================
+# MEDICIONES
+# =====================================================================
+
+async def main() -> None:
+    table = FakeTable()
+    factory = session_factory_for(table)
+    index = CatalogIndex(max_staleness_seconds=60, max_products_per_tenant=PRODUCTOS, max_tenants=10)
+
+    start = time.perf_counter()
+    await index.search(TENANT_ID, "bariloche", factory)
+    print(f"Carga completa: {PRODUCTOS:,} productos en {(time.perf_counter() - start) * 1000:.0f} ms "
+          f"(armado del índice en un thread)\n")
+
+    print(f"{'mensaje':<14}{'1ra vez (µs)':>14}{'repetido (µs)':>15}  resultado")
+    for label, mensaje in MENSAJES.items():
+        start = time.perf_counter()
+        rows = await index.search(TENANT_ID, mensaje, factory, limit=3)
+        first = (time.perf_counter() - start) * 1e6
+        timings = []
+        for _ in range(200):
+            start = time.perf_counter()
+            await index.search(TENANT_ID, mensaje, factory, limit=3)
+            timings.append((time.perf_counter() - start) * 1e6)
+        found = " + ".join(f"{row[2]} - {row[1]} ({row[7]:.0f} {row[4]})" for row in rows) or "sin match"
+        print(f"{label:<14}{first:>14.1f}{statistics.median(timings):>15.1f}  {found}")
+
+    # Cambios de precio: dentro de la ventana se sirve lo indexado, pasada
+    # la ventana se aplica un refresco incremental
+    index.max_staleness_seconds = 0.5
+    await asyncio.sleep(0.5)
+    best, = await index.search(TENANT_ID, MENSAJES["destino"], factory)
+    response_cache.set(TENANT_ID, "clave", "respuesta vieja")
+
+    table.tick(10)
+    for producto_id in list(table.rows)[:50]:
+        table.update_price(producto_id, 99)
+    table.update_price(uuid.UUID(best[0]), 1)
+
+    row, = await index.search(TENANT_ID, MENSAJES["destino"], factory)
+    print(f"\nPrecio cambiado en la DB, dentro de la ventana (0.5 s): se sirve {row[7]:.0f}")
+
+    await asyncio.sleep(0.5)
+    queries = table.queries
+    start = time.perf_counter()
+    row, = await index.search(TENANT_ID, MENSAJES["destino"], factory)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"Pasada la ventana: se sirve {row[7]:.0f} "
+          f"(refresco incremental en {elapsed:.1f} ms, {table.queries - queries} queries)")
+    print(f"Cache de respuestas del tenant invalidada: {response_cache.get(TENANT_ID, 'clave') is None}")
+
+    # Borrados: no dejan updated_at, el conteo fuerza una recarga completa
+    table.tick(10)
+    for producto_id in list(table.rows)[-10:]:
+        del table.rows[producto_id]
+    await asyncio.sleep(0.5)
+    queries = table.queries
+    start = time.perf_counter()
+    await index.search(TENANT_ID, MENSAJES["destino"], factory)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"10 productos borrados: recarga completa en {elapsed:.0f} ms ({table.queries - queries} queries)")
+    print("(las queries de la \"DB\" en memoria recorren la tabla entera: el tiempo de refresco")
+    print(" incluye ese costo, que en PostgreSQL resuelven los índices)")
+
+    print(f"\n/health → catalog_index: {index.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
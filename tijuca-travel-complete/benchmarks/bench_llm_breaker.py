@@ -0,0 +1,112 @@
+"""
+=====================================================================
+BENCHMARK - LÍMITES DE CONCURRENCIA Y CIRCUIT BREAKER (HunterBot)
+=====================================================================
+Levanta el stub local de Anthropic (stub_llm_server.py) en el mismo
+proceso y recorre tres fases contra SecureHunterBot.process_message:
+
+1. Upstream sano: ráfaga concurrente de 2 tenants (se respetan los
+   límites por worker y por tenant)
+2. Upstream colgado: las llamadas cortan por timeout hasta que el breaker
+   se abre; desde ahí el fallback sale al instante
+3. Recuperación: pasado el reset, una llamada de prueba cierra el breaker
+
+Ejecutar desde la raíz del proyecto:
+    python benchmarks/bench_llm_breaker.py
+=====================================================================
+"""
+
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+PORT = 8787
+
+# Configuración agresiva para que el escenario dure segundos (antes de
+# importar la app: settings se lee al importar)
+os.environ.update({
+    "ANTHROPIC_API_KEY": "stub",
+    "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{PORT}",
+    "ANTHROPIC_MAX_RETRIES": "0",
+    "HUNTERBOT_MAX_CONCURRENT_CALLS": "6",
+    "HUNTERBOT_MAX_CONCURRENT_CALLS_PER_TENANT": "4",
+    "HUNTERBOT_QUEUE_TIMEOUT_SECONDS": "1",
+    "HUNTERBOT_CALL_TIMEOUT_SECONDS": "0.5",
+    "HUNTERBOT_BREAKER_FAILURE_THRESHOLD": "3",
+    "HUNTERBOT_BREAKER_RESET_SECONDS": "2",
+})
+
+import uvicorn
+
+from app.services.ai_guardrails import SecureHunterBot
+from app.services.llm_client import init_anthropic_client, close_anthropic_client, llm_guard
+from benchmarks import stub_llm_server as stub
+
+
+@asynccontextmanager
+async def no_db():
+    # Sin Postgres: fetch_financial_data falla y sigue sin contexto financiero
+    yield None
+
+
+async def ask(tenant_id: str, text: str):
+    bot = SecureHunterBot(session_factory=no_db, anthropic_client=init_anthropic_client(), tenant_id=tenant_id)
+    start = time.perf_counter()
+    result = await bot.process_message(text)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return elapsed_ms, result.get("metadata", {}).get("fallback") or ("ok" if result["success"] else "error")
+
+
+def show(label: str, results) -> None:
+    outcomes = {}
+    for _, outcome in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    latencies = sorted(ms for ms, _ in results)
+    print(f"\n{label}")
+    print(f"  resultados: {outcomes}")
+    print(f"  latencia:   min={latencies[0]:.0f} ms  max={latencies[-1]:.0f} ms")
+    print(f"  breaker:    {llm_guard.breaker.stats()}")
+
+
+async def main() -> None:
+    server = uvicorn.Server(uvicorn.Config(stub.app, host="127.0.0.1", port=PORT, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    # FASE 1: ráfaga de 12 mensajes (8 del tenant A, 4 del B), stub a 0.2 s
+    stub.MODE.update({"delay": 0.2, "status": 200})
+    results = await asyncio.gather(*(
+        ask("tenant-a" if i < 8 else "tenant-b", f"Hola, consulta número {i} sobre Bariloche")
+        for i in range(12)
+    ))
+    show("FASE 1 - upstream sano (límite 6 por worker, 4 por tenant)", results)
+    print(f"  máximo en vuelo en el stub: {stub.STATS['max_in_flight']}")
+
+    # FASE 2: upstream colgado (10 s > timeout de 0.5 s)
+    stub.MODE.update({"delay": 10})
+    results = [await ask("tenant-a", f"Consulta {i} con upstream colgado") for i in range(8)]
+    show("FASE 2 - upstream colgado (timeout 0.5 s, breaker a los 3 errores)", results)
+    for i, (ms, outcome) in enumerate(results):
+        print(f"    #{i}: {ms:6.0f} ms  {outcome}")
+
+    # FASE 3: upstream recuperado, esperar el reset del breaker
+    stub.MODE.update({"delay": 0.2})
+    await asyncio.sleep(2.1)
+    results = [await ask("tenant-a", f"Consulta {i} después de recuperarse") for i in range(3)]
+    show("FASE 3 - recuperación (half_open → closed)", results)
+
+    print(f"\n/health → llm: {llm_guard.stats()}")
+
+    await close_anthropic_client()
+    server.should_exit = True
+    await server_task
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,170 @@
+"""
+=====================================================================
+BENCHMARK - MIDDLEWARE ASGI vs BaseHTTPMiddleware
+=====================================================================
+Compara la latencia de /api/ventas con los middlewares de seguridad
+anteriores (BaseHTTPMiddleware + request.json()) y los actuales (ASGI
+puro). El endpoint es un stub en memoria: se mide solo el overhead del
+stack de middlewares, sin PostgreSQL ni Redis.
+
+Ejecutar desde la raíz del proyecto:
+    python benchmarks/bench_middleware.py [--requests 5000]
+=====================================================================
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.middleware.security import (
+    InputSanitizationMiddleware,
+    SecurityValidator,
+    TenantIsolationMiddleware,
+)
+
+
+# =====================================================================
+# IMPLEMENTACIÓN ANTERIOR (REFERENCIA)
+# =====================================================================
+
+class LegacyTenantIsolationMiddleware(BaseHTTPMiddleware):
+    """TenantIsolationMiddleware previo a la versión ASGI"""
+
+    async def dispatch(self, request: Request, call_next):
+        tenant_context = getattr(request.state, "tenant", None)
+        if tenant_context:
+            request.state.validated_tenant_id = tenant_context.tenant_id
+        return await call_next(request)
+
+
+class LegacyInputSanitizationMiddleware(BaseHTTPMiddleware):
+    """InputSanitizationMiddleware previo a la versión ASGI"""
+
+    async def dispatch(self, request: Request, call_next):
+        if request.query_params:
+            for key, value in request.query_params.items():
+                try:
+                    SecurityValidator.sanitize_sql(value)
+                except HTTPException:
+                    return JSONResponse(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        content={"detail": f"Query parameter '{key}' contiene caracteres prohibidos"}
+                    )
+
+        if request.method in ["POST", "PUT", "PATCH"]:
+            try:
+                await request.json()
+            except Exception:
+                pass
+
+        return await call_next(request)
+
+
+# =====================================================================
+# APP STUB
+# =====================================================================
+
+VENTAS = [
+    {
+        "id": f"00000000-0000-4000-8000-{i:012d}",
+        "cliente_nombre": f"Cliente {i}",
+        "destino": "Bariloche",
+        "monto_total": 850000.0,
+        "moneda": "ARS",
+        "estado": "pendiente",
+    }
+    for i in range(100)
+]
+
+
+class CreateVenta(BaseModel):
+    cliente_nombre: str
+    descripcion: str
+    destino: str
+    moneda: str
+    monto_base: float
+
+
+def build_app(tenant_middleware, sanitization_middleware) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(tenant_middleware)
+    app.add_middleware(sanitization_middleware)
+
+    @app.get("/api/ventas")
+    async def get_ventas(skip: int = 0, limit: int = 100):
+        return VENTAS[skip:skip + limit]
+
+    @app.post("/api/ventas", status_code=201)
+    async def create_venta(venta: CreateVenta):
+        return {"id": VENTAS[0]["id"], **venta.model_dump()}
+
+    return app
+
+
+# =====================================================================
+# MEDICIÓN
+# =====================================================================
+
+async def measure(app: FastAPI, method: str, total: int) -> list[float]:
+    transport = httpx.ASGITransport(app=app)
+    body = {
+        "cliente_nombre": "María López",
+        "descripcion": "Paquete a Miami 7 días " * 20,
+        "destino": "Miami",
+        "moneda": "USD",
+        "monto_base": 1500,
+    }
+    latencies = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm-up
+        for _ in range(50):
+            await client.get("/api/ventas?skip=0&limit=100")
+
+        for _ in range(total):
+            start = time.perf_counter()
+            if method == "GET":
+                response = await client.get("/api/ventas?skip=0&limit=100")
+            else:
+                response = await client.post("/api/ventas", json=body)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code in (200, 201), response.text
+
+    return latencies
+
+
+def report(label: str, latencies: list[float]) -> None:
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"  {label:<28} media={statistics.mean(latencies):7.3f} ms  "
+        f"p50={statistics.median(latencies):7.3f} ms  p99={p99:7.3f} ms"
+    )
+
+
+async def main(total: int) -> None:
+    legacy_app = build_app(LegacyTenantIsolationMiddleware, LegacyInputSanitizationMiddleware)
+    asgi_app = build_app(TenantIsolationMiddleware, InputSanitizationMiddleware)
+
+    for method in ("GET", "POST"):
+        print(f"\n{method} /api/ventas ({total} requests)")
+        report("BaseHTTPMiddleware (antes)", await measure(legacy_app, method, total))
+        report("ASGI puro (después)", await measure(asgi_app, method, total))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de middlewares de seguridad")
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
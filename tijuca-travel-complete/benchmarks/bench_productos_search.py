@@ -0,0 +1,169 @@
+"""
+=====================================================================
+BENCHMARK - BÚSQUEDA DE PRODUCTOS (fetch_financial_data)
+=====================================================================
+Carga un catálogo sintético de 100k productos por tenant (2 tenants) y
+compara la query anterior (LIKE '%mensaje completo%' sobre descripcion
+y destino) contra buscar_productos() de 05_productos_search.sql, con
+mensajes reales de usuarios: destino exacto, sin acentos, con typo,
+por descripción y por un destino que no está en el catálogo (no debe
+devolver ningún producto).
+
+Todo corre dentro de UNA transacción que se descarta al final (ROLLBACK):
+no deja datos en la base. Requiere haber aplicado 05_productos_search.sql
+y un usuario con permiso para insertar en agencias (owner, no tijuca_app).
+
+Ejecutar desde la raíz del proyecto:
+    DATABASE_URL=postgresql+asyncpg://... python benchmarks/bench_productos_search.py
+=====================================================================
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import text
+
+from app.core.database import engine
+
+
+PRODUCTOS_POR_TENANT = 100_000
+REPETICIONES = 20
+
+DESTINOS = [
+    "San Carlos de Bariloche", "Mendoza", "Salta", "Ushuaia", "El Calafate",
+    "Puerto Iguazú", "Mar del Plata", "Córdoba", "Jujuy", "Puerto Madryn",
+    "Miami", "Orlando", "Nueva York", "Cancún", "Punta Cana", "Río de Janeiro",
+    "Florianópolis", "Búzios", "Madrid", "Barcelona", "Roma", "París",
+    "Londres", "Lisboa", "Caribe", "Cusco", "Santiago de Chile", "Montevideo",
+    "Punta del Este", "Aruba",
+]
+
+PLANTILLAS = [
+    "Paquete a {d} {n} días con hotel",
+    "Vuelo + Hotel {d} {n} noches",
+    "Excursión de día completo en {d}",
+    "Crucero con escala en {d} {n} noches",
+    "Escapada de fin de semana a {d}",
+    "Tour gastronómico por {d}",
+]
+
+MENSAJES = {
+    "destino":      "¿Cuánto cuesta un paquete a Bariloche?",
+    "sin acentos":  "cuanto sale ir a cancun",
+    "typo":         "precio para bariloce en julio",
+    "descripción":  "¿Qué precio tiene el tour gastronómico?",
+    "sin match":    "hola, ¿cuál es el presupuesto?",
+    "otro destino": "¿Cuánto sale un paquete a Tokio?",
+}
+
+LEGACY_QUERY = text("""
+    SELECT id, descripcion, destino, precio_total
+    FROM productos
+    WHERE
+        (LOWER(descripcion) LIKE LOWER(:search) OR LOWER(destino) LIKE LOWER(:search))
+        AND disponible = true
+        AND agencia_id = :tenant_id
+    LIMIT 1
+""")
+
+SEARCH_QUERY = text("""
+    SELECT producto_id, descripcion, destino, precio_total, etapa
+    FROM buscar_productos(CAST(:tenant_id AS UUID), :search, 1)
+""")
+
+
+async def seed(conn, tenant_ids) -> None:
+    for i, tenant_id in enumerate(tenant_ids):
+        await conn.execute(text("""
+            INSERT INTO agencias (id, nombre, razon_social, cuit, api_key_hash)
+            VALUES (:id, :nombre, :nombre, :cuit, 'bench')
+        """), {"id": tenant_id, "nombre": f"Bench {i}", "cuit": f"BENCH-{uuid.uuid4().hex[:7]}"})
+
+        # generate_series del lado del servidor: 100k filas sin ida y vuelta
+        await conn.execute(text("""
+            INSERT INTO productos (agencia_id, descripcion, destino, moneda, precio_base, precio_total, disponible)
+            SELECT
+                CAST(:tenant_id AS UUID),
+                replace(replace(
+                    (CAST(:plantillas AS TEXT[]))[1 + g % cardinality(CAST(:plantillas AS TEXT[]))],
+                    '{d}', (CAST(:destinos AS TEXT[]))[1 + (g / 7) % cardinality(CAST(:destinos AS TEXT[]))]),
+                    '{n}', (3 + g % 12)::TEXT
+                ) || ' #' || g,
+                (CAST(:destinos AS TEXT[]))[1 + (g / 7) % cardinality(CAST(:destinos AS TEXT[]))],
+                CASE WHEN g % 3 = 0 THEN 'ARS' ELSE 'USD' END,
+                500 + (g % 5000),
+                (500 + (g % 5000)) * 1.3,
+                g % 10 <> 0
+            FROM generate_series(1, :n) AS g
+        """), {
+            "tenant_id": tenant_id,
+            "plantillas": PLANTILLAS,
+            "destinos": DESTINOS,
+            "n": PRODUCTOS_POR_TENANT,
+        })
+
+    await conn.execute(text("ANALYZE productos"))
+
+
+async def measure(conn, query, params):
+    timings = []
+    row = None
+    for _ in range(REPETICIONES):
+        start = time.perf_counter()
+        row = (await conn.execute(query, params)).fetchone()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), row
+
+
+async def main() -> None:
+    tenant_ids = [str(uuid.uuid4()), str(uuid.uuid4())]
+
+    async with engine.connect() as conn:
+        trans = await conn.begin()
+        try:
+            start = time.perf_counter()
+            await seed(conn, tenant_ids)
+            print(f"Catálogo: {PRODUCTOS_POR_TENANT:,} productos x {len(tenant_ids)} tenants "
+                  f"({time.perf_counter() - start:.1f} s de carga)\n")
+
+            await conn.execute(
+                text("SELECT set_config('app.current_tenant_id', :tenant_id, true)"),
+                {"tenant_id": tenant_ids[0]}
+            )
+
+            print(f"{'mensaje':<14}{'LIKE (ms)':>11}{'buscar (ms)':>13}  resultado")
+            for label, mensaje in MENSAJES.items():
+                legacy_ms, legacy_row = await measure(
+                    conn, LEGACY_QUERY, {"search": f"%{mensaje}%", "tenant_id": tenant_ids[0]}
+                )
+                search_ms, search_row = await measure(
+                    conn, SEARCH_QUERY, {"search": mensaje, "tenant_id": tenant_ids[0]}
+                )
+                legacy = "match" if legacy_row else "sin match"
+                found = f"{search_row.destino} [{search_row.etapa}]" if search_row else "sin match"
+                print(f"{label:<14}{legacy_ms:>11.2f}{search_ms:>13.2f}  LIKE: {legacy} / buscar: {found}")
+
+            print("\nPlan de la etapa 'destino':")
+            plan = await conn.execute(text("""
+                EXPLAIN (ANALYZE, COSTS OFF)
+                SELECT id FROM productos
+                WHERE agencia_id = CAST(:tenant_id AS UUID)
+                  AND disponible = true
+                  AND destino_vector @@ productos_tsquery(:search)
+            """), {"tenant_id": tenant_ids[0], "search": MENSAJES["destino"]})
+            for (line,) in plan:
+                print(f"  {line}")
+        finally:
+            await trans.rollback()
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
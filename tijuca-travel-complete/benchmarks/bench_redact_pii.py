@@ -0,0 +1,120 @@
+"""
+=====================================================================
+BENCHMARK - AIGuardrails.redact_pii
+=====================================================================
+Compara el redactor de una sola pasada (tokenización por prioridad +
+un único join) contra la implementación anterior (re.findall + re.sub
+por tipo de PII, una copia del string por cada tipo encontrado).
+
+El resultado NO es idéntico a propósito: la versión anterior redactaba
+en cascada (ej: el DNI dentro de "12345678@gmail.com" antes que el
+email). Antes de medir se imprimen los casos de solapamiento lado a lado.
+
+Ejecutar desde la raíz del proyecto:
+    python benchmarks/bench_redact_pii.py
+=====================================================================
+"""
+
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.ai_guardrails import AIGuardrails, PIIType
+
+
+# =====================================================================
+# IMPLEMENTACIÓN ANTERIOR (REFERENCIA)
+# =====================================================================
+
+LEGACY_PII_PATTERNS = {
+    PIIType.CREDIT_CARD: r"\b\d{4}[\s\-]?\d{4}[\s\-]?\d{4}[\s\-]?\d{4}\b",
+    PIIType.CBU: r"\b\d{22}\b",
+    PIIType.CUIT: r"\b\d{2}[\s\-]?\d{8}[\s\-]?\d{1}\b",
+    PIIType.DNI: r"\b\d{7,8}\b",
+    PIIType.PASSPORT: r"\b[A-Z]{2,3}\d{6,9}\b",
+    PIIType.EMAIL: r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b",
+    PIIType.PHONE: r"\b(\+54\s?)?(\d{2,4}[\s\-]?)?\d{6,8}\b",
+}
+
+
+def legacy_redact_pii(text: str):
+    redacted_text = text
+    pii_found = []
+
+    for pii_type, pattern in LEGACY_PII_PATTERNS.items():
+        if re.findall(pattern, text, re.IGNORECASE):
+            pii_found.append(pii_type)
+            if pii_type == PIIType.CREDIT_CARD:
+                redacted_text = re.sub(
+                    pattern,
+                    lambda m: "****-****-****-" + re.sub(r'\D', '', m.group(0))[-4:],
+                    redacted_text
+                )
+            elif pii_type == PIIType.EMAIL:
+                redacted_text = re.sub(
+                    pattern,
+                    lambda m: f"{m.group(0)[0]}***@{m.group(0).split('@')[1]}",
+                    redacted_text
+                )
+            elif pii_type == PIIType.PHONE:
+                redacted_text = re.sub(pattern, "[TELÉFONO REDACTADO]", redacted_text)
+            else:
+                redacted_text = re.sub(pattern, f"[{pii_type.value.upper()} REDACTADO]", redacted_text)
+
+    return redacted_text, pii_found
+
+
+# =====================================================================
+# INPUTS
+# =====================================================================
+
+OVERLAPS = [
+    "Mi mail es 12345678@gmail.com",
+    "CUIT 20-12345678-9",
+    "Llamame al 11 45678901",
+    "CBU 1234567890123456789012 y DNI 30123456",
+]
+
+MESSAGES = {
+    "sin PII": "¿Qué paquetes tenemos a Bariloche para julio con hotel incluido?",
+    "con PII": (
+        "Hola, soy Juan (DNI 30123456, CUIT 20-30123456-9). Pago con la "
+        "tarjeta 4532-1234-5678-9010, mail juan.perez@mail.com, tel 11 45678901."
+    ),
+    "respuesta 3KB": (
+        "El paquete a Bariloche incluye 7 noches de hotel, traslados y "
+        "excursiones. Consultá disponibilidad con tu asesor. "
+    ) * 28,
+}
+
+
+# =====================================================================
+# MEDICIÓN
+# =====================================================================
+
+def per_call_us(func, value: str, number: int = 2_000) -> float:
+    return min(timeit.repeat(lambda: func(value), number=number, repeat=3)) / number * 1_000_000
+
+
+def main() -> None:
+    # redact_pii no usa DB ni cliente de Anthropic
+    guardrails = AIGuardrails(db_session=None, anthropic_client=None)
+
+    print("Solapamientos (antes → después)")
+    for value in OVERLAPS:
+        print(f"  {value}")
+        print(f"    antes:   {legacy_redact_pii(value)[0]}")
+        print(f"    después: {guardrails.redact_pii(value)[0]}")
+
+    print(f"\n{'mensaje':<16} {'chars':>6} {'antes (µs)':>12} {'después (µs)':>14} {'speedup':>9}")
+    for label, value in MESSAGES.items():
+        before = per_call_us(legacy_redact_pii, value)
+        after = per_call_us(guardrails.redact_pii, value)
+        print(f"{label:<16} {len(value):>6} {before:>12.1f} {after:>14.1f} {before / after:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
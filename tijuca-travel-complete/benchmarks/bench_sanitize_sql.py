@@ -0,0 +1,126 @@
+"""
+=====================================================================
+BENCHMARK - SecurityValidator.sanitize_sql
+=====================================================================
+Compara el costo por llamada del scanner compilado (una pasada) contra
+la implementación anterior (re.search por patrón + 7 str.replace), con
+inputs típicos de query parameters y con inputs adversariales que
+provocaban backtracking cuadrático.
+
+Antes de medir verifica que ambas implementaciones den el MISMO
+resultado (bloqueado / texto sanitizado) sobre un corpus + fuzzing.
+
+Ejecutar desde la raíz del proyecto:
+    python benchmarks/bench_sanitize_sql.py
+=====================================================================
+"""
+
+import random
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import HTTPException
+
+from app.middleware.security import SecurityConfig, SecurityValidator
+
+
+# =====================================================================
+# IMPLEMENTACIÓN ANTERIOR (REFERENCIA)
+# =====================================================================
+
+def legacy_sanitize_sql(input_string: str) -> str:
+    if not input_string:
+        return input_string
+
+    for pattern in SecurityConfig.SQL_INJECTION_PATTERNS:
+        if re.search(pattern, input_string, re.IGNORECASE):
+            raise HTTPException(status_code=400, detail="blocked")
+
+    for char in ["'", '"', "\\", ";", "--", "/*", "*/"]:
+        input_string = input_string.replace(char, "")
+
+    return input_string.strip()
+
+
+def outcome(func, value: str):
+    try:
+        return ("ok", func(value))
+    except HTTPException:
+        return ("blocked", None)
+
+
+# =====================================================================
+# INPUTS
+# =====================================================================
+
+TYPICAL = {
+    "uuid": "550e8400-e29b-41d4-a716-446655440000",
+    "entero": "100",
+    "destino": "Bariloche",
+    "nombre": "María González",
+    "fecha": "2026-02-09",
+    "búsqueda": "paquete 7 dias hotel all inclusive caribe",
+}
+
+ADVERSARIAL = {
+    "10k comillas": "'" * 10_000,
+    "5k OR sin =": "or " * 5_000,
+    "3k UNION sin SELECT": "union " * 3_000,
+    "10k punto y coma": ";" * 10_000,
+    "4KB benigno": "Bariloche 7 dias con hotel " * 150,
+}
+
+CORPUS = [
+    "", " ", "Bariloche", "1 OR 1=1", "a or b", "x' --", "'; DROP TABLE ventas",
+    "UNION SELECT * FROM agencias", "a;b truncate", "a;b\ntruncate", "or\n=",
+    "precio # comentario", "/* x */", "xp_cmdshell", "-'-", "/'*", "*'/",
+    "Select", "selected", "orden = 1", "valor=1 or", "OR=", "a OR b\nc = d",
+    "c'est la vie", 'dijo "hola"', "C:\\temp", "café;té", "--", "- -",
+]
+
+
+def fuzz_corpus(size: int = 20_000, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    alphabet = list("abor= ;'\"-/*#\\\n") + ["OR", "or ", "truncate", "select", "union", "--"]
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 24))) for _ in range(size)]
+
+
+# =====================================================================
+# MEDICIÓN
+# =====================================================================
+
+def check_equivalence() -> None:
+    inputs = CORPUS + fuzz_corpus() + list(TYPICAL.values())
+    for value in inputs:
+        expected = outcome(legacy_sanitize_sql, value)
+        actual = outcome(SecurityValidator.sanitize_sql, value)
+        assert expected == actual, f"Diferencia para {value!r}: {expected} != {actual}"
+    print(f"Equivalencia OK sobre {len(inputs)} inputs\n")
+
+
+def per_call_us(func, value: str, number: int) -> float:
+    def call():
+        try:
+            func(value)
+        except HTTPException:
+            pass
+    return min(timeit.repeat(call, number=number, repeat=3)) / number * 1_000_000
+
+
+def main() -> None:
+    check_equivalence()
+
+    print(f"{'input':<24} {'antes (µs)':>14} {'después (µs)':>14} {'speedup':>9}")
+    for group, number in ((TYPICAL, 20_000), (ADVERSARIAL, 3)):
+        for label, value in group.items():
+            before = per_call_us(legacy_sanitize_sql, value, number)
+            after = per_call_us(SecurityValidator.sanitize_sql, value, number)
+            print(f"{label:<24} {before:>14.2f} {after:>14.2f} {before / after:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
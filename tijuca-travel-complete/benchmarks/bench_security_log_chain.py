@@ -0,0 +1,149 @@
+"""
+=====================================================================
+BENCHMARK - CADENA DE HASHES DEL AUDIT LOG
+=====================================================================
+Mide, sobre LOGS audit logs de un tenant de prueba
+(09_security_logs_hash_chain.sql):
+
+1. Costo de encadenar: INSERT masivo con y sin el trigger de la cadena
+2. verify_security_log_chain(): una pasada sobre toda la cadena
+3. create_security_log_checkpoints() + verify_security_log_checkpoint()
+4. Detección: se adultera la cadena (log modificado, log borrado,
+   eslabón borrado, final truncado) y se informa el primer eslabón roto
+
+Todo corre dentro de UNA transacción con ROLLBACK al final. Adulterar
+necesita saltear los triggers de inmutabilidad
+(session_replication_role = replica): correr como superusuario.
+
+Ejecutar desde la raíz del proyecto:
+    DATABASE_URL=postgresql+asyncpg://... python benchmarks/bench_security_log_chain.py
+=====================================================================
+"""
+
+import asyncio
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import text
+
+from app.core.database import engine
+
+
+LOGS = 1_000_000
+
+INSERT_LOGS = """
+    INSERT INTO security_logs (
+        agencia_id, action_type, resource_type, action_description,
+        new_value, severity, tags, integrity_hash
+    )
+    SELECT
+        CAST(:tenant_id AS UUID),
+        'AI_GUARDRAIL_TRIGGERED',
+        'hunterbot',
+        'Evento bench #' || g,
+        jsonb_build_object('seq', g),
+        'info',
+        ARRAY['ai', 'bench'],
+        md5(g::TEXT) || md5(g::TEXT)
+    FROM generate_series(1, :n) AS g
+"""
+
+VERIFY = "SELECT * FROM verify_security_log_chain(CAST(:tenant_id AS UUID))"
+
+ADULTERACIONES = {
+    "log modificado": """
+        UPDATE security_logs SET action_description = 'adulterado'
+        WHERE id = (SELECT log_id FROM security_log_chain
+                    WHERE agencia_id = CAST(:tenant_id AS UUID) AND chain_seq = :seq)
+    """,
+    "log borrado": """
+        DELETE FROM security_logs
+        WHERE id = (SELECT log_id FROM security_log_chain
+                    WHERE agencia_id = CAST(:tenant_id AS UUID) AND chain_seq = :seq)
+    """,
+    "eslabón borrado": """
+        DELETE FROM security_logs
+        WHERE id = (SELECT log_id FROM security_log_chain
+                    WHERE agencia_id = CAST(:tenant_id AS UUID) AND chain_seq = :seq);
+        DELETE FROM security_log_chain
+        WHERE agencia_id = CAST(:tenant_id AS UUID) AND chain_seq = :seq
+    """,
+    "final truncado": """
+        DELETE FROM security_logs
+        WHERE id IN (SELECT log_id FROM security_log_chain
+                     WHERE agencia_id = CAST(:tenant_id AS UUID) AND chain_seq > :seq);
+        DELETE FROM security_log_chain
+        WHERE agencia_id = CAST(:tenant_id AS UUID) AND chain_seq > :seq
+    """,
+}
+
+
+async def timed(conn, sql, params):
+    start = time.perf_counter()
+    result = await conn.execute(text(sql), params)
+    return result, time.perf_counter() - start
+
+
+async def main() -> None:
+    tenant_id = str(uuid.uuid4())
+    params = {"tenant_id": tenant_id, "n": LOGS}
+
+    async with engine.connect() as conn:
+        trans = await conn.begin()
+        try:
+            await conn.execute(text("""
+                INSERT INTO agencias (id, nombre, razon_social, cuit, api_key_hash)
+                VALUES (:id, 'Bench', 'Bench', :cuit, 'bench')
+            """), {"id": tenant_id, "cuit": f"BENCH-{uuid.uuid4().hex[:7]}"})
+
+            # 1. Costo de encadenar
+            savepoint = await conn.begin_nested()
+            await conn.execute(text("ALTER TABLE security_logs DISABLE TRIGGER security_logs_hash_chain"))
+            _, plain = await timed(conn, INSERT_LOGS, params)
+            await savepoint.rollback()
+
+            _, chained = await timed(conn, INSERT_LOGS, params)
+            await conn.execute(text("ANALYZE security_logs"))
+            await conn.execute(text("ANALYZE security_log_chain"))
+            print(f"{LOGS:,} logs en un INSERT")
+            print(f"  sin cadena: {plain:6.2f} s")
+            print(f"  con cadena: {chained:6.2f} s  (+{(chained - plain) / LOGS * 1e6:.1f} µs por log)")
+
+            # 2. Verificación completa
+            result, elapsed = await timed(conn, VERIFY, params)
+            row = result.one()
+            print(f"\nverify_security_log_chain: {row.rows_checked:,} filas en {elapsed:.2f} s "
+                  f"({row.rows_checked / elapsed:,.0f} filas/s), problema: {row.problem or 'ninguno'}")
+
+            # 3. Checkpoints Merkle
+            result, elapsed = await timed(conn, "SELECT create_security_log_checkpoints()", {})
+            print(f"\ncreate_security_log_checkpoints: {result.scalar()} checkpoints en {elapsed:.2f} s")
+            result, elapsed = await timed(conn, """
+                SELECT bool_and(verify_security_log_checkpoint(agencia_id, seq_from))
+                FROM security_log_checkpoints WHERE agencia_id = CAST(:tenant_id AS UUID)
+            """, params)
+            print(f"verify_security_log_checkpoint: {'ok' if result.scalar() else 'FALLA'} en {elapsed:.2f} s")
+
+            # 4. Detección
+            print("\nAdulteración (eslabón tocado → primer eslabón roto informado):")
+            await conn.execute(text("SET LOCAL session_replication_role = replica"))
+            seq = LOGS // 2
+            for nombre, sql in ADULTERACIONES.items():
+                savepoint = await conn.begin_nested()
+                for statement in sql.split(";"):
+                    await conn.execute(text(statement), {**params, "seq": seq})
+                row = (await conn.execute(text(VERIFY), params)).one()
+                print(f"  {nombre:<16} seq {seq:,} → seq {row.first_broken_seq:,}: {row.problem}")
+                await savepoint.rollback()
+        finally:
+            await trans.rollback()
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
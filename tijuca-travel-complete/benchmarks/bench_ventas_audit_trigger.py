@@ -0,0 +1,186 @@
+"""
+=====================================================================
+BENCHMARK - AUDIT DE VENTAS: TRIGGER POR FILA vs POR SENTENCIA
+=====================================================================
+Compara ventas_audit_log (FOR EACH ROW, 03_audit_log_table.sql) contra
+los triggers FOR EACH STATEMENT con transition tables de
+07_ventas_audit_statement.sql, sobre operaciones masivas de 10k ventas:
+
+1. UPDATE de precios (10k filas)
+2. UPDATE de estado (10k filas)
+3. INSERT (importación de 10k ventas)
+4. DELETE (10k filas)
+
+Al estilo pgbench: cada operación se repite REPETICIONES veces y se
+informa la mediana (ms) y las filas por segundo. Cada repetición corre
+en un SAVEPOINT que se descarta; todo el benchmark corre dentro de UNA
+transacción con ROLLBACK al final (no deja datos ni cambia los
+triggers). Requiere 03 y 07 aplicados y un usuario owner (crea y
+borra triggers).
+
+Ejecutar desde la raíz del proyecto:
+    DATABASE_URL=postgresql+asyncpg://... python benchmarks/bench_ventas_audit_trigger.py
+=====================================================================
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import text
+
+from app.core.database import engine
+
+
+VENTAS = 10_000
+REPETICIONES = 5
+
+TRIGGERS_POR_FILA = [
+    """
+    CREATE TRIGGER ventas_audit_log
+        AFTER INSERT OR UPDATE OR DELETE ON ventas
+        FOR EACH ROW
+        EXECUTE FUNCTION log_ventas_changes()
+    """,
+]
+
+TRIGGERS_POR_SENTENCIA = [
+    """
+    CREATE TRIGGER ventas_audit_insert
+        AFTER INSERT ON ventas
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION log_ventas_changes_stmt()
+    """,
+    """
+    CREATE TRIGGER ventas_audit_update
+        AFTER UPDATE ON ventas
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION log_ventas_changes_stmt()
+    """,
+    """
+    CREATE TRIGGER ventas_audit_delete
+        AFTER DELETE ON ventas
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION log_ventas_changes_stmt()
+    """,
+]
+
+INSERT_VENTAS = """
+    INSERT INTO ventas (agencia_id, cliente_nombre, descripcion, destino, moneda, monto_base, monto_total, estado)
+    SELECT
+        CAST(:tenant_id AS UUID),
+        'Cliente ' || g,
+        'Paquete bench #' || g,
+        'Bariloche',  -- Con destino NULL el trigger por fila falla (descripción NULL)
+        CASE WHEN g % 3 = 0 THEN 'ARS' ELSE 'USD' END,
+        500 + g % 5000,
+        (500 + g % 5000) * 1.3,
+        'confirmada'
+    FROM generate_series(1, :n) AS g
+"""
+
+OPERACIONES = {
+    # 1 de cada 4 con un cambio > 50% (marcado como sospechoso)
+    "UPDATE precio": (
+        "UPDATE ventas SET monto_total = monto_total * CASE WHEN monto_base::INT % 4 = 0 THEN 1.7 ELSE 1.1 END "
+        "WHERE agencia_id = CAST(:tenant_id AS UUID)"
+    ),
+    "UPDATE estado": (
+        "UPDATE ventas SET estado = 'cancelada' WHERE agencia_id = CAST(:tenant_id AS UUID)"
+    ),
+    "INSERT": INSERT_VENTAS,
+    "DELETE": "DELETE FROM ventas WHERE agencia_id = CAST(:tenant_id AS UUID)",
+}
+
+
+async def use_triggers(conn, creates) -> None:
+    for name in ("ventas_audit_log", "ventas_audit_insert", "ventas_audit_update", "ventas_audit_delete"):
+        await conn.execute(text(f"DROP TRIGGER IF EXISTS {name} ON ventas"))
+    for create in creates:
+        await conn.execute(text(create))
+
+
+async def measure(conn, sql, params):
+    timings = []
+    logs = 0
+    for _ in range(REPETICIONES):
+        savepoint = await conn.begin_nested()
+        before = (await conn.execute(text("SELECT count(*) FROM security_logs"))).scalar()
+        start = time.perf_counter()
+        await conn.execute(text(sql), params)
+        timings.append((time.perf_counter() - start) * 1000)
+        logs = (await conn.execute(text("SELECT count(*) FROM security_logs"))).scalar() - before
+        await savepoint.rollback()
+    return statistics.median(timings), logs
+
+
+async def main() -> None:
+    tenant_id = str(uuid.uuid4())
+    bench_tenant = str(uuid.uuid4())  # Para INSERT: no choca con las 10k existentes
+
+    async with engine.connect() as conn:
+        trans = await conn.begin()
+        try:
+            for agencia in (tenant_id, bench_tenant):
+                await conn.execute(text("""
+                    INSERT INTO agencias (id, nombre, razon_social, cuit, api_key_hash)
+                    VALUES (:id, 'Bench', 'Bench', :cuit, 'bench')
+                """), {"id": agencia, "cuit": f"BENCH-{uuid.uuid4().hex[:7]}"})
+
+            # Las 10k ventas de partida se cargan sin audit (no se mide)
+            await use_triggers(conn, [])
+            await conn.execute(text(INSERT_VENTAS), {"tenant_id": tenant_id, "n": VENTAS})
+            await conn.execute(text("ANALYZE ventas"))
+
+            results = {}
+            for label, creates in (("por fila", TRIGGERS_POR_FILA), ("por sentencia", TRIGGERS_POR_SENTENCIA)):
+                await use_triggers(conn, creates)
+                for operacion, sql in OPERACIONES.items():
+                    target = bench_tenant if operacion == "INSERT" else tenant_id
+                    results[(operacion, label)] = await measure(conn, sql, {"tenant_id": target, "n": VENTAS})
+
+            print(f"{VENTAS:,} ventas por operación, mediana de {REPETICIONES} repeticiones\n")
+            print(f"{'operación':<16}{'por fila (ms)':>15}{'sentencia (ms)':>16}{'speedup':>9}"
+                  f"{'filas/s (sentencia)':>21}  logs")
+            for operacion in OPERACIONES:
+                row_ms, row_logs = results[(operacion, "por fila")]
+                stmt_ms, stmt_logs = results[(operacion, "por sentencia")]
+                print(f"{operacion:<16}{row_ms:>15.0f}{stmt_ms:>16.0f}{row_ms / stmt_ms:>8.1f}x"
+                      f"{VENTAS / (stmt_ms / 1000):>21,.0f}  {row_logs:,} / {stmt_logs:,}")
+
+            # Mismas reglas: severidades iguales en ambos triggers
+            print("\nSeveridad de los logs del UPDATE de precios:")
+            for label, creates in (("por fila", TRIGGERS_POR_FILA), ("por sentencia", TRIGGERS_POR_SENTENCIA)):
+                await use_triggers(conn, creates)
+                savepoint = await conn.begin_nested()
+                await conn.execute(text(OPERACIONES["UPDATE precio"]), {"tenant_id": tenant_id})
+                rows = await conn.execute(text("""
+                    SELECT severity, is_suspicious, count(*) AS n,
+                           bool_and(verify_log_integrity(id)) AS integridad
+                    FROM security_logs
+                    WHERE agencia_id = CAST(:tenant_id AS UUID)
+                    GROUP BY severity, is_suspicious ORDER BY severity
+                """), {"tenant_id": tenant_id})
+                summary = ", ".join(
+                    f"{r.severity}/{'sospechoso' if r.is_suspicious else 'normal'}: {r.n:,}"
+                    f"{'' if r.integridad else ' (HASH INVÁLIDO)'}"
+                    for r in rows
+                )
+                print(f"  {label:<14} {summary}")
+                await savepoint.rollback()
+        finally:
+            await trans.rollback()
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
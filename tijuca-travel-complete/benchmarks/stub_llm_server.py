@@ -0,0 +1,132 @@
+"""
+=====================================================================
+STUB LOCAL DE LA API DE ANTHROPIC (/v1/messages)
+=====================================================================
+Servidor mínimo compatible con messages.create y messages.stream para
+probar HunterBot sin red ni costo: latencia, errores y velocidad de
+tokens configurables, incluso en caliente.
+
+Ejecutar desde la raíz del proyecto:
+    python benchmarks/stub_llm_server.py [--port 8787] [--delay 0.5]
+
+y apuntar la app al stub:
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8787
+
+Cambiar el comportamiento en caliente (ej: simular caída):
+    curl -X POST localhost:8787/_stub/mode -d '{"status": 500}'
+    curl -X POST localhost:8787/_stub/mode -d '{"delay": 30}'
+    curl -X POST localhost:8787/_stub/mode -d '{"status": 200, "delay": 0.5}'
+=====================================================================
+"""
+
+import argparse
+import asyncio
+import json
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+
+REPLY = (
+    "¡Hola! Bariloche en invierno es ideal para esquiar en el Cerro Catedral. "
+    "Te paso opciones de hotel y excursiones para las fechas que prefieras."
+)
+
+# Comportamiento actual del stub (modificable con POST /_stub/mode)
+MODE = {
+    "delay": 0.5,           # Segundos hasta la respuesta (o hasta el 1er token)
+    "status": 200,          # != 200: responde error con ese status
+    "token_interval": 0.02, # Segundos entre tokens en streaming
+    "reply": REPLY,
+}
+STATS = {"requests": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+def _sse(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+def _message(text: str) -> dict:
+    return {
+        "id": "msg_stub",
+        "type": "message",
+        "role": "assistant",
+        "model": "stub",
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": 10, "output_tokens": len(text.split())},
+    }
+
+
+async def _stream(reply: str):
+    start = _message("")
+    start["content"] = []
+    start["stop_reason"] = None
+    yield _sse("message_start", {"type": "message_start", "message": start})
+    yield _sse("content_block_start", {
+        "type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}
+    })
+    for word in reply.split(" "):
+        yield _sse("content_block_delta", {
+            "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word + " "}
+        })
+        await asyncio.sleep(MODE["token_interval"])
+    yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+    yield _sse("message_delta", {
+        "type": "message_delta",
+        "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+        "usage": {"output_tokens": len(reply.split())},
+    })
+    yield _sse("message_stop", {"type": "message_stop"})
+
+
+async def messages(request: Request):
+    body = await request.json()
+    STATS["requests"] += 1
+    STATS["in_flight"] += 1
+    STATS["max_in_flight"] = max(STATS["max_in_flight"], STATS["in_flight"])
+    try:
+        await asyncio.sleep(MODE["delay"])
+    finally:
+        STATS["in_flight"] -= 1
+
+    if MODE["status"] != 200:
+        STATS["errors"] += 1
+        return JSONResponse(
+            {"type": "error", "error": {"type": "api_error", "message": "stub: upstream caído"}},
+            status_code=MODE["status"]
+        )
+
+    if body.get("stream"):
+        return StreamingResponse(_stream(MODE["reply"]), media_type="text/event-stream")
+    return JSONResponse(_message(MODE["reply"]))
+
+
+async def set_mode(request: Request):
+    MODE.update(await request.json())
+    return JSONResponse({"mode": MODE, "stats": STATS})
+
+
+async def get_mode(request: Request):
+    return JSONResponse({"mode": MODE, "stats": STATS})
+
+
+app = Starlette(routes=[
+    Route("/v1/messages", messages, methods=["POST"]),
+    Route("/_stub/mode", set_mode, methods=["POST"]),
+    Route("/_stub/mode", get_mode, methods=["GET"]),
+])
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Stub local de la API de Anthropic")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--delay", type=float, default=MODE["delay"])
+    args = parser.parse_args()
+    MODE["delay"] = args.delay
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
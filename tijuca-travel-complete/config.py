@@ -2,7 +2,8 @@
 Configuración centralizada de la aplicación
 """
 import os
-from typing import List
+from datetime import date
+from typing import List, Optional
 from pydantic_settings import BaseSettings
 
 
@@ -21,11 +22,50 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRATION_MINUTES: int = 60
 
+    # API keys (login): secret del HMAC de agencias.api_key_lookup
+    API_KEY_LOOKUP_SECRET: str
+    # Fallback para keys previas a api_key_lookup (un bcrypt por cada agencia
+    # sin migrar): opt-in, con fecha de corte y límite de intentos por IP
+    API_KEY_LEGACY_FALLBACK: bool = False
+    API_KEY_LEGACY_FALLBACK_UNTIL: Optional[date] = None
+    API_KEY_LEGACY_FALLBACK_PER_MINUTE: int = 5
+
     # Redis
     REDIS_URL: str = "redis://localhost:6379"
 
     # Anthropic
     ANTHROPIC_API_KEY: str = ""
+    ANTHROPIC_BASE_URL: str = ""  # Vacío = API oficial (otro valor: stub local)
+    ANTHROPIC_TIMEOUT_SECONDS: float = 60.0
+    ANTHROPIC_MAX_RETRIES: int = 2
+    ANTHROPIC_MAX_CONNECTIONS: int = 50
+    ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS: int = 20
+
+    # Límites y circuit breaker de llamadas a Claude (por worker)
+    HUNTERBOT_MAX_CONCURRENT_CALLS: int = 16
+    HUNTERBOT_MAX_CONCURRENT_CALLS_PER_TENANT: int = 4
+    HUNTERBOT_QUEUE_TIMEOUT_SECONDS: float = 2.0
+    HUNTERBOT_CALL_TIMEOUT_SECONDS: float = 20.0
+    HUNTERBOT_BREAKER_FAILURE_THRESHOLD: int = 5
+    HUNTERBOT_BREAKER_RESET_SECONDS: float = 30.0
+
+    # Cache de respuestas de HunterBot (por worker y por tenant)
+    HUNTERBOT_CACHE_MAX_ENTRIES_PER_TENANT: int = 256
+    HUNTERBOT_CACHE_TTL_SECONDS: float = 600.0
+
+    # Índice de catálogo en memoria (precios de HunterBot sin ir a la DB)
+    CATALOG_INDEX_ENABLED: bool = True
+    CATALOG_INDEX_MAX_STALENESS_SECONDS: float = 30.0
+    CATALOG_INDEX_MAX_PRODUCTS_PER_TENANT: int = 20000
+    CATALOG_INDEX_MAX_TENANTS: int = 200
+
+    # Audit log en segundo plano (lotes a security_logs, por worker)
+    AUDIT_QUEUE_MAX_EVENTS: int = 10000
+    AUDIT_BATCH_MAX_EVENTS: int = 500
+    AUDIT_FLUSH_INTERVAL_SECONDS: float = 0.2
+    AUDIT_WRITE_TIMEOUT_SECONDS: float = 5.0
+    AUDIT_SPILL_PATH: str = "audit_spill.jsonl"
+    AUDIT_SPILL_RETRY_SECONDS: float = 30.0
 
     # CORS
     ALLOWED_ORIGINS: str = "http://localhost:3000,http://localhost:8000"
@@ -34,6 +74,15 @@ class Settings(BaseSettings):
     RATE_LIMIT_REQUESTS: int = 100
     RATE_LIMIT_WINDOW: int = 60
 
+    # Worker pool para bcrypt (login)
+    BCRYPT_POOL_WORKERS: int = 4
+    BCRYPT_POOL_MAX_PENDING: int = 32
+
+    # Guardrails por lotes (process pool a partir de N mensajes)
+    GUARDRAILS_BATCH_WORKERS: int = 2
+    GUARDRAILS_BATCH_CHUNK_SIZE: int = 64
+    GUARDRAILS_BATCH_PROCESS_THRESHOLD: int = 256
+
     # Logging
     LOG_LEVEL: str = "INFO"
 
@@ -0,0 +1,79 @@
+-- =====================================================================
+-- TIJUCA TRAVEL - LOOKUP INDEXADO DE API KEYS
+-- =====================================================================
+-- Propósito: Evitar que /api/auth/login verifique bcrypt contra TODAS
+--            las agencias activas. Cada API key se identifica por un
+--            digest HMAC-SHA256 indexado; bcrypt se ejecuta una sola vez.
+-- Requiere: 01_database_rls.sql
+-- =====================================================================
+
+-- =====================================================================
+-- PASO 1: COLUMNA DE LOOKUP (DIGEST KEYED, NO REVERSIBLE)
+-- =====================================================================
+
+-- HMAC-SHA256(API_KEY_LOOKUP_SECRET, api_key) en hex (64 caracteres)
+-- ⚠️ NULL = agencia con API key previa a esta migración (ver PASO 3)
+ALTER TABLE agencias ADD COLUMN IF NOT EXISTS api_key_lookup VARCHAR(64);
+
+-- Índice único: login = una búsqueda indexada por digest
+CREATE UNIQUE INDEX IF NOT EXISTS idx_agencias_api_key_lookup
+    ON agencias(api_key_lookup)
+    WHERE api_key_lookup IS NOT NULL;
+
+-- Índice parcial para el fallback de migración (solo agencias pendientes)
+CREATE INDEX IF NOT EXISTS idx_agencias_api_key_pendiente
+    ON agencias(id)
+    WHERE api_key_lookup IS NULL AND activa = true;
+
+-- =====================================================================
+-- PASO 2: FUNCIÓN SEGURA PARA COMPLETAR EL LOOKUP
+-- =====================================================================
+
+-- tijuca_app solo tiene SELECT sobre agencias: el backfill se hace vía
+-- SECURITY DEFINER y únicamente si la agencia todavía no tiene lookup
+CREATE OR REPLACE FUNCTION backfill_api_key_lookup(
+    p_agencia_id UUID,
+    p_api_key_lookup VARCHAR
+) RETURNS BOOLEAN
+SECURITY DEFINER
+SET search_path = public
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF p_api_key_lookup IS NULL OR length(p_api_key_lookup) != 64 THEN
+        RAISE EXCEPTION 'api_key_lookup inválido';
+    END IF;
+
+    UPDATE agencias
+    SET api_key_lookup = p_api_key_lookup
+    WHERE id = p_agencia_id
+      AND api_key_lookup IS NULL;
+
+    RETURN FOUND;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION backfill_api_key_lookup TO tijuca_app;
+
+-- =====================================================================
+-- PASO 3: MIGRACIÓN DE API KEYS EXISTENTES
+-- =====================================================================
+
+-- Los api_key_hash existentes son bcrypt: NO se puede derivar el digest
+-- sin la API key en texto plano. Dos caminos:
+--
+-- A) Automático (opt-in): con API_KEY_LEGACY_FALLBACK=true (.env) el
+--    primer login exitoso de cada agencia completa su api_key_lookup
+--    llamando a backfill_api_key_lookup(). El fallback solo recorre las
+--    agencias pendientes, un conjunto que se vacía con el uso. Cada
+--    intento cuesta un bcrypt por agencia pendiente: solo corre para keys
+--    sin el prefijo tjc_, hasta API_KEY_LEGACY_FALLBACK_UNTIL y con
+--    API_KEY_LEGACY_FALLBACK_PER_MINUTE intentos por IP.
+--
+-- B) Rotación: emitir keys nuevas con APIKeyHandler.generate_api_key()
+--    y guardar api_key_lookup + api_key_hash juntos.
+--
+-- Cuando esta query retorne 0, desactivar API_KEY_LEGACY_FALLBACK:
+SELECT COUNT(*) AS agencias_sin_lookup
+FROM agencias
+WHERE api_key_lookup IS NULL AND activa = true;
@@ -0,0 +1,304 @@
+-- =====================================================================
+-- TIJUCA TRAVEL - CATÁLOGO DE PRODUCTOS Y BÚSQUEDA INDEXADA
+-- =====================================================================
+-- Propósito: HunterBot busca el producto por el que pregunta el usuario
+--            con full-text search en español (sin acentos) y trigramas,
+--            en lugar de LIKE '%mensaje completo%' (seq scan por cada
+--            pregunta de precio y casi nunca matcheaba nada).
+-- Requiere: 01_database_rls.sql
+-- =====================================================================
+
+-- =====================================================================
+-- PASO 1: EXTENSIONES
+-- =====================================================================
+
+-- pg_trgm: similitud por trigramas (errores de tipeo: "bariloce")
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- unaccent: "Cancún" y "cancun" indexan igual
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- btree_gin: índices GIN compuestos (agencia_id, texto) por tenant
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+-- unaccent() es STABLE y no se puede usar en índices: wrapper IMMUTABLE
+-- con el diccionario fijo (patrón recomendado por la documentación)
+CREATE OR REPLACE FUNCTION f_unaccent(TEXT)
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE PARALLEL SAFE STRICT
+AS $$
+    SELECT public.unaccent('public.unaccent'::regdictionary, $1)
+$$;
+
+-- Configuración de full-text: español (stemming + stopwords) sin acentos
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'es_unaccent') THEN
+        CREATE TEXT SEARCH CONFIGURATION es_unaccent (COPY = spanish);
+        ALTER TEXT SEARCH CONFIGURATION es_unaccent
+            ALTER MAPPING FOR hword, hword_part, word
+            WITH unaccent, spanish_stem;
+    END IF;
+END;
+$$;
+
+-- =====================================================================
+-- PASO 2: TABLA DE PRODUCTOS (CON TENANT_ID)
+-- =====================================================================
+
+CREATE TABLE IF NOT EXISTS productos (
+    -- UUID como Primary Key
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+
+    -- ⚠️ CRÍTICO: Foreign Key al tenant (NUNCA NULL)
+    agencia_id UUID NOT NULL REFERENCES agencias(id) ON DELETE CASCADE,
+
+    -- Producto
+    descripcion TEXT NOT NULL,
+    destino VARCHAR(255),
+
+    -- Datos financieros (fuente de verdad de los precios de HunterBot)
+    moneda VARCHAR(3) NOT NULL CHECK (moneda IN ('ARS', 'USD')),
+    precio_base NUMERIC(12, 2) NOT NULL CHECK (precio_base >= 0),
+    impuesto_pais NUMERIC(12, 2) DEFAULT 0,
+    percepcion_ganancias NUMERIC(12, 2) DEFAULT 0,
+    precio_total NUMERIC(12, 2) NOT NULL CHECK (precio_total >= 0),
+
+    disponible BOOLEAN DEFAULT true,
+
+    -- Timestamps
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Columnas de búsqueda generadas (también para tablas productos previas)
+-- destino pesa más que la descripción en el ranking
+ALTER TABLE productos ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('es_unaccent', COALESCE(destino, '')), 'A') ||
+        setweight(to_tsvector('es_unaccent', descripcion), 'B')
+    ) STORED;
+
+-- Solo el destino: primera etapa de la búsqueda (ver PASO 5)
+ALTER TABLE productos ADD COLUMN IF NOT EXISTS destino_vector TSVECTOR
+    GENERATED ALWAYS AS (
+        to_tsvector('es_unaccent', COALESCE(destino, ''))
+    ) STORED;
+
+DROP TRIGGER IF EXISTS update_productos_updated_at ON productos;
+CREATE TRIGGER update_productos_updated_at
+    BEFORE UPDATE ON productos
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- =====================================================================
+-- PASO 3: ÍNDICES (SIEMPRE CON agencia_id ADELANTE)
+-- =====================================================================
+
+-- Con 100k productos por tenant, un índice solo por texto devuelve
+-- candidatos de TODOS los tenants y RLS los descarta después. Los GIN
+-- compuestos (btree_gin) filtran por tenant dentro del índice.
+
+CREATE INDEX IF NOT EXISTS idx_productos_agencia_id
+    ON productos(agencia_id);
+
+CREATE INDEX IF NOT EXISTS idx_productos_destino_fts
+    ON productos USING gin (agencia_id, destino_vector)
+    WHERE disponible = true;
+
+CREATE INDEX IF NOT EXISTS idx_productos_search_fts
+    ON productos USING gin (agencia_id, search_vector)
+    WHERE disponible = true;
+
+-- ⚠️ Las queries deben usar EXACTAMENTE f_unaccent(lower(destino))
+CREATE INDEX IF NOT EXISTS idx_productos_destino_trgm
+    ON productos USING gin (agencia_id, f_unaccent(lower(destino)) gin_trgm_ops)
+    WHERE disponible = true;
+
+-- =====================================================================
+-- PASO 4: ROW LEVEL SECURITY
+-- =====================================================================
+
+ALTER TABLE productos ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS productos_tenant_isolation ON productos;
+CREATE POLICY productos_tenant_isolation ON productos
+    FOR ALL
+    USING (agencia_id = current_setting('app.current_tenant_id')::UUID)
+    WITH CHECK (agencia_id = current_setting('app.current_tenant_id')::UUID);
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON productos TO tijuca_app;
+
+-- =====================================================================
+-- PASO 5: FUNCIÓN DE BÚSQUEDA RANKEADA
+-- =====================================================================
+
+-- Palabras de la pregunta que no describen ningún producto: saludos,
+-- preguntas de precio, "quiero ir" (mismo criterio que STOPWORDS en
+-- app/services/text_matching.py; artículos y preposiciones ya los
+-- descarta el diccionario spanish). Se guardan como lexemas de
+-- es_unaccent: "cuánto", "cuanto" y "cuantos" → 'cuant'
+CREATE TABLE IF NOT EXISTS productos_terminos_genericos (
+    lexema TEXT PRIMARY KEY
+);
+
+INSERT INTO productos_terminos_genericos (lexema)
+SELECT DISTINCT t.lexeme
+FROM unnest(to_tsvector('es_unaccent', '
+    hola buenas buen dia dias tardes noches gracias quiero queria quisiera
+    saber tenes tienen hay como cual cuales cuando donde ir viajar
+    cuanto cuanta cuantos cuantas cuesta cuestan sale salen vale valen
+    precio precios costo costos tarifa tarifas cotizacion presupuesto
+    monto total
+')) AS t
+ON CONFLICT (lexema) DO NOTHING;
+
+GRANT SELECT ON productos_terminos_genericos TO tijuca_app;
+
+-- Convierte un mensaje libre en un tsquery con sus lexemas, sin los
+-- genéricos (las stopwords en español se descartan):
+-- "¿Cuánto cuesta un crucero a Alaska?" → 'crucer' | 'alask'
+-- p_todas = true los combina con AND: 'crucer' & 'alask'
+-- NULL si no queda ningún lexema.
+DROP FUNCTION IF EXISTS productos_tsquery(TEXT);
+CREATE OR REPLACE FUNCTION productos_tsquery(p_texto TEXT, p_todas BOOLEAN DEFAULT false)
+RETURNS TSQUERY
+LANGUAGE sql
+STABLE PARALLEL SAFE
+SET search_path = public
+AS $$
+    SELECT string_agg(
+        '''' || replace(replace(t.lexeme, '\', '\\'), '''', '''''') || '''',
+        CASE WHEN p_todas THEN ' & ' ELSE ' | ' END
+    )::TSQUERY
+    FROM unnest(to_tsvector('es_unaccent', COALESCE(p_texto, ''))) AS t
+    WHERE NOT EXISTS (
+        SELECT 1 FROM productos_terminos_genericos g WHERE g.lexema = t.lexeme
+    )
+$$;
+
+-- Búsqueda en tres etapas, de la más precisa a la más tolerante. Cada
+-- una usa su índice y corta apenas encuentra resultados:
+--
+-- 1. destino: alguna palabra del mensaje es (parte de) un destino.
+--    Se rankea con search_vector: "hotel en Bariloche" prefiere los
+--    productos de Bariloche que además mencionan hotel.
+-- 2. texto: TODAS las palabras del mensaje (sin las genéricas) en
+--    destino o descripción ("crucero 8 noches"). Con OR, "paquete a
+--    Tokio" devolvía cualquier paquete: esos precios van al prompt como
+--    datos verificados, así que un destino desconocido no matchea nada.
+-- 3. fuzzy: trigramas sobre el destino, para errores de tipeo.
+--
+-- SECURITY INVOKER: RLS sigue aplicando; p_agencia_id es además el
+-- prefijo de los índices compuestos.
+CREATE OR REPLACE FUNCTION buscar_productos(
+    p_agencia_id UUID,
+    p_texto TEXT,
+    p_limit INTEGER DEFAULT 5
+) RETURNS TABLE (
+    producto_id UUID,
+    descripcion TEXT,
+    destino VARCHAR,
+    precio_base NUMERIC,
+    moneda VARCHAR,
+    impuesto_pais NUMERIC,
+    percepcion_ganancias NUMERIC,
+    precio_total NUMERIC,
+    disponible BOOLEAN,
+    relevancia REAL,
+    etapa TEXT
+)
+LANGUAGE plpgsql
+STABLE
+SET search_path = public
+AS $$
+DECLARE
+    v_query TSQUERY := productos_tsquery(p_texto);
+    v_query_todas TSQUERY := productos_tsquery(p_texto, true);
+BEGIN
+    IF v_query IS NOT NULL THEN
+        -- ETAPA 1: destino
+        RETURN QUERY
+        SELECT p.id, p.descripcion, p.destino, p.precio_base, p.moneda,
+               p.impuesto_pais, p.percepcion_ganancias, p.precio_total,
+               p.disponible, ts_rank_cd(p.search_vector, v_query), 'destino'
+        FROM productos p
+        WHERE p.agencia_id = p_agencia_id
+          AND p.disponible = true
+          AND p.destino_vector @@ v_query
+        ORDER BY 10 DESC, p.precio_total
+        LIMIT p_limit;
+
+        IF FOUND THEN
+            RETURN;
+        END IF;
+
+        -- ETAPA 2: destino o descripción, todas las palabras
+        RETURN QUERY
+        SELECT p.id, p.descripcion, p.destino, p.precio_base, p.moneda,
+               p.impuesto_pais, p.percepcion_ganancias, p.precio_total,
+               p.disponible, ts_rank_cd(p.search_vector, v_query_todas), 'texto'
+        FROM productos p
+        WHERE p.agencia_id = p_agencia_id
+          AND p.disponible = true
+          AND p.search_vector @@ v_query_todas
+        ORDER BY 10 DESC, p.precio_total
+        LIMIT p_limit;
+
+        IF FOUND THEN
+            RETURN;
+        END IF;
+    END IF;
+
+    -- ETAPA 3: trigramas por palabra (>= 4 letras, sin las genéricas)
+    -- contra el destino: "sale" no es un typo de "Salta"
+    -- "%>" usa pg_trgm.word_similarity_threshold (default 0.6)
+    RETURN QUERY
+    SELECT p.id, p.descripcion, p.destino, p.precio_base, p.moneda,
+           p.impuesto_pais, p.percepcion_ganancias, p.precio_total,
+           p.disponible,
+           max(word_similarity(w.palabra, f_unaccent(lower(p.destino)))),
+           'fuzzy'
+    FROM regexp_split_to_table(f_unaccent(lower(COALESCE(p_texto, ''))), '[^a-z0-9]+') AS w(palabra)
+    JOIN productos p
+      ON p.agencia_id = p_agencia_id
+     AND p.disponible = true
+     AND f_unaccent(lower(p.destino)) %> w.palabra
+    WHERE length(w.palabra) >= 4
+      AND NOT EXISTS (
+          SELECT 1 FROM productos_terminos_genericos g
+          WHERE g.lexema = ANY (tsvector_to_array(to_tsvector('es_unaccent', w.palabra)))
+      )
+    GROUP BY p.id
+    ORDER BY 10 DESC, p.precio_total
+    LIMIT p_limit;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION f_unaccent TO tijuca_app;
+GRANT EXECUTE ON FUNCTION productos_tsquery TO tijuca_app;
+GRANT EXECUTE ON FUNCTION buscar_productos TO tijuca_app;
+
+-- =====================================================================
+-- PASO 6: DATOS DE PRUEBA
+-- =====================================================================
+
+INSERT INTO productos (agencia_id, descripcion, destino, moneda, precio_base, precio_total) VALUES
+    ('550e8400-e29b-41d4-a716-446655440000', 'Paquete a Bariloche 7 días con hotel y excursiones', 'San Carlos de Bariloche', 'ARS', 850000.00, 850000.00),
+    ('550e8400-e29b-41d4-a716-446655440000', 'Vuelo + Hotel Miami 5 noches', 'Miami', 'USD', 1200.00, 1200.00),
+    ('6ba7b810-9dad-11d1-80b4-00c04fd430c8', 'Crucero por el Caribe 8 noches', 'Caribe', 'USD', 2500.00, 2500.00),
+    ('6ba7b810-9dad-11d1-80b4-00c04fd430c8', 'Tour Europa 15 días', 'Europa', 'USD', 3800.00, 3800.00);
+
+-- Ejemplos (como tijuca_app, con el tenant seteado):
+-- SET LOCAL app.current_tenant_id = '550e8400-e29b-41d4-a716-446655440000';
+-- SELECT * FROM buscar_productos('550e8400-e29b-41d4-a716-446655440000', '¿Cuánto cuesta ir a Bariloche?');   -- etapa destino
+-- SELECT * FROM buscar_productos('550e8400-e29b-41d4-a716-446655440000', 'precio del vuelo con hotel');      -- etapa texto
+-- SELECT * FROM buscar_productos('550e8400-e29b-41d4-a716-446655440000', 'cuanto sale bariloce');            -- etapa fuzzy
+-- SELECT * FROM buscar_productos('550e8400-e29b-41d4-a716-446655440000', '¿Cuánto sale un paquete a Tokio?'); -- sin resultados
+
+-- Verificar que se usan los índices (Bitmap Index Scan on idx_productos_*):
+-- EXPLAIN ANALYZE SELECT id FROM productos
+-- WHERE agencia_id = '550e8400-e29b-41d4-a716-446655440000'
+--   AND disponible = true
+--   AND destino_vector @@ productos_tsquery('¿Cuánto cuesta ir a Bariloche?');
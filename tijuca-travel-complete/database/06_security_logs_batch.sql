@@ -0,0 +1,128 @@
+-- =====================================================================
+-- TIJUCA TRAVEL - INSERCIÓN DE AUDIT LOGS POR LOTES
+-- =====================================================================
+-- Propósito: Que la aplicación escriba muchos eventos de auditoría en
+--            UNA llamada (un INSERT multi-fila) en lugar de un
+--            insert_security_log() + commit por evento
+-- Requiere: 03_audit_log_table.sql
+-- Usado por: app/services/audit_writer.py
+-- =====================================================================
+
+-- =====================================================================
+-- PASO 1: FUNCIÓN DE INSERCIÓN POR LOTES
+-- =====================================================================
+
+-- p_events: array JSON de objetos con las mismas columnas que los
+-- parámetros de insert_security_log() (sin el prefijo p_):
+--   [{"agencia_id": "...", "action_type": "...", "resource_type": "...",
+--     "action_description": "...", "old_value": {...}, "new_value": {...},
+--     "severity": "warning", "tags": ["ai"], "is_suspicious": false}, ...]
+--
+-- El hash de integridad se calcula igual que en insert_security_log():
+-- verify_log_integrity() valida las filas de ambas funciones.
+CREATE OR REPLACE FUNCTION insert_security_logs_batch(p_events JSONB)
+RETURNS INTEGER
+SECURITY DEFINER  -- ⚠️ Igual que insert_security_log: bypasea RLS
+SET search_path = public
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_inserted INTEGER;
+BEGIN
+    WITH eventos AS (
+        SELECT
+            uuid_generate_v4() AS id,
+            e.*
+        FROM jsonb_to_recordset(p_events) AS e (
+            agencia_id UUID,
+            user_id UUID,
+            user_email VARCHAR,
+            user_ip_address INET,
+            user_agent TEXT,
+            action_type VARCHAR,
+            resource_type VARCHAR,
+            resource_id UUID,
+            action_description TEXT,
+            old_value JSONB,
+            new_value JSONB,
+            severity VARCHAR,
+            tags TEXT[],
+            is_suspicious BOOLEAN
+        )
+    )
+    INSERT INTO security_logs (
+        id,
+        agencia_id,
+        user_id,
+        user_email,
+        user_ip_address,
+        user_agent,
+        action_type,
+        resource_type,
+        resource_id,
+        action_description,
+        old_value,
+        new_value,
+        severity,
+        tags,
+        is_suspicious,
+        integrity_hash,
+        created_at
+    )
+    SELECT
+        id,
+        agencia_id,
+        user_id,
+        user_email,
+        user_ip_address,
+        user_agent,
+        action_type,
+        resource_type,
+        resource_id,
+        action_description,
+        old_value,
+        new_value,
+        COALESCE(severity, 'info'),
+        COALESCE(tags, '{}'),
+        COALESCE(is_suspicious, false),
+        encode(digest(CONCAT(
+            id::TEXT,
+            agencia_id::TEXT,
+            COALESCE(user_id::TEXT, ''),
+            COALESCE(user_email, ''),
+            COALESCE(HOST(user_ip_address), ''),
+            action_type,
+            resource_type,
+            COALESCE(resource_id::TEXT, ''),
+            action_description,
+            COALESCE(old_value::TEXT, ''),
+            COALESCE(new_value::TEXT, ''),
+            NOW()::TEXT
+        ), 'sha256'), 'hex'),
+        NOW()
+    FROM eventos;
+
+    GET DIAGNOSTICS v_inserted = ROW_COUNT;
+    RETURN v_inserted;
+END;
+$$;
+
+-- Otorgar permisos de ejecución a la aplicación
+GRANT EXECUTE ON FUNCTION insert_security_logs_batch(JSONB) TO tijuca_app;
+
+-- =====================================================================
+-- PASO 2: VERIFICACIÓN
+-- =====================================================================
+
+-- Un lote de 2 eventos (se descarta con ROLLBACK)
+-- BEGIN;
+-- SELECT insert_security_logs_batch('[
+--     {"agencia_id": "550e8400-e29b-41d4-a716-446655440000", "action_type": "AI_GUARDRAIL_TRIGGERED",
+--      "resource_type": "hunterbot", "action_description": "test 1", "severity": "warning",
+--      "tags": ["ai", "security"], "is_suspicious": false},
+--     {"agencia_id": "550e8400-e29b-41d4-a716-446655440000", "action_type": "AI_GUARDRAIL_TRIGGERED",
+--      "resource_type": "hunterbot", "action_description": "test 2", "severity": "critical",
+--      "is_suspicious": true}
+-- ]');
+-- SELECT verify_log_integrity(id) FROM security_logs ORDER BY created_at DESC LIMIT 2;
+-- ROLLBACK;
@@ -0,0 +1,247 @@
+-- =====================================================================
+-- TIJUCA TRAVEL - AUDIT DE VENTAS A NIVEL SENTENCIA
+-- =====================================================================
+-- Propósito: Reemplazar el trigger FOR EACH ROW de ventas
+--            (ventas_audit_log, 03_audit_log_table.sql) por triggers
+--            FOR EACH STATEMENT con transition tables: un UPDATE de
+--            10k ventas escribe sus 10k logs en UN INSERT ... SELECT,
+--            en lugar de 10k llamadas a insert_security_log()
+-- Requiere: 03_audit_log_table.sql
+-- Comparación: benchmarks/bench_ventas_audit_trigger.py
+-- =====================================================================
+
+-- =====================================================================
+-- PASO 1: HASH DE INTEGRIDAD COMO FUNCIÓN SQL
+-- =====================================================================
+
+-- Misma fórmula que insert_security_log() y verify_log_integrity().
+-- LANGUAGE sql, STABLE (timestamptz::TEXT depende del TimeZone) y sin
+-- SET: el planner la expande dentro del INSERT (sin llamada por fila)
+CREATE OR REPLACE FUNCTION security_log_hash(
+    p_id UUID,
+    p_agencia_id UUID,
+    p_user_id UUID,
+    p_user_email VARCHAR,
+    p_user_ip_address INET,
+    p_action_type VARCHAR,
+    p_resource_type VARCHAR,
+    p_resource_id UUID,
+    p_action_description TEXT,
+    p_old_value JSONB,
+    p_new_value JSONB,
+    p_created_at TIMESTAMPTZ
+) RETURNS VARCHAR
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT encode(digest(CONCAT(
+        p_id::TEXT,
+        p_agencia_id::TEXT,
+        COALESCE(p_user_id::TEXT, ''),
+        COALESCE(p_user_email, ''),
+        COALESCE(HOST(p_user_ip_address), ''),
+        p_action_type,
+        p_resource_type,
+        COALESCE(p_resource_id::TEXT, ''),
+        p_action_description,
+        COALESCE(p_old_value::TEXT, ''),
+        COALESCE(p_new_value::TEXT, ''),
+        p_created_at::TEXT
+    ), 'sha256'), 'hex')
+$$;
+
+-- =====================================================================
+-- PASO 2: FUNCIÓN DEL TRIGGER (SET-BASED)
+-- =====================================================================
+
+-- Mismas reglas que log_ventas_changes() (descripción, severidad, tags,
+-- sospechoso), aplicadas a todas las filas de la sentencia a la vez.
+-- Diferencias con la versión por fila:
+--   - CONCAT en lugar de ||: un destino NULL ya no deja la descripción
+--     en NULL (que hacía fallar la venta por el NOT NULL del log)
+--   - Un precio anterior en 0 no divide por cero: el cambio no se marca
+--     como sospechoso
+-- Los CTE con uuid_generate_v4() (volátil) se materializan: el id que
+-- entra al hash es el mismo que se inserta.
+CREATE OR REPLACE FUNCTION log_ventas_changes_stmt()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF (TG_OP = 'INSERT') THEN
+        WITH eventos AS (
+            SELECT
+                uuid_generate_v4() AS id,
+                n.agencia_id,
+                n.id AS resource_id,
+                CONCAT('Nueva venta creada: ', n.cliente_nombre, ' - ', n.destino) AS descripcion,
+                to_jsonb(n) AS new_value
+            FROM new_rows n
+        )
+        INSERT INTO security_logs (
+            id, agencia_id, action_type, resource_type, resource_id,
+            action_description, old_value, new_value, severity, tags,
+            is_suspicious, integrity_hash, created_at
+        )
+        SELECT
+            e.id, e.agencia_id, 'CREATE', 'ventas', e.resource_id,
+            e.descripcion, NULL, e.new_value, 'info', ARRAY['financial', 'sales'],
+            false,
+            security_log_hash(e.id, e.agencia_id, NULL, NULL, NULL, 'CREATE', 'ventas',
+                              e.resource_id, e.descripcion, NULL, e.new_value, NOW()),
+            NOW()
+        FROM eventos e;
+
+    ELSIF (TG_OP = 'UPDATE') THEN
+        WITH cambios AS (
+            SELECT
+                o, n,
+                o.monto_total <> n.monto_total AS cambio_precio,
+                COALESCE(
+                    o.monto_total <> n.monto_total
+                    AND ABS(n.monto_total - o.monto_total) / NULLIF(o.monto_total, 0) > 0.5,
+                    false
+                ) AS sospechoso
+            FROM old_rows o
+            JOIN new_rows n ON n.id = o.id
+        ),
+        eventos AS (
+            SELECT
+                uuid_generate_v4() AS id,
+                (c.n).agencia_id,
+                (c.n).id AS resource_id,
+                CASE
+                    WHEN c.cambio_precio THEN CONCAT(
+                        'Precio modificado: ', (c.o).monto_total, ' ', (c.o).moneda,
+                        ' → ', (c.n).monto_total, ' ', (c.n).moneda)
+                    WHEN (c.o).estado <> (c.n).estado THEN CONCAT(
+                        'Estado cambiado: ', (c.o).estado, ' → ', (c.n).estado)
+                    ELSE 'Venta modificada: ' || (c.n).id::TEXT
+                END AS descripcion,
+                to_jsonb(c.o) AS old_value,
+                to_jsonb(c.n) AS new_value,
+                CASE
+                    WHEN c.sospechoso THEN 'critical'
+                    WHEN c.cambio_precio THEN 'warning'
+                    WHEN (c.o).estado <> (c.n).estado
+                         AND (c.n).estado IN ('cancelada', 'reembolsada') THEN 'warning'
+                    ELSE 'info'
+                END AS severity,
+                CASE
+                    WHEN c.sospechoso THEN ARRAY['financial', 'sales', 'suspicious']
+                    ELSE ARRAY['financial', 'sales']
+                END AS tags,
+                c.sospechoso
+            FROM cambios c
+        )
+        INSERT INTO security_logs (
+            id, agencia_id, action_type, resource_type, resource_id,
+            action_description, old_value, new_value, severity, tags,
+            is_suspicious, integrity_hash, created_at
+        )
+        SELECT
+            e.id, e.agencia_id, 'UPDATE', 'ventas', e.resource_id,
+            e.descripcion, e.old_value, e.new_value, e.severity, e.tags,
+            e.sospechoso,
+            security_log_hash(e.id, e.agencia_id, NULL, NULL, NULL, 'UPDATE', 'ventas',
+                              e.resource_id, e.descripcion, e.old_value, e.new_value, NOW()),
+            NOW()
+        FROM eventos e;
+
+    ELSIF (TG_OP = 'DELETE') THEN
+        WITH eventos AS (
+            SELECT
+                uuid_generate_v4() AS id,
+                o.agencia_id,
+                o.id AS resource_id,
+                CONCAT('Venta eliminada: ', o.cliente_nombre, ' - ', o.destino,
+                       ' (', o.monto_total, ' ', o.moneda, ')') AS descripcion,
+                to_jsonb(o) AS old_value
+            FROM old_rows o
+        )
+        INSERT INTO security_logs (
+            id, agencia_id, action_type, resource_type, resource_id,
+            action_description, old_value, new_value, severity, tags,
+            is_suspicious, integrity_hash, created_at
+        )
+        SELECT
+            e.id, e.agencia_id, 'DELETE', 'ventas', e.resource_id,
+            e.descripcion, e.old_value, NULL, 'critical',  -- Borrar ventas es crítico
+            ARRAY['financial', 'sales', 'deletion'],
+            true,  -- Siempre sospechoso
+            security_log_hash(e.id, e.agencia_id, NULL, NULL, NULL, 'DELETE', 'ventas',
+                              e.resource_id, e.descripcion, e.old_value, NULL, NOW()),
+            NOW()
+        FROM eventos e;
+    END IF;
+
+    RETURN NULL;  -- AFTER ... FOR EACH STATEMENT: el valor se ignora
+END;
+$$;
+
+-- =====================================================================
+-- PASO 3: REEMPLAZAR EL TRIGGER POR FILA
+-- =====================================================================
+
+-- Las transition tables no admiten triggers de varios eventos: uno por
+-- operación, todos con la misma función
+DROP TRIGGER IF EXISTS ventas_audit_log ON ventas;
+DROP TRIGGER IF EXISTS ventas_audit_insert ON ventas;
+DROP TRIGGER IF EXISTS ventas_audit_update ON ventas;
+DROP TRIGGER IF EXISTS ventas_audit_delete ON ventas;
+
+CREATE TRIGGER ventas_audit_insert
+    AFTER INSERT ON ventas
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION log_ventas_changes_stmt();
+
+CREATE TRIGGER ventas_audit_update
+    AFTER UPDATE ON ventas
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION log_ventas_changes_stmt();
+
+CREATE TRIGGER ventas_audit_delete
+    AFTER DELETE ON ventas
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION log_ventas_changes_stmt();
+
+-- El UPDATE empareja old_rows y new_rows por id: un UPDATE que cambiara
+-- el id de una venta no dejaría log. El id es inmutable (WHEN: la
+-- función solo se llama si el id cambia de verdad)
+CREATE OR REPLACE FUNCTION reject_ventas_id_change()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RAISE EXCEPTION 'El id de una venta no se puede modificar (venta %)', OLD.id
+        USING ERRCODE = 'integrity_constraint_violation';
+END;
+$$;
+
+DROP TRIGGER IF EXISTS ventas_id_inmutable ON ventas;
+CREATE TRIGGER ventas_id_inmutable
+    BEFORE UPDATE OF id ON ventas
+    FOR EACH ROW
+    WHEN (OLD.id IS DISTINCT FROM NEW.id)
+    EXECUTE FUNCTION reject_ventas_id_change();
+
+-- ⚠️ log_ventas_changes() (por fila) se conserva: el benchmark la usa
+--    para comparar, y volver atrás es recrear ventas_audit_log
+
+-- =====================================================================
+-- PASO 4: VERIFICACIÓN
+-- =====================================================================
+
+-- Un UPDATE de varias filas genera un log por fila, con hash válido
+-- BEGIN;
+-- SET LOCAL app.current_tenant_id = '550e8400-e29b-41d4-a716-446655440000';
+-- UPDATE ventas SET monto_total = monto_total * 1.7
+-- WHERE agencia_id = '550e8400-e29b-41d4-a716-446655440000';
+-- SELECT action_description, severity, is_suspicious, verify_log_integrity(id)
+-- FROM security_logs ORDER BY created_at DESC LIMIT 5;
+-- ROLLBACK;
@@ -0,0 +1,286 @@
+-- =====================================================================
+-- TIJUCA TRAVEL - SECURITY_LOGS PARTICIONADA POR MES
+-- =====================================================================
+-- Propósito: security_logs era un único heap que crece sin límite, con
+--            índices GIN sobre old_value, new_value y tags. Pasa a estar
+--            particionada por rango de created_at (una partición por
+--            mes, en UTC):
+--            - Los índices de cada partición solo cubren un mes: insertar
+--              y mantener índices cuesta lo mismo el mes 1 que el mes 60
+--            - Archivar es DETACH + ATTACH de particiones enteras (sin
+--              DELETE + INSERT, sin bloat ni VACUUM)
+-- Requiere: PostgreSQL 13+, 03_audit_log_table.sql (y 06/07 si se usan)
+-- ⚠️ Migra los datos existentes en UNA transacción: correr en una
+--    ventana de mantenimiento (toma lock exclusivo sobre security_logs)
+-- =====================================================================
+
+BEGIN;
+
+-- =====================================================================
+-- PASO 1: TABLA PARTICIONADA (MISMAS COLUMNAS Y ORDEN)
+-- =====================================================================
+
+ALTER TABLE security_logs RENAME TO security_logs_legacy;
+
+CREATE TABLE security_logs (
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    agencia_id UUID NOT NULL REFERENCES agencias(id) ON DELETE RESTRICT,
+    user_id UUID,
+    user_email VARCHAR(255),
+    user_ip_address INET,
+    user_agent TEXT,
+    action_type VARCHAR(50) NOT NULL,
+    resource_type VARCHAR(50) NOT NULL,
+    resource_id UUID,
+    action_description TEXT NOT NULL,
+    old_value JSONB,
+    new_value JSONB,
+    severity VARCHAR(20) DEFAULT 'info' CHECK (severity IN ('debug', 'info', 'warning', 'error', 'critical')),
+    tags TEXT[],
+    is_suspicious BOOLEAN DEFAULT false,
+    requires_review BOOLEAN DEFAULT false,
+    created_at TIMESTAMPTZ DEFAULT NOW() NOT NULL,
+    integrity_hash VARCHAR(64) NOT NULL,
+
+    -- La clave de partición tiene que estar en la PK
+    CONSTRAINT security_logs_p_pkey PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Red de seguridad: si falta la partición del mes, el log no se pierde
+-- (ni falla la venta que lo dispara). Debería estar siempre vacía.
+CREATE TABLE security_logs_default PARTITION OF security_logs DEFAULT;
+
+-- =====================================================================
+-- PASO 2: ÍNDICES (SE CREAN EN CADA PARTICIÓN)
+-- =====================================================================
+
+-- Los nombres originales quedaron en security_logs_legacy
+CREATE INDEX idx_security_logs_p_agencia_created ON security_logs(agencia_id, created_at DESC);
+CREATE INDEX idx_security_logs_p_action_type ON security_logs(action_type);
+CREATE INDEX idx_security_logs_p_resource ON security_logs(resource_type, resource_id);
+CREATE INDEX idx_security_logs_p_suspicious ON security_logs(is_suspicious, requires_review) WHERE is_suspicious = true OR requires_review = true;
+CREATE INDEX idx_security_logs_p_old_value ON security_logs USING GIN (old_value);
+CREATE INDEX idx_security_logs_p_new_value ON security_logs USING GIN (new_value);
+CREATE INDEX idx_security_logs_p_tags ON security_logs USING GIN (tags);
+
+-- =====================================================================
+-- PASO 3: RLS E INMUTABILIDAD
+-- =====================================================================
+
+-- Las queries pasan por la tabla padre: la política aplica a todas las
+-- particiones (tijuca_app no tiene permisos sobre las particiones)
+ALTER TABLE security_logs ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY security_logs_tenant_isolation ON security_logs
+    FOR SELECT
+    USING (agencia_id = current_setting('app.current_tenant_id')::UUID);
+
+CREATE TRIGGER prevent_security_logs_modification
+    BEFORE UPDATE OR DELETE ON security_logs
+    FOR EACH ROW
+    EXECUTE FUNCTION prevent_log_modification();
+
+-- =====================================================================
+-- PASO 4: CREACIÓN DE PARTICIONES MENSUALES
+-- =====================================================================
+
+-- Crea las particiones que falten desde el mes de p_from (default: el
+-- actual) hasta p_months_ahead meses adelante. Idempotente: correrla
+-- seguido no hace nada. Nombre: security_logs_pAAAA_MM (UTC).
+CREATE OR REPLACE FUNCTION create_security_logs_partitions(
+    p_months_ahead INTEGER DEFAULT 3,
+    p_from TIMESTAMPTZ DEFAULT NULL
+) RETURNS INTEGER
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+    v_month TIMESTAMP := date_trunc('month', COALESCE(p_from, NOW()) AT TIME ZONE 'UTC');
+    v_last TIMESTAMP := date_trunc('month', NOW() AT TIME ZONE 'UTC') + make_interval(months => p_months_ahead);
+    v_start TIMESTAMPTZ;
+    v_end TIMESTAMPTZ;
+    v_name TEXT;
+    v_created INTEGER := 0;
+BEGIN
+    WHILE v_month <= v_last LOOP
+        v_name := 'security_logs_p' || to_char(v_month, 'YYYY_MM');
+        v_start := v_month AT TIME ZONE 'UTC';
+        v_end := (v_month + INTERVAL '1 month') AT TIME ZONE 'UTC';
+
+        -- Ya existe (también si está archivada en security_logs_archive)
+        IF to_regclass(v_name) IS NULL THEN
+            IF EXISTS (
+                SELECT 1 FROM security_logs_default
+                WHERE created_at >= v_start AND created_at < v_end
+            ) THEN
+                -- Crearla fallaría: hay filas del mes en la partición default
+                RAISE WARNING 'security_logs_default tiene logs de %: crear % a mano', to_char(v_month, 'YYYY-MM'), v_name;
+            ELSE
+                BEGIN
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF security_logs FOR VALUES FROM (%L) TO (%L)',
+                        v_name, v_start, v_end
+                    );
+                    v_created := v_created + 1;
+                EXCEPTION WHEN duplicate_table THEN
+                    NULL;  -- La creó otra sesión en paralelo
+                END;
+            END IF;
+        END IF;
+
+        v_month := v_month + INTERVAL '1 month';
+    END LOOP;
+
+    RETURN v_created;
+END;
+$$;
+
+-- =====================================================================
+-- PASO 5: MIGRAR LOS LOGS EXISTENTES
+-- =====================================================================
+
+-- id, created_at e integrity_hash se copian tal cual:
+-- verify_log_integrity() sigue validando los logs migrados
+DO $$
+DECLARE
+    v_legacy BIGINT;
+    v_migrated BIGINT;
+BEGIN
+    PERFORM create_security_logs_partitions(3, (SELECT MIN(created_at) FROM security_logs_legacy));
+
+    INSERT INTO security_logs SELECT * FROM security_logs_legacy;
+
+    SELECT COUNT(*) INTO v_legacy FROM security_logs_legacy;
+    SELECT COUNT(*) INTO v_migrated FROM security_logs;
+    IF v_legacy <> v_migrated THEN
+        RAISE EXCEPTION 'Migración incompleta: % logs en legacy, % migrados', v_legacy, v_migrated;
+    END IF;
+END $$;
+
+-- La vista apuntaba a la tabla vieja (se resuelve al crearla)
+CREATE OR REPLACE VIEW security_alerts AS
+SELECT
+    sl.id,
+    a.nombre AS agencia_nombre,
+    sl.severity,
+    sl.action_type,
+    sl.resource_type,
+    sl.action_description,
+    sl.user_email,
+    sl.user_ip_address,
+    sl.created_at,
+    sl.old_value,
+    sl.new_value,
+    sl.tags
+FROM security_logs sl
+JOIN agencias a ON sl.agencia_id = a.id
+WHERE sl.is_suspicious = true OR sl.requires_review = true
+ORDER BY sl.created_at DESC;
+
+ALTER VIEW security_alerts SET (security_barrier = true);
+
+DROP TABLE security_logs_legacy;
+
+-- =====================================================================
+-- PASO 6: ARCHIVO PARTICIONADO (DETACH + ATTACH)
+-- =====================================================================
+
+-- El archivo de 03_audit_log_table.sql (tabla común) queda como
+-- histórico de solo lectura
+ALTER TABLE security_logs_archive RENAME TO security_logs_archive_legacy;
+
+CREATE TABLE security_logs_archive (
+    LIKE security_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+) PARTITION BY RANGE (created_at);
+
+-- Mismo índice que en security_logs: el ATTACH reutiliza el de la
+-- partición en lugar de construirlo
+CREATE INDEX idx_security_logs_archive_agencia_created ON security_logs_archive(agencia_id, created_at DESC);
+
+CREATE TRIGGER prevent_security_logs_archive_modification
+    BEFORE UPDATE OR DELETE ON security_logs_archive
+    FOR EACH ROW
+    EXECUTE FUNCTION prevent_log_modification();
+
+-- Reemplaza la versión de 03 (DELETE + INSERT fila por fila, que además
+-- chocaba con prevent_security_logs_modification). Mueve cada partición
+-- mensual ya vencida entera: el DETACH es un cambio de catálogo y el
+-- ATTACH solo lee la partición para validar el rango (sin escrituras).
+-- Devuelve la cantidad de particiones archivadas.
+CREATE OR REPLACE FUNCTION archive_old_logs(p_retention_months INTEGER DEFAULT 12)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+    v_cutoff TIMESTAMP := date_trunc('month', NOW() AT TIME ZONE 'UTC') - make_interval(months => p_retention_months);
+    v_partition RECORD;
+    v_start TIMESTAMPTZ;
+    v_end TIMESTAMPTZ;
+    v_archived INTEGER := 0;
+BEGIN
+    FOR v_partition IN
+        SELECT
+            c.relname,
+            to_date(substring(c.relname FROM 'p(\d{4}_\d{2})$'), 'YYYY_MM')::TIMESTAMP AS month
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'security_logs'::regclass
+          AND c.relname ~ '^security_logs_p\d{4}_\d{2}$'
+        ORDER BY c.relname
+    LOOP
+        -- Solo meses completos anteriores al corte
+        CONTINUE WHEN v_partition.month + INTERVAL '1 month' > v_cutoff;
+
+        v_start := v_partition.month AT TIME ZONE 'UTC';
+        v_end := (v_partition.month + INTERVAL '1 month') AT TIME ZONE 'UTC';
+
+        EXECUTE format('ALTER TABLE security_logs DETACH PARTITION %I', v_partition.relname);
+        EXECUTE format(
+            'ALTER TABLE security_logs_archive ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+            v_partition.relname, v_start, v_end
+        );
+        v_archived := v_archived + 1;
+    END LOOP;
+
+    RETURN v_archived;
+END;
+$$;
+
+-- =====================================================================
+-- PASO 7: PARTICIONES FUTURAS AUTOMÁTICAS
+-- =====================================================================
+
+-- Con pg_cron: particiones 3 meses adelante (diario) y archivo (mensual).
+-- Sin pg_cron, agendar lo mismo en el cron del sistema:
+--   0 3 * * * psql -d tijuca_travel_db -c "SELECT create_security_logs_partitions()"
+--   0 4 1 * * psql -d tijuca_travel_db -c "SELECT archive_old_logs(12)"
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule('security_logs_partitions', '0 3 * * *', 'SELECT create_security_logs_partitions()');
+        PERFORM cron.schedule('security_logs_archive', '0 4 1 * *', 'SELECT archive_old_logs(12)');
+    ELSE
+        RAISE NOTICE 'pg_cron no instalado: agendar create_security_logs_partitions() y archive_old_logs() en el cron del sistema';
+    END IF;
+END $$;
+
+COMMIT;
+
+-- =====================================================================
+-- PASO 8: VERIFICACIÓN
+-- =====================================================================
+
+-- Particiones y filas por mes
+-- SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS rango, c.reltuples::BIGINT AS filas
+-- FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+-- WHERE i.inhparent IN ('security_logs'::regclass, 'security_logs_archive'::regclass)
+-- ORDER BY c.relname;
+
+-- Un rango de fechas solo lee las particiones de esos meses
+-- EXPLAIN SELECT * FROM security_logs
+-- WHERE agencia_id = '550e8400-e29b-41d4-a716-446655440000'
+--   AND created_at >= NOW() - INTERVAL '7 days';
+
+-- La partición default debería estar vacía
+-- SELECT COUNT(*) FROM security_logs_default;
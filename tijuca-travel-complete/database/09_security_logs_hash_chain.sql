@@ -0,0 +1,537 @@
+-- =====================================================================
+-- TIJUCA TRAVEL - CADENA DE HASHES DEL AUDIT LOG + CHECKPOINTS MERKLE
+-- =====================================================================
+-- Propósito: integrity_hash (03_audit_log_table.sql) valida cada log
+--            por separado y no puede detectar logs BORRADOS. Además su
+--            input usa created_at::TEXT, que depende del TimeZone de la
+--            sesión: verify_log_integrity() da falso negativo si se
+--            corre con otro TimeZone.
+--
+--            Acá cada log suma un eslabón a una cadena por tenant:
+--              entry_hash = SHA-256 del log (formato canónico, UTC)
+--              chain_hash = SHA-256(chain_hash anterior || entry_hash)
+--            Modificar, borrar o intercalar un log rompe la cadena desde
+--            ese punto. Cada tanto se sella un checkpoint con la raíz
+--            Merkle de los entry_hash del tramo (para publicar/anclar
+--            afuera y probar que un log estaba incluido).
+--
+-- Requiere: 08_security_logs_partitioned.sql (security_logs y
+--           security_logs_archive particionadas)
+-- Uso:
+--   SELECT * FROM verify_security_log_chain('<agencia_id>');
+--   SELECT create_security_log_checkpoints();
+-- =====================================================================
+
+BEGIN;
+
+-- =====================================================================
+-- PASO 1: TABLAS DE LA CADENA
+-- =====================================================================
+
+-- Último eslabón de cada tenant: se bloquea al encadenar (serializa los
+-- INSERT de logs del mismo tenant hasta el commit)
+CREATE TABLE security_log_chain_heads (
+    agencia_id UUID PRIMARY KEY REFERENCES agencias(id) ON DELETE RESTRICT,
+    last_seq BIGINT NOT NULL DEFAULT 0,
+    last_hash VARCHAR(64) NOT NULL DEFAULT repeat('0', 64),  -- Génesis
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Un eslabón por log. Queda aunque el log se archive (security_logs_archive)
+CREATE TABLE security_log_chain (
+    agencia_id UUID NOT NULL,
+    chain_seq BIGINT NOT NULL,
+    log_id UUID NOT NULL,
+    log_created_at TIMESTAMPTZ NOT NULL,  -- Poda de particiones al buscar el log
+    entry_hash VARCHAR(64) NOT NULL,
+    chain_hash VARCHAR(64) NOT NULL,
+    PRIMARY KEY (agencia_id, chain_seq)
+);
+
+CREATE TABLE security_log_checkpoints (
+    agencia_id UUID NOT NULL,
+    seq_from BIGINT NOT NULL,
+    seq_to BIGINT NOT NULL,
+    merkle_root VARCHAR(64) NOT NULL,  -- Raíz de los entry_hash de seq_from..seq_to
+    chain_hash VARCHAR(64) NOT NULL,   -- chain_hash del eslabón seq_to
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (agencia_id, seq_from)
+);
+
+-- Append-only, igual que security_logs (las cabezas sí se actualizan)
+CREATE TRIGGER prevent_security_log_chain_modification
+    BEFORE UPDATE OR DELETE ON security_log_chain
+    FOR EACH ROW
+    EXECUTE FUNCTION prevent_log_modification();
+
+CREATE TRIGGER prevent_security_log_checkpoints_modification
+    BEFORE UPDATE OR DELETE ON security_log_checkpoints
+    FOR EACH ROW
+    EXECUTE FUNCTION prevent_log_modification();
+
+-- tijuca_app no tiene permisos: solo escriben las funciones de abajo
+ALTER TABLE security_log_chain_heads ENABLE ROW LEVEL SECURITY;
+ALTER TABLE security_log_chain ENABLE ROW LEVEL SECURITY;
+ALTER TABLE security_log_checkpoints ENABLE ROW LEVEL SECURITY;
+
+-- =====================================================================
+-- PASO 2: HASHES
+-- =====================================================================
+
+-- Hash canónico de un log: array JSON (sin ambigüedad entre campos
+-- vecinos, a diferencia de CONCAT) y created_at en UTC con
+-- microsegundos. No depende de TimeZone ni DateStyle.
+CREATE OR REPLACE FUNCTION security_log_entry_hash(
+    p_id UUID,
+    p_agencia_id UUID,
+    p_user_id UUID,
+    p_user_email VARCHAR,
+    p_user_ip_address INET,
+    p_user_agent TEXT,
+    p_action_type VARCHAR,
+    p_resource_type VARCHAR,
+    p_resource_id UUID,
+    p_action_description TEXT,
+    p_old_value JSONB,
+    p_new_value JSONB,
+    p_severity VARCHAR,
+    p_tags TEXT[],
+    p_is_suspicious BOOLEAN,
+    p_requires_review BOOLEAN,
+    p_created_at TIMESTAMPTZ,
+    p_integrity_hash VARCHAR
+) RETURNS VARCHAR
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT encode(sha256(convert_to(jsonb_build_array(
+        p_id, p_agencia_id, p_user_id, p_user_email, HOST(p_user_ip_address),
+        p_user_agent, p_action_type, p_resource_type, p_resource_id,
+        p_action_description, p_old_value, p_new_value, p_severity, p_tags,
+        p_is_suspicious, p_requires_review,
+        to_char(p_created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.US"Z"'),
+        p_integrity_hash
+    )::TEXT, 'UTF8')), 'hex')
+$$;
+
+-- Un paso de la cadena. Como función de transición de un agregado
+-- usado como window function, encadena N eslabones en una sola
+-- sentencia: el primero parte de p_initial (la cabeza del tenant).
+CREATE OR REPLACE FUNCTION security_log_chain_step(
+    p_state TEXT,
+    p_entry_hash TEXT,
+    p_initial TEXT
+) RETURNS TEXT
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT encode(sha256(convert_to(COALESCE(p_state, p_initial) || p_entry_hash, 'UTF8')), 'hex')
+$$;
+
+CREATE AGGREGATE security_log_chain(TEXT, TEXT) (
+    SFUNC = security_log_chain_step,
+    STYPE = TEXT
+);
+
+-- Raíz Merkle de una lista de hashes: un nivel por iteración, cada
+-- nivel en una sola query (unnest + GROUP BY de a pares). Si el nivel
+-- es impar, el último se combina consigo mismo.
+CREATE OR REPLACE FUNCTION security_log_merkle_root(p_leaves TEXT[])
+RETURNS VARCHAR
+LANGUAGE plpgsql
+STABLE
+AS $$
+DECLARE
+    v_level TEXT[] := p_leaves;
+BEGIN
+    IF v_level IS NULL OR cardinality(v_level) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    WHILE cardinality(v_level) > 1 LOOP
+        SELECT array_agg(parent ORDER BY pair)
+        INTO v_level
+        FROM (
+            SELECT
+                (ord - 1) / 2 AS pair,
+                encode(sha256(convert_to(
+                    CASE WHEN COUNT(*) = 1 THEN MIN(node) || MIN(node)
+                         ELSE string_agg(node, '' ORDER BY ord)
+                    END, 'UTF8')), 'hex') AS parent
+            FROM unnest(v_level) WITH ORDINALITY AS t(node, ord)
+            GROUP BY (ord - 1) / 2
+        ) niveles;
+    END LOOP;
+
+    RETURN v_level[1];
+END;
+$$;
+
+-- =====================================================================
+-- PASO 3: ENCADENAR CADA INSERT (TRIGGER POR SENTENCIA)
+-- =====================================================================
+
+-- Cubre todos los caminos de escritura (insert_security_log,
+-- insert_security_logs_batch, triggers de ventas): un INSERT de 10k
+-- logs se encadena con un INSERT ... SELECT y un UPDATE por tenant.
+-- Dentro de la sentencia el orden es (created_at, id).
+CREATE OR REPLACE FUNCTION chain_security_logs()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    INSERT INTO security_log_chain_heads (agencia_id)
+    SELECT DISTINCT agencia_id FROM new_logs
+    ON CONFLICT (agencia_id) DO NOTHING;
+
+    -- Bloqueo de las cabezas en orden fijo: sin deadlocks entre
+    -- transacciones que escriben logs de varios tenants
+    PERFORM 1
+    FROM security_log_chain_heads
+    WHERE agencia_id IN (SELECT agencia_id FROM new_logs)
+    ORDER BY agencia_id
+    FOR UPDATE;
+
+    WITH nuevos AS (
+        SELECT
+            n.agencia_id,
+            n.id,
+            n.created_at,
+            security_log_entry_hash(
+                n.id, n.agencia_id, n.user_id, n.user_email, n.user_ip_address,
+                n.user_agent, n.action_type, n.resource_type, n.resource_id,
+                n.action_description, n.old_value, n.new_value, n.severity, n.tags,
+                n.is_suspicious, n.requires_review, n.created_at, n.integrity_hash
+            ) AS entry_hash,
+            row_number() OVER (PARTITION BY n.agencia_id ORDER BY n.created_at, n.id) AS pos
+        FROM new_logs n
+    ),
+    eslabones AS (
+        SELECT
+            x.agencia_id,
+            h.last_seq + x.pos AS chain_seq,
+            x.id,
+            x.created_at,
+            x.entry_hash,
+            security_log_chain(x.entry_hash, h.last_hash) OVER (
+                PARTITION BY x.agencia_id ORDER BY x.pos
+                ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+            ) AS chain_hash
+        FROM nuevos x
+        JOIN security_log_chain_heads h ON h.agencia_id = x.agencia_id
+    ),
+    insertados AS (
+        INSERT INTO security_log_chain (agencia_id, chain_seq, log_id, log_created_at, entry_hash, chain_hash)
+        SELECT agencia_id, chain_seq, id, created_at, entry_hash, chain_hash
+        FROM eslabones
+        RETURNING agencia_id, chain_seq, chain_hash
+    )
+    UPDATE security_log_chain_heads h
+    SET last_seq = u.chain_seq,
+        last_hash = u.chain_hash,
+        updated_at = NOW()
+    FROM (
+        SELECT DISTINCT ON (agencia_id) agencia_id, chain_seq, chain_hash
+        FROM insertados
+        ORDER BY agencia_id, chain_seq DESC
+    ) u
+    WHERE h.agencia_id = u.agencia_id;
+
+    RETURN NULL;
+END;
+$$;
+
+-- =====================================================================
+-- PASO 4: ENCADENAR LOS LOGS EXISTENTES
+-- =====================================================================
+
+-- Sin INSERT concurrentes mientras se arma la cadena inicial
+LOCK TABLE security_logs IN SHARE ROW EXCLUSIVE MODE;
+
+WITH logs AS (
+    SELECT id, agencia_id, user_id, user_email, user_ip_address, user_agent, action_type,
+           resource_type, resource_id, action_description, old_value, new_value, severity,
+           tags, is_suspicious, requires_review, created_at, integrity_hash
+    FROM security_logs
+    UNION ALL
+    SELECT id, agencia_id, user_id, user_email, user_ip_address, user_agent, action_type,
+           resource_type, resource_id, action_description, old_value, new_value, severity,
+           tags, is_suspicious, requires_review, created_at, integrity_hash
+    FROM security_logs_archive
+),
+eslabones AS (
+    SELECT
+        l.agencia_id,
+        row_number() OVER w AS chain_seq,
+        l.id,
+        l.created_at,
+        e.entry_hash,
+        security_log_chain(e.entry_hash, repeat('0', 64)) OVER w AS chain_hash
+    FROM logs l
+    CROSS JOIN LATERAL (
+        SELECT security_log_entry_hash(
+            l.id, l.agencia_id, l.user_id, l.user_email, l.user_ip_address,
+            l.user_agent, l.action_type, l.resource_type, l.resource_id,
+            l.action_description, l.old_value, l.new_value, l.severity, l.tags,
+            l.is_suspicious, l.requires_review, l.created_at, l.integrity_hash
+        ) AS entry_hash
+    ) e
+    WINDOW w AS (
+        PARTITION BY l.agencia_id ORDER BY l.created_at, l.id
+        ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+    )
+),
+insertados AS (
+    INSERT INTO security_log_chain (agencia_id, chain_seq, log_id, log_created_at, entry_hash, chain_hash)
+    SELECT agencia_id, chain_seq, id, created_at, entry_hash, chain_hash
+    FROM eslabones
+    RETURNING agencia_id, chain_seq, chain_hash
+)
+INSERT INTO security_log_chain_heads (agencia_id, last_seq, last_hash)
+SELECT DISTINCT ON (agencia_id) agencia_id, chain_seq, chain_hash
+FROM insertados
+ORDER BY agencia_id, chain_seq DESC;
+
+-- Desde acá, cada INSERT en security_logs (cualquier partición, vía la
+-- tabla padre) suma sus eslabones
+CREATE TRIGGER security_logs_hash_chain
+    AFTER INSERT ON security_logs
+    REFERENCING NEW TABLE AS new_logs
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION chain_security_logs();
+
+-- =====================================================================
+-- PASO 5: CHECKPOINTS MERKLE
+-- =====================================================================
+
+-- Sella los eslabones nuevos de cada tenant en checkpoints de hasta
+-- p_max_leaves hojas. Devuelve la cantidad de checkpoints creados.
+CREATE OR REPLACE FUNCTION create_security_log_checkpoints(p_max_leaves INTEGER DEFAULT 100000)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+    v_head RECORD;
+    v_from BIGINT;
+    v_to BIGINT;
+    v_leaves TEXT[];
+    v_chain_hash VARCHAR(64);
+    v_created INTEGER := 0;
+BEGIN
+    -- Una ejecución a la vez (cron + manual)
+    PERFORM pg_advisory_xact_lock(hashtext('create_security_log_checkpoints'));
+
+    FOR v_head IN
+        SELECT h.agencia_id, h.last_seq, COALESCE(MAX(k.seq_to), 0) AS sealed
+        FROM security_log_chain_heads h
+        LEFT JOIN security_log_checkpoints k ON k.agencia_id = h.agencia_id
+        GROUP BY h.agencia_id, h.last_seq
+        HAVING h.last_seq > COALESCE(MAX(k.seq_to), 0)
+    LOOP
+        v_from := v_head.sealed + 1;
+        WHILE v_from <= v_head.last_seq LOOP
+            v_to := LEAST(v_head.last_seq, v_from + p_max_leaves - 1);
+
+            SELECT array_agg(entry_hash ORDER BY chain_seq)
+            INTO v_leaves
+            FROM security_log_chain
+            WHERE agencia_id = v_head.agencia_id
+              AND chain_seq BETWEEN v_from AND v_to;
+
+            SELECT chain_hash INTO v_chain_hash
+            FROM security_log_chain
+            WHERE agencia_id = v_head.agencia_id AND chain_seq = v_to;
+
+            INSERT INTO security_log_checkpoints (agencia_id, seq_from, seq_to, merkle_root, chain_hash)
+            VALUES (v_head.agencia_id, v_from, v_to, security_log_merkle_root(v_leaves), v_chain_hash);
+
+            v_created := v_created + 1;
+            v_from := v_to + 1;
+        END LOOP;
+    END LOOP;
+
+    RETURN v_created;
+END;
+$$;
+
+-- Recalcula la raíz de un checkpoint desde los eslabones
+CREATE OR REPLACE FUNCTION verify_security_log_checkpoint(p_agencia_id UUID, p_seq_from BIGINT)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+    v_checkpoint RECORD;
+    v_leaves TEXT[];
+BEGIN
+    SELECT * INTO v_checkpoint
+    FROM security_log_checkpoints
+    WHERE agencia_id = p_agencia_id AND seq_from = p_seq_from;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Checkpoint no encontrado: % desde %', p_agencia_id, p_seq_from;
+    END IF;
+
+    SELECT array_agg(entry_hash ORDER BY chain_seq)
+    INTO v_leaves
+    FROM security_log_chain
+    WHERE agencia_id = p_agencia_id
+      AND chain_seq BETWEEN v_checkpoint.seq_from AND v_checkpoint.seq_to;
+
+    RETURN COALESCE(cardinality(v_leaves) = v_checkpoint.seq_to - v_checkpoint.seq_from + 1, false)
+       AND security_log_merkle_root(v_leaves) = v_checkpoint.merkle_root;
+END;
+$$;
+
+-- =====================================================================
+-- PASO 6: VERIFICACIÓN DE LA CADENA (UNA PASADA POR TENANT)
+-- =====================================================================
+
+-- Recorre los eslabones en orden de chain_seq (índice de la PK, sin
+-- ordenar en memoria) y, en la misma pasada, junta cada eslabón con su
+-- log (security_logs + security_logs_archive) y con su checkpoint.
+-- Cada eslabón se valida contra el anterior con lag(): no hace falta
+-- recalcular la cadena en secuencia.
+-- Devuelve la cantidad de filas revisadas y el PRIMER problema:
+--   'log modificado'                 el log no coincide con su entry_hash
+--   'log borrado'                    hay eslabón pero no log
+--   'log sin eslabón'                hay log pero no eslabón (insertado
+--                                    salteando el trigger)
+--   'hueco en la secuencia'          faltan eslabones (borrados)
+--   'enlace roto'                    chain_hash no cubre al anterior
+--   'no coincide con el checkpoint'  el tramo sellado fue reescrito
+--   'cadena truncada'                la cabeza apunta más allá del último
+--                                    eslabón (se borró el final)
+-- p_from_seq permite verificar solo lo nuevo desde el último checkpoint.
+CREATE OR REPLACE FUNCTION verify_security_log_chain(p_agencia_id UUID, p_from_seq BIGINT DEFAULT 1)
+RETURNS TABLE (
+    rows_checked BIGINT,
+    head_seq BIGINT,
+    first_broken_seq BIGINT,
+    first_broken_log_id UUID,
+    problem TEXT
+)
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+    v_from BIGINT := GREATEST(p_from_seq, 1);
+    v_prev_hash VARCHAR(64) := repeat('0', 64);
+    v_last_seq BIGINT;
+BEGIN
+    IF v_from > 1 THEN
+        SELECT c.chain_hash INTO v_prev_hash
+        FROM security_log_chain c
+        WHERE c.agencia_id = p_agencia_id AND c.chain_seq = v_from - 1;
+    END IF;
+
+    SELECT h.last_seq INTO head_seq
+    FROM security_log_chain_heads h
+    WHERE h.agencia_id = p_agencia_id;
+
+    WITH eslabones AS (
+        SELECT
+            c.chain_seq,
+            c.log_id,
+            c.log_created_at,
+            c.entry_hash,
+            c.chain_hash,
+            lag(c.chain_hash, 1, v_prev_hash) OVER w AS prev_hash,
+            lag(c.chain_seq, 1, v_from - 1) OVER w AS prev_seq
+        FROM security_log_chain c
+        WHERE c.agencia_id = p_agencia_id AND c.chain_seq >= v_from
+        WINDOW w AS (ORDER BY c.chain_seq)
+    ),
+    logs AS (
+        SELECT
+            l.id,
+            l.created_at,
+            security_log_entry_hash(
+                l.id, l.agencia_id, l.user_id, l.user_email, l.user_ip_address,
+                l.user_agent, l.action_type, l.resource_type, l.resource_id,
+                l.action_description, l.old_value, l.new_value, l.severity, l.tags,
+                l.is_suspicious, l.requires_review, l.created_at, l.integrity_hash
+            ) AS actual_hash
+        FROM (
+            SELECT * FROM security_logs WHERE agencia_id = p_agencia_id
+            UNION ALL
+            SELECT * FROM security_logs_archive WHERE agencia_id = p_agencia_id
+        ) l
+    ),
+    revisados AS (
+        SELECT
+            e.chain_seq,
+            COALESCE(e.log_id, g.id) AS log_id,
+            CASE
+                WHEN e.chain_seq IS NULL THEN 'log sin eslabón'
+                WHEN e.chain_seq <> e.prev_seq + 1 THEN 'hueco en la secuencia'
+                WHEN e.chain_hash <> security_log_chain_step(NULL, e.entry_hash, e.prev_hash) THEN 'enlace roto'
+                WHEN k.chain_hash IS NOT NULL AND k.chain_hash <> e.chain_hash THEN 'no coincide con el checkpoint'
+                WHEN g.id IS NULL THEN 'log borrado'
+                WHEN g.actual_hash <> e.entry_hash THEN 'log modificado'
+            END AS problem
+        FROM eslabones e
+        FULL JOIN logs g ON g.id = e.log_id AND g.created_at = e.log_created_at
+        LEFT JOIN security_log_checkpoints k
+            ON k.agencia_id = p_agencia_id AND k.seq_to = e.chain_seq
+        -- Verificando desde un checkpoint, los logs anteriores no cuentan
+        WHERE e.chain_seq IS NOT NULL OR v_from = 1
+    )
+    SELECT
+        COUNT(*),
+        MAX(r.chain_seq),
+        (array_agg(r.chain_seq ORDER BY r.chain_seq NULLS LAST) FILTER (WHERE r.problem IS NOT NULL))[1],
+        (array_agg(r.log_id ORDER BY r.chain_seq NULLS LAST) FILTER (WHERE r.problem IS NOT NULL))[1],
+        (array_agg(r.problem ORDER BY r.chain_seq NULLS LAST) FILTER (WHERE r.problem IS NOT NULL))[1]
+    INTO rows_checked, v_last_seq, first_broken_seq, first_broken_log_id, problem
+    FROM revisados r;
+
+    IF problem IS NULL AND COALESCE(head_seq, 0) <> COALESCE(v_last_seq, v_from - 1) THEN
+        first_broken_seq := COALESCE(v_last_seq, v_from - 1) + 1;
+        problem := 'cadena truncada';
+    END IF;
+
+    RETURN NEXT;
+END;
+$$;
+
+-- =====================================================================
+-- PASO 7: CHECKPOINTS PERIÓDICOS
+-- =====================================================================
+
+-- Con pg_cron: cada hora. Sin pg_cron, en el cron del sistema:
+--   0 * * * * psql -d tijuca_travel_db -c "SELECT create_security_log_checkpoints()"
+-- Publicar merkle_root fuera de la base (ej: export diario a un bucket
+-- con object lock) hace que reescribir la cadena entera sea detectable.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule('security_log_checkpoints', '0 * * * *', 'SELECT create_security_log_checkpoints()');
+    ELSE
+        RAISE NOTICE 'pg_cron no instalado: agendar create_security_log_checkpoints() en el cron del sistema';
+    END IF;
+END $$;
+
+COMMIT;
+
+-- =====================================================================
+-- PASO 8: VERIFICACIÓN
+-- =====================================================================
+
+-- Cadena completa de un tenant
+-- SELECT * FROM verify_security_log_chain('550e8400-e29b-41d4-a716-446655440000');
+
+-- Solo lo posterior al último checkpoint (verificación incremental)
+-- SELECT v.*
+-- FROM security_log_checkpoints k,
+--      LATERAL verify_security_log_chain(k.agencia_id, k.seq_to + 1) v
+-- WHERE k.agencia_id = '550e8400-e29b-41d4-a716-446655440000'
+-- ORDER BY k.seq_to DESC LIMIT 1;
+
+-- Todos los checkpoints de un tenant
+-- SELECT seq_from, seq_to, verify_security_log_checkpoint(agencia_id, seq_from)
+-- FROM security_log_checkpoints
+-- WHERE agencia_id = '550e8400-e29b-41d4-a716-446655440000';
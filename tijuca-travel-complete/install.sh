@@ -94,6 +94,10 @@ if [ ! -f ".env" ]; then
     # Reemplazar en .env (macOS)
     sed -i '' "s|JWT_SECRET_KEY=CAMBIAR_ESTO_EN_PRODUCCION_USAR_32_CARACTERES_MINIMO|JWT_SECRET_KEY=${JWT_SECRET}|g" .env
 
+    # Secret del lookup de API keys (distinto del de JWT)
+    API_KEY_SECRET=$(openssl rand -base64 32)
+    sed -i '' "s|API_KEY_LOOKUP_SECRET=CAMBIAR_ESTO_EN_PRODUCCION_USAR_32_CARACTERES_MINIMO|API_KEY_LOOKUP_SECRET=${API_KEY_SECRET}|g" .env
+
     echo -e "${GREEN}✅ Archivo .env creado${NC}"
     echo -e "${YELLOW}⚠️  IMPORTANTE: Edita .env y configura:${NC}"
     echo "   - DATABASE_URL (password de PostgreSQL)"
@@ -131,6 +135,12 @@ fi
 echo "   Ejecutando scripts SQL..."
 psql -d tijuca_travel_db -f database/01_database_rls.sql > /dev/null 2>&1
 psql -d tijuca_travel_db -f database/03_audit_log_table.sql > /dev/null 2>&1
+psql -d tijuca_travel_db -f database/04_api_key_lookup.sql > /dev/null 2>&1
+psql -d tijuca_travel_db -f database/05_productos_search.sql > /dev/null 2>&1
+psql -d tijuca_travel_db -f database/06_security_logs_batch.sql > /dev/null 2>&1
+psql -d tijuca_travel_db -f database/07_ventas_audit_statement.sql > /dev/null 2>&1
+psql -d tijuca_travel_db -f database/08_security_logs_partitioned.sql > /dev/null 2>&1
+psql -d tijuca_travel_db -f database/09_security_logs_hash_chain.sql > /dev/null 2>&1
 
 echo -e "${GREEN}✅ Tablas creadas (RLS habilitado)${NC}"
 
@@ -15,27 +15,49 @@ Ejecutar con:
 """
 
 import os
+import json
+from functools import partial
 from fastapi import FastAPI, Depends, Request, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 import redis.asyncio as redis
-from datetime import datetime
-import bcrypt
+from datetime import date, datetime
 
 # Configuración
 from config import settings
 
 # Database
-from app.core.database import get_db, set_tenant_context
+from app.core.database import (
+    get_db,
+    set_tenant_context,
+    tenant_session,
+    pool_wait_stats,
+    async_session_maker,
+    RequestSessionMiddleware,
+)
+from app.core.worker_pool import bcrypt_pool, WorkerPoolSaturated
+from app.services.response_cache import response_cache
+from app.services.catalog_index import catalog_index
+from app.services.audit_writer import audit_writer
+from app.services.llm_client import (
+    init_anthropic_client,
+    get_anthropic_client,
+    close_anthropic_client,
+    llm_guard,
+)
 
 # Middleware de seguridad
 from app.middleware.security import (
     TenantIsolationMiddleware,
     InputSanitizationMiddleware,
+    SecurityConfig,
     JWTHandler,
+    APIKeyHandler,
     get_current_tenant,
+    get_rate_limiter,
+    PlanRateLimit,
     TenantContext,
     rate_limit
 )
@@ -80,20 +102,9 @@ app.add_middleware(
 app.add_middleware(TenantIsolationMiddleware)
 app.add_middleware(InputSanitizationMiddleware)
 
-
-# =====================================================================
-# MIDDLEWARE PARA DB SESSION
-# =====================================================================
-
-@app.middleware("http")
-async def db_session_middleware(request: Request, call_next):
-    """Inyecta la sesión de DB en request.state"""
-    from app.core.database import async_session_maker
-
-    async with async_session_maker() as session:
-        request.state.db = session
-        response = await call_next(request)
-    return response
+# Sesión de DB por request (el más externo): lazy, una sola por request,
+# compartida por TenantIsolationMiddleware y Depends(get_db)
+app.add_middleware(RequestSessionMiddleware)
 
 
 # =====================================================================
@@ -167,7 +178,16 @@ async def health_check():
             "jwt_auth": True,
             "rate_limiting": True,
             "ai_guardrails": bool(settings.ANTHROPIC_API_KEY)
-        }
+        },
+        "workers": {
+            "bcrypt": bcrypt_pool.stats()
+        },
+        "rate_limiter": get_rate_limiter(redis_client).stats(),
+        "hunterbot_cache": response_cache.stats(),
+        "catalog_index": catalog_index.stats(),
+        "llm": llm_guard.stats(),
+        "db_pool": pool_wait_stats.stats(),
+        "audit": audit_writer.stats()
     }
 
 
@@ -178,6 +198,7 @@ async def health_check():
 @app.post("/api/auth/login", response_model=LoginResponse)
 async def login(
     request: LoginRequest,
+    http_request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -185,51 +206,140 @@ async def login(
 
     Retorna JWT token para autenticación en endpoints protegidos
     """
-    # Buscar agencia por API key
+    # Buscar agencia por digest indexado (una sola fila, sin escanear tenants)
+    api_key_lookup = APIKeyHandler.lookup_digest(request.api_key)
     result = await db.execute(
         text("""
             SELECT id, nombre, plan, api_key_hash
             FROM agencias
-            WHERE activa = true
-        """)
+            WHERE api_key_lookup = :api_key_lookup
+              AND activa = true
+        """),
+        {"api_key_lookup": api_key_lookup}
+    )
+    agencia = result.fetchone()
+
+    try:
+        if agencia:
+            # Verificar API key (a lo sumo UN bcrypt por login, fuera del event loop)
+            if not await bcrypt_pool.run(APIKeyHandler.verify_api_key, request.api_key, agencia[3]):
+                agencia = None
+        elif await _legacy_fallback_allowed(request.api_key, http_request.client.host):
+            # Migración: agencias con api_key_hash previo y sin api_key_lookup
+            agencia = await _login_legacy_api_key(db, request.api_key, api_key_lookup)
+    except WorkerPoolSaturated:
+        # Backpressure: fallar rápido en vez de encolar logins sin límite
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio de autenticación saturado. Intenta nuevamente en unos segundos.",
+            headers={"Retry-After": "1"}
+        )
+
+    if not agencia:
+        # API key inválido
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="API key inválido"
+        )
+
+    agencia_id, nombre, plan, _ = agencia
+
+    # Generar JWT
+    token = JWTHandler.create_access_token(
+        tenant_id=str(agencia_id),
+        tenant_name=nombre,
+        plan=plan,
+        permissions=["read", "write", "delete"]
+    )
+
+    return LoginResponse(
+        access_token=token,
+        token_type="bearer",
+        tenant_id=str(agencia_id),
+        tenant_name=nombre,
+        plan=plan
     )
-    agencias = result.fetchall()
-
-    # Verificar API key
-    for agencia in agencias:
-        agencia_id, nombre, plan, api_key_hash = agencia
-
-        # Comparar hash
-        if bcrypt.checkpw(request.api_key.encode(), api_key_hash.encode()):
-            # Generar JWT
-            token = JWTHandler.create_access_token(
-                tenant_id=str(agencia_id),
-                tenant_name=nombre,
-                plan=plan,
-                permissions=["read", "write", "delete"]
-            )
-
-            return LoginResponse(
-                access_token=token,
-                token_type="bearer",
-                tenant_id=str(agencia_id),
-                tenant_name=nombre,
-                plan=plan
-            )
-
-    # API key inválido
-    raise HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="API key inválido"
+
+
+# Intentos de fallback por IP: cada uno es un bcrypt por agencia pendiente
+_LEGACY_LOGIN_LIMITS = PlanRateLimit(
+    requests=settings.API_KEY_LEGACY_FALLBACK_PER_MINUTE,
+    window=60,
+    burst=0,
+    max_concurrent=1
+)
+
+
+async def _legacy_fallback_allowed(api_key: str, client_ip: str) -> bool:
+    """
+    ¿Puede esta key recorrer las agencias sin api_key_lookup?
+
+    Solo si el fallback está habilitado y vigente, la key no tiene el
+    prefijo actual (esas siempre tienen lookup) y la IP no agotó sus
+    intentos. Si la IP los agotó: 429.
+    """
+    if not settings.API_KEY_LEGACY_FALLBACK or not APIKeyHandler.is_legacy_key(api_key):
+        return False
+
+    until = settings.API_KEY_LEGACY_FALLBACK_UNTIL
+    if until is not None and date.today() > until:
+        return False
+
+    allowed = await get_rate_limiter(redis_client).check_rate_limit(
+        f"legacy_login:{client_ip}", _LEGACY_LOGIN_LIMITS
+    )
+    if not allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiados intentos de login. Intenta nuevamente en unos minutos."
+        )
+    return True
+
+
+async def _login_legacy_api_key(db: AsyncSession, api_key: str, api_key_lookup: str):
+    """
+    Fallback para API keys creadas antes de api_key_lookup
+
+    Solo recorre agencias todavía NO migradas (conjunto que se vacía con cada
+    login exitoso) y completa su api_key_lookup para que el próximo login
+    use el índice. Ver database/04_api_key_lookup.sql
+    """
+    result = await db.execute(
+        text("""
+            SELECT id, nombre, plan, api_key_hash
+            FROM agencias
+            WHERE api_key_lookup IS NULL
+              AND activa = true
+        """)
     )
 
+    pendientes = result.fetchall()
+
+    # Un solo job en el pool para todo el recorrido (no acapara la cola)
+    def find_match():
+        for agencia in pendientes:
+            if APIKeyHandler.verify_api_key(api_key, agencia[3]):
+                return agencia
+        return None
+
+    agencia = await bcrypt_pool.run(find_match)
+
+    if agencia:
+        await db.execute(
+            text("SELECT backfill_api_key_lookup(:agencia_id, :api_key_lookup)"),
+            {"agencia_id": str(agencia[0]), "api_key_lookup": api_key_lookup}
+        )
+        await db.commit()
+
+    return agencia
+
 
 # =====================================================================
 # ENDPOINTS - VENTAS (PROTEGIDOS CON JWT + RLS)
 # =====================================================================
 
 @app.get("/api/ventas", response_model=list[VentaResponse])
-@rate_limit(redis_client)
+@rate_limit(redis_client, cost=SecurityConfig.RATE_LIMIT_ENDPOINT_COSTS["read"])
 async def get_ventas(
     request: Request,
     skip: int = 0,
@@ -273,7 +383,7 @@ async def get_ventas(
 
 
 @app.post("/api/ventas", response_model=VentaResponse, status_code=status.HTTP_201_CREATED)
-@rate_limit(redis_client)
+@rate_limit(redis_client, cost=SecurityConfig.RATE_LIMIT_ENDPOINT_COSTS["write"])
 async def create_venta(
     request: Request,
     venta_data: CreateVentaRequest,
@@ -342,7 +452,7 @@ async def create_venta(
 
 
 @app.get("/api/ventas/{venta_id}", response_model=VentaResponse)
-@rate_limit(redis_client)
+@rate_limit(redis_client, cost=SecurityConfig.RATE_LIMIT_ENDPOINT_COSTS["read"])
 async def get_venta(
     request: Request,
     venta_id: UUID4,
@@ -396,11 +506,10 @@ class HunterBotMessage(BaseModel):
 
 
 @app.post("/api/hunterbot/chat")
-@rate_limit(redis_client)
+@rate_limit(redis_client, cost=SecurityConfig.RATE_LIMIT_ENDPOINT_COSTS["hunterbot"])
 async def hunterbot_chat(
     request: Request,
     message: HunterBotMessage,
-    db: AsyncSession = Depends(get_db),
     tenant: TenantContext = Depends(get_current_tenant)
 ):
     """
@@ -417,15 +526,13 @@ async def hunterbot_chat(
             detail="HunterBot no está configurado (falta ANTHROPIC_API_KEY)"
         )
 
-    from anthropic import Anthropic
     from app.services.ai_guardrails import SecureHunterBot
 
-    # Setear contexto de tenant
-    await set_tenant_context(db, str(tenant.tenant_id))
-
-    # Inicializar HunterBot seguro
-    anthropic_client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-    bot = SecureHunterBot(db, anthropic_client, str(tenant.tenant_id))
+    # Sin Depends(get_db): el bot abre sesiones cortas (con RLS) solo para
+    # leer precios y auditar, y no retiene una conexión del pool mientras
+    # espera a Claude
+    tenant_id = str(tenant.tenant_id)
+    bot = SecureHunterBot(partial(tenant_session, tenant_id), get_anthropic_client(), tenant_id)
 
     # Procesar mensaje con todas las capas de seguridad
     result = await bot.process_message(message.message)
@@ -433,6 +540,52 @@ async def hunterbot_chat(
     return result
 
 
+@app.post("/api/hunterbot/chat/stream")
+@rate_limit(redis_client, cost=SecurityConfig.RATE_LIMIT_ENDPOINT_COSTS["hunterbot"])
+async def hunterbot_chat_stream(
+    request: Request,
+    message: HunterBotMessage,
+    tenant: TenantContext = Depends(get_current_tenant)
+):
+    """
+    Chat con HunterBot en streaming (Server-Sent Events)
+
+    Eventos:
+    - token: fragmento de respuesta ya validado ({"text": ...})
+    - done: fin de la respuesta (metadata igual a /api/hunterbot/chat)
+    - error: mensaje bloqueado o respuesta cortada (discard=True: descartar
+      los tokens recibidos)
+    """
+    if not settings.ANTHROPIC_API_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="HunterBot no está configurado (falta ANTHROPIC_API_KEY)"
+        )
+
+    from app.services.ai_guardrails import SecureHunterBot
+
+    tenant_id = str(tenant.tenant_id)
+
+    async def event_stream():
+        # Sesiones cortas abiertas por el bot DENTRO del generador (FastAPI
+        # cierra las dependencias con yield antes de enviar el body); ninguna
+        # queda abierta mientras se transmiten los tokens
+        bot = SecureHunterBot(partial(tenant_session, tenant_id), get_anthropic_client(), tenant_id)
+
+        async for event in bot.stream_message(message.message):
+            data = json.dumps(event["data"], ensure_ascii=False)
+            yield f"event: {event['event']}\ndata: {data}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Sin buffering en nginx
+        }
+    )
+
+
 # =====================================================================
 # EXCEPTION HANDLERS
 # =====================================================================
@@ -445,7 +598,8 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         content={
             "detail": exc.detail,
             "timestamp": datetime.utcnow().isoformat()
-        }
+        },
+        headers=exc.headers  # Ej: Retry-After en 503/429
     )
 
 
@@ -485,13 +639,21 @@ async def startup_event():
     print(f"   RLS: ✅ Habilitado")
     print(f"   Rate Limiting: ✅ Habilitado")
     print(f"   AI Guardrails: {'✅' if settings.ANTHROPIC_API_KEY else '⚠️'} {'Habilitado' if settings.ANTHROPIC_API_KEY else 'Deshabilitado'}")
+    init_anthropic_client()
+    audit_writer.start(async_session_maker)
     print("🛡️ Sistema de seguridad activo\n")
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Tareas al cerrar la aplicación"""
+    await audit_writer.stop()  # Antes que nada: escribe los eventos pendientes
     await redis_client.close()
+    bcrypt_pool.shutdown()
+    await close_anthropic_client()
+
+    from app.services.ai_guardrails import shutdown_batch_executor
+    shutdown_batch_executor()
     print("\n👋 Tijuca Travel API detenido")
 
 
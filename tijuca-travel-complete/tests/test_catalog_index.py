@@ -0,0 +1,63 @@
+"""
+Tests de búsqueda del índice de catálogo en memoria
+
+Las filas que devuelve el índice van al prompt como datos financieros
+verificados: una pregunta por un destino que no está en el catálogo no
+debe devolver el precio de otro producto.
+"""
+import pytest
+
+from app.services.catalog_index import _build_catalog
+
+
+TENANT_PRODUCTS = [
+    # (id, descripcion, destino, precio_base, moneda, impuesto_pais,
+    #  percepcion_ganancias, precio_total, disponible)
+    ("p-bariloche", "Paquete a Bariloche 7 noches", "San Carlos de Bariloche", 850000, "ARS", 0, 0, 850000, True),
+    ("p-caribe", "Crucero por el Caribe", "Caribe", 2500, "USD", 0, 0, 2500, True),
+    ("p-miami", "Vuelo + Hotel Miami 5 noches", "Miami", 1200, "USD", 0, 0, 1200, True),
+]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return _build_catalog(TENANT_PRODUCTS)
+
+
+def _ids(rows):
+    return [row[0] for row in rows]
+
+
+@pytest.mark.parametrize("message", [
+    "¿Cuánto sale un paquete a Tokio?",
+    "precio de un crucero a Alaska",
+    "hola quiero ir a Japón 7 noches",
+    "¿Tienen hotel en Roma?",
+    "hola, ¿cuál es el presupuesto?",
+])
+def test_unknown_destination_returns_nothing(catalog, message):
+    assert catalog.search(message, limit=1) == []
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("¿Cuánto cuesta ir a Bariloche?", "p-bariloche"),       # gazetteer
+    ("precio del crucero por el caribe", "p-caribe"),        # gazetteer
+    ("cuanto sale un crucero", "p-caribe"),                  # texto (todas las palabras)
+    ("vuelo con hotel 5 noches", "p-miami"),                 # texto (todas las palabras)
+    ("cuanto sale bariloce", "p-bariloche"),                 # parecido (typo)
+])
+def test_known_products_still_match(catalog, message, expected):
+    assert _ids(catalog.search(message, limit=1)) == [expected]
+
+
+def test_partial_description_match_is_not_a_hit(catalog):
+    # "paquete" y "7" están en el producto de Bariloche, "japon" no
+    assert catalog.search("paquete 7 japon", limit=1) == []
+    assert _ids(catalog.search("paquete 7", limit=1)) == ["p-bariloche"]
+
+
+def test_build_catalog_compiles_gazetteer():
+    # Compilado en _build_catalog (thread): find() no arma nada en el loop
+    gazetteer = _build_catalog(TENANT_PRODUCTS).gazetteer
+    with pytest.raises(RuntimeError):
+        gazetteer.add("tokio", ("destino", "tokio"))
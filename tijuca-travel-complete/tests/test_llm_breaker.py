@@ -0,0 +1,265 @@
+"""
+Tests de límites de concurrencia, timeout y circuit breaker de HunterBot
+
+Cada test levanta el stub local de Anthropic (benchmarks/stub_llm_server.py)
+en el mismo event loop y llama a SecureHunterBot.process_message con un
+LLMCallGuard propio (límites chicos para que el escenario dure < 1 s).
+"""
+import asyncio
+import itertools
+import socket
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+import pytest_asyncio
+import uvicorn
+from anthropic import AsyncAnthropic
+
+from app.services import ai_guardrails
+from app.services.ai_guardrails import SecureHunterBot
+from app.services.llm_client import CircuitBreaker, LLMCallGuard
+from benchmarks import stub_llm_server as stub
+from config import settings
+
+
+# Sin intención financiera: no pasa por la DB ni por el índice de catálogo
+MESSAGE = "Hola, ¿qué me recomendás para unas vacaciones tranquilas?"
+
+# Un mensaje distinto por llamada: ninguna sale de la cache de respuestas
+_message_ids = itertools.count()
+
+# "Al instante": sin esperar al upstream ni a la cola
+INSTANT_MS = 50
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def no_db():
+    yield None
+
+
+@pytest_asyncio.fixture
+async def stub_server(monkeypatch):
+    """Stub de Anthropic en un puerto libre; devuelve su base_url"""
+    monkeypatch.setattr(stub, "MODE", {**stub.MODE, "delay": 0.0, "status": 200, "token_interval": 0.0})
+    monkeypatch.setattr(stub, "STATS", {"requests": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0})
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(stub.app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    await task
+
+
+@pytest_asyncio.fixture
+async def anthropic_client(stub_server):
+    client = AsyncAnthropic(
+        api_key="stub",
+        base_url=stub_server,
+        max_retries=0,
+        http_client=httpx.AsyncClient(timeout=10.0)
+    )
+    yield client
+    await client.close()
+
+
+def make_guard(
+    monkeypatch,
+    max_concurrent: int = 8,
+    max_concurrent_per_tenant: int = 4,
+    queue_timeout: float = 1.0,
+    failure_threshold: int = 3,
+    reset_seconds: float = 60.0
+) -> LLMCallGuard:
+    guard = LLMCallGuard(
+        max_concurrent=max_concurrent,
+        max_concurrent_per_tenant=max_concurrent_per_tenant,
+        queue_timeout=queue_timeout,
+        breaker=CircuitBreaker(failure_threshold=failure_threshold, reset_seconds=reset_seconds)
+    )
+    monkeypatch.setattr(ai_guardrails, "llm_guard", guard)
+    return guard
+
+
+async def ask(client: AsyncAnthropic, tenant_id: str = "tenant-a"):
+    """(ms, resultado): "ok" o el motivo del fallback"""
+    bot = SecureHunterBot(session_factory=no_db, anthropic_client=client, tenant_id=tenant_id)
+    start = time.perf_counter()
+    result = await bot.process_message(f"{MESSAGE} (consulta {next(_message_ids)})")
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    assert result["success"], result
+    return elapsed_ms, result["metadata"].get("fallback") or "ok"
+
+
+# =====================================================================
+# CIRCUIT BREAKER
+# =====================================================================
+
+@pytest.mark.asyncio
+async def test_breaker_opens_after_consecutive_failures(monkeypatch, anthropic_client):
+    guard = make_guard(monkeypatch, failure_threshold=3)
+    stub.MODE["status"] = 500
+
+    for attempt in range(3):
+        assert guard.breaker.state == CircuitBreaker.CLOSED
+        _, outcome = await ask(anthropic_client)
+        assert outcome == "upstream_error"
+
+    assert guard.breaker.state == CircuitBreaker.OPEN
+    assert guard.breaker.times_opened == 1
+    assert stub.STATS["requests"] == 3
+
+
+@pytest.mark.asyncio
+async def test_success_resets_consecutive_failures(monkeypatch, anthropic_client):
+    guard = make_guard(monkeypatch, failure_threshold=3)
+
+    for status in (500, 500, 200, 500, 500):
+        stub.MODE["status"] = status
+        await ask(anthropic_client)
+
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+    assert guard.breaker.consecutive_failures == 2
+
+
+@pytest.mark.asyncio
+async def test_open_breaker_serves_fallback_instantly(monkeypatch, anthropic_client):
+    guard = make_guard(monkeypatch, failure_threshold=2)
+    stub.MODE["status"] = 500
+    for _ in range(2):
+        await ask(anthropic_client)
+    assert guard.breaker.state == CircuitBreaker.OPEN
+
+    # Upstream colgado: si el breaker lo dejara pasar, la llamada tardaría 5 s
+    stub.MODE.update({"status": 200, "delay": 5.0})
+    requests_before = stub.STATS["requests"]
+
+    bot = SecureHunterBot(session_factory=no_db, anthropic_client=anthropic_client, tenant_id="tenant-a")
+    start = time.perf_counter()
+    result = await bot.process_message(MESSAGE)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    assert result["response"] == SecureHunterBot.FALLBACK_RESPONSE
+    assert result["metadata"]["fallback"] == "circuit_open"
+    assert elapsed_ms < INSTANT_MS
+    assert stub.STATS["requests"] == requests_before
+    assert guard.fallbacks == {"circuit_open": 1}
+
+
+@pytest.mark.asyncio
+async def test_half_open_allows_one_trial_and_recovers(monkeypatch, anthropic_client):
+    guard = make_guard(monkeypatch, failure_threshold=1, reset_seconds=0.2)
+    stub.MODE["status"] = 500
+    await ask(anthropic_client)
+    assert guard.breaker.state == CircuitBreaker.OPEN
+
+    await asyncio.sleep(0.25)
+    stub.MODE.update({"status": 200, "delay": 0.3})
+    requests_before = stub.STATS["requests"]
+
+    # Tres llamadas a la vez: solo una llega al upstream, el resto fallback
+    results = await asyncio.gather(*(ask(anthropic_client) for _ in range(3)))
+    outcomes = sorted(outcome for _, outcome in results)
+
+    assert outcomes == ["circuit_open", "circuit_open", "ok"]
+    assert stub.STATS["requests"] - requests_before == 1
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+    # Cerrado de nuevo: las llamadas siguientes pasan sin restricción
+    stub.MODE["delay"] = 0.0
+    results = await asyncio.gather(*(ask(anthropic_client) for _ in range(3)))
+    assert [outcome for _, outcome in results] == ["ok", "ok", "ok"]
+
+
+@pytest.mark.asyncio
+async def test_failed_trial_reopens_breaker(monkeypatch, anthropic_client):
+    guard = make_guard(monkeypatch, failure_threshold=1, reset_seconds=0.2)
+    stub.MODE["status"] = 500
+    await ask(anthropic_client)
+
+    await asyncio.sleep(0.25)
+    _, outcome = await ask(anthropic_client)
+
+    assert outcome == "upstream_error"
+    assert guard.breaker.state == CircuitBreaker.OPEN
+    assert guard.breaker.times_opened == 2
+    _, outcome = await ask(anthropic_client)
+    assert outcome == "circuit_open"
+
+
+# =====================================================================
+# LÍMITES DE CONCURRENCIA
+# =====================================================================
+
+@pytest.mark.asyncio
+async def test_tenant_semaphore_honors_queue_timeout(monkeypatch, anthropic_client):
+    guard = make_guard(monkeypatch, max_concurrent=8, max_concurrent_per_tenant=1, queue_timeout=0.2)
+    stub.MODE["delay"] = 0.6
+
+    results = await asyncio.gather(ask(anthropic_client, "tenant-a"), ask(anthropic_client, "tenant-a"))
+    by_outcome = {outcome: ms for ms, outcome in results}
+
+    assert set(by_outcome) == {"ok", "tenant_saturated"}
+    # Esperó queue_timeout (no la llamada entera) antes del fallback
+    assert 150 <= by_outcome["tenant_saturated"] < 500
+    assert stub.STATS["max_in_flight"] == 1
+    # El breaker no cuenta la saturación como error del upstream
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+    assert guard.breaker.consecutive_failures == 0
+
+
+@pytest.mark.asyncio
+async def test_global_semaphore_honors_queue_timeout(monkeypatch, anthropic_client):
+    guard = make_guard(monkeypatch, max_concurrent=2, max_concurrent_per_tenant=2, queue_timeout=0.2)
+    stub.MODE["delay"] = 0.6
+
+    # Cada tenant dentro de su cupo, pero 3 > límite por worker
+    results = await asyncio.gather(*(ask(anthropic_client, f"tenant-{i}") for i in range(3)))
+    outcomes = sorted(outcome for _, outcome in results)
+
+    assert outcomes == ["ok", "ok", "saturated"]
+    saturated_ms = next(ms for ms, outcome in results if outcome == "saturated")
+    assert 150 <= saturated_ms < 500
+    assert stub.STATS["max_in_flight"] == 2
+    assert guard.stats()["in_flight"] == 0
+    assert guard.stats()["tenants_active"] == 0
+
+
+@pytest.mark.asyncio
+async def test_queued_call_gets_slot_within_queue_timeout(monkeypatch, anthropic_client):
+    make_guard(monkeypatch, max_concurrent=1, max_concurrent_per_tenant=1, queue_timeout=1.0)
+    stub.MODE["delay"] = 0.2
+
+    results = await asyncio.gather(ask(anthropic_client), ask(anthropic_client))
+
+    assert [outcome for _, outcome in results] == ["ok", "ok"]
+    assert stub.STATS["max_in_flight"] == 1
+
+
+# =====================================================================
+# TIMEOUT POR LLAMADA
+# =====================================================================
+
+@pytest.mark.asyncio
+async def test_call_timeout_fires(monkeypatch, anthropic_client):
+    guard = make_guard(monkeypatch, failure_threshold=3)
+    monkeypatch.setattr(settings, "HUNTERBOT_CALL_TIMEOUT_SECONDS", 0.2)
+    stub.MODE["delay"] = 1.0
+
+    elapsed_ms, outcome = await ask(anthropic_client)
+
+    assert outcome == "upstream_error"
+    assert 150 <= elapsed_ms < 1000
+    # El timeout cuenta como error del upstream y libera el lugar
+    assert guard.breaker.consecutive_failures == 1
+    assert guard.stats()["in_flight"] == 0
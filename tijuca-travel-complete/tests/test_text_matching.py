@@ -0,0 +1,29 @@
+"""
+Tests de normalización y tokenización de mensajes (HunterBot)
+"""
+import pytest
+
+from app.services.ai_guardrails import AIGuardrails
+from app.services.pii import PIIType, redaction_placeholder
+from app.services.text_matching import STOPWORDS, tokenize
+
+
+@pytest.mark.parametrize("pii_type", list(PIIType))
+def test_redaction_placeholders_are_stopwords(pii_type):
+    assert tokenize(redaction_placeholder(pii_type)) == []
+
+
+def test_redacted_message_keeps_only_product_words():
+    guardrails = AIGuardrails(None, None)
+    redacted, pii_found, _ = guardrails.redact_pii(
+        "Mi pasaporte es AAB123456 y mi DNI 30123456, ¿cuánto sale Bariloche?"
+    )
+
+    assert "[PASAPORTE REDACTADO]" in redacted
+    assert set(pii_found) >= {PIIType.PASSPORT, PIIType.DNI}
+    assert tokenize(redacted) == ["bariloche"]
+
+
+def test_placeholder_words_match_pii_type_values():
+    assert {"pasaporte", "telefono", "dni", "cuit", "cbu", "redactado"} <= STOPWORDS
+    assert "passport" not in STOPWORDS